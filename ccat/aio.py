@@ -0,0 +1,138 @@
+#!/usr/bin/python3
+# -*- coding: UTF-8 -*-
+import asyncio
+import sys
+import threading
+import weakref
+from concurrent.futures import Executor, ProcessPoolExecutor
+from functools import partial
+from itertools import islice
+from typing import AsyncIterator, Iterator, Union
+
+from .batch import Batch
+from .ccat import render, render_image
+from .config import Options
+
+
+class AsyncRender(object):
+    '''
+        asyncio front-end of the library API (render, render_image): the lexing and the image
+        rasterization run in an executor, so the event loop only waits for them.
+
+        The executor is the default one of the loop (threads) unless one is given, e.g. a
+        ProcessPoolExecutor, which is not limited by the GIL. At most limit jobs of a renderer
+        are in the executor at a time per event loop, the other calls wait for their turn.
+
+        stream yields the output by chunks of lines. Each chunk is rendered only when the
+        previous one was taken (plus one chunk rendered ahead), so a slow consumer (e.g.
+        awaiting the writes to its client) slows the rendering down instead of buffering the
+        output. When the consumer is cancelled (or stops iterating) the rendering stops after
+        the chunk in progress.
+    '''
+
+    # output lines by chunk of stream
+    LINES = 256
+
+    # renderer of the module level functions
+    shared = None
+
+    def __init__(self, executor: Executor = None, limit: int = 0, lines: int = LINES):
+        if lines < 1:
+            raise ValueError('invalid number of lines %s, it must be greater than zero' % lines)
+
+        self.executor = executor
+        # 0 means the available cores
+        self.limit = limit if limit > 0 else Batch.workers(0, sys.maxsize)
+        self.lines = lines
+        self._semaphores = weakref.WeakKeyDictionary()
+
+    def semaphore(self, loop: asyncio.AbstractEventLoop) -> asyncio.Semaphore:
+        ''' The limiter of the event loop (asyncio primitives belong to one loop) '''
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.limit)
+        return semaphore
+
+    async def run(self, function, *args, **kwargs):
+        ''' Runs function in the executor, once a slot of the limiter is free '''
+        loop = asyncio.get_running_loop()
+        async with self.semaphore(loop):
+            return await loop.run_in_executor(self.executor, partial(function, *args, **kwargs))
+
+    async def render(self, data: Union[bytes, bytearray, str], *, options: Options = None,
+                     title: str = '') -> str:
+        return await self.run(render, data, options=options, title=title)
+
+    async def render_image(self, data: Union[bytes, bytearray, str], *, options: Options = None,
+                           title: str = '', format: str = 'png') -> bytes:
+        return await self.run(render_image, data, options=options, title=title, format=format)
+
+    async def stream(self, data: Union[bytes, bytearray, str], *, options: Options = None,
+                     title: str = '') -> AsyncIterator[str]:
+        ''' Yields the output (a line break after each line) by chunks of self.lines lines '''
+        if isinstance(self.executor, ProcessPoolExecutor):
+            # the lines iterator can not be shared with a worker process: the document is
+            # rendered there at once, only its output is chunked
+            text = await self.render(data, options=options, title=title)
+            lines = text.split('\n')[:-1]
+            for i in range(0, len(lines), self.lines):
+                yield ''.join('%s\n' % l for l in lines[i:i + self.lines])
+            return
+
+        iterator = render(data, options=options, title=title, stream=True)
+        stop = threading.Event()
+        pending = asyncio.ensure_future(self.run(AsyncRender._chunk, iterator, self.lines, stop))
+        try:
+            while True:
+                # shielded: the iterator is never left running in the executor by a cancelled consumer
+                chunk = await asyncio.shield(pending)
+                if chunk == '':
+                    return
+                pending = asyncio.ensure_future(self.run(AsyncRender._chunk, iterator, self.lines, stop))
+                yield chunk
+        finally:
+            # the chunk in progress can not be interrupted, the iterator is closed after it
+            stop.set()
+            pending.add_done_callback(lambda f: AsyncRender._close(f, iterator))
+
+    @staticmethod
+    def _chunk(iterator: Iterator[str], lines: int, stop: threading.Event) -> str:
+        ''' The next lines of the output ('' at its end or once the stream is stopped) '''
+        if stop.is_set():
+            return ''
+        return ''.join('%s\n' % l for l in islice(iterator, lines))
+
+    @staticmethod
+    def _close(future: asyncio.Future, iterator: Iterator[str]):
+        if not future.cancelled():
+            # errors of the chunk rendered ahead are not raised
+            future.exception()
+        try:
+            iterator.close()
+        except ValueError:
+            # the loop was closed while the chunk was rendered: released when it ends
+            pass
+
+
+def _shared() -> AsyncRender:
+    if AsyncRender.shared is None:
+        AsyncRender.shared = AsyncRender()
+    return AsyncRender.shared
+
+
+async def render_async(data: Union[bytes, bytearray, str], *, options: Options = None, title: str = '') -> str:
+    ''' render (see ccat.ccat.render) in the executor of AsyncRender.shared '''
+    return await _shared().render(data, options=options, title=title)
+
+
+async def render_image_async(data: Union[bytes, bytearray, str], *, options: Options = None, title: str = '',
+                             format: str = 'png') -> bytes:
+    ''' render_image (see ccat.ccat.render_image) in the executor of AsyncRender.shared '''
+    return await _shared().render_image(data, options=options, title=title, format=format)
+
+
+async def render_stream(data: Union[bytes, bytearray, str], *, options: Options = None,
+                        title: str = '') -> AsyncIterator[str]:
+    ''' The output of render by chunks of lines (see AsyncRender.stream) '''
+    async for chunk in _shared().stream(data, options=options, title=title):
+        yield chunk
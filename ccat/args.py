@@ -32,9 +32,10 @@ class Arguments(object):
 
         parser.add_argument('filename',
                             action='store',
+                            nargs='*',
                             metavar='[filename]',
                             type=str,
-                            help=Color.s('Filename'))
+                            help=Color.s('Filenames, directories (recursive) or glob patterns ({G}-{W} or none: standard input)'))
 
         flags = parser.add_argument_group('Options')
         self._add_flags_args(flags)
@@ -54,6 +55,18 @@ class Arguments(object):
                            dest='no_tab',
                            help=Color.s('do not show tab'))
 
+        flags.add_argument('--jsonl',
+                           action='store_true',
+                           default=False,
+                           dest='jsonl',
+                           help=Color.s('JSON Lines: pretty print each line as a record (default: {G}.jsonl{W}/{G}.ndjson{W} files and detected content)'))
+
+        flags.add_argument('-f', '--follow',
+                           action='store_true',
+                           default=False,
+                           dest='follow',
+                           help=Color.s('output the last lines and then the appended lines as the file grows'))
+
         flags.add_argument('--style',
                            action='store',
                            metavar='[style name]',
@@ -62,6 +75,13 @@ class Arguments(object):
                            dest='style',
                            help=Color.s('pygments lib style name. (default: {G}gruvbox-dark{W}). See more at: https://pygments.org/styles/'))
 
+        flags.add_argument('--lexer',
+                           action='store',
+                           metavar='[name]',
+                           type=str,
+                           dest='lexer',
+                           help=Color.s('pygments lexer name, instead of guessing it (ex: {G}python{W}, {G}json{W}, {G}yaml{W})'))
+
         flags.add_argument('-l', '--lines',
                            action='store',
                            metavar='[filter]',
@@ -78,6 +98,71 @@ class Arguments(object):
                            dest='highlight_line_filter',
                            help=Color.s('highlight only selected lines ({W}{D}ex1:{W}{G} 5:13 {W}{D}or ex2: {W}{G}50: {W}{D}or ex3: {W}{G}:100{W})'))
 
+        flags.add_argument('--head',
+                           action='store',
+                           metavar='[N]',
+                           type=int,
+                           dest='head',
+                           help=Color.s('output only the first N lines'))
+
+        flags.add_argument('--tail',
+                           action='store',
+                           metavar='[N]',
+                           type=int,
+                           dest='tail',
+                           help=Color.s('output only the last N lines, read from the end of the file (with {G}-f{W}: lines output before following, default: {G}10{W})'))
+
+        flags.add_argument('-j', '--jobs',
+                           action='store',
+                           metavar='[N]',
+                           type=int,
+                           default=0,
+                           dest='jobs',
+                           help=Color.s('number of processes used to render multiple files, JSON Lines records or image pages (default: {G}0{W} = available cores)'))
+
+        flags.add_argument('--window',
+                           action='store',
+                           metavar='[lines]',
+                           type=int,
+                           default=5000,
+                           dest='window',
+                           help=Color.s('number of lines highlighted and kept in memory at a time (default: {G}5000{W})'))
+
+        flags.add_argument('--context',
+                           action='store',
+                           metavar='[lines]',
+                           type=int,
+                           default=100,
+                           dest='context',
+                           help=Color.s('lines lexed before each selected range so the highlight state can resync (default: {G}100{W})'))
+
+        flags.add_argument('--guess-size',
+                           action='store',
+                           metavar='[chars]',
+                           type=int,
+                           default=16384,
+                           dest='guess_size',
+                           help=Color.s('characters sampled to guess the lexer of files without a known extension (default: {G}16384{W})'))
+
+        flags.add_argument('--no-index',
+                           action='store_false',
+                           default=True,
+                           dest='index',
+                           help=Color.s('do not keep a line offset index of big files in the cache directory'))
+
+        flags.add_argument('--cache',
+                           action='store_true',
+                           default=False,
+                           dest='cache',
+                           help=Color.s('keep the rendered output of files in the cache directory'))
+
+        flags.add_argument('--cache-dir',
+                           action='store',
+                           metavar='[path]',
+                           type=str,
+                           dest='cache_dir',
+                           help=Color.s('cache directory (default: {G}~/.cache/ccat{W})'))
+
         flags.add_argument('--output-img',
                            action='store',
                            metavar='[filename]',
@@ -85,6 +170,25 @@ class Arguments(object):
                            dest='out_file',
                            help=Color.s('image output file.'))
 
+        flags.add_argument('--lines-per-image',
+                           action='store',
+                           metavar='[N]',
+                           type=int,
+                           dest='lines_per_image',
+                           help=Color.s('split the image output in images of N lines ({G}out.png{W}: {G}out-0001.png{W}, {G}out-0002.png{W}, ...)'))
+
+        flags.add_argument('-q', '--quiet',
+                           action='store_true',
+                           default=False,
+                           dest='quiet',
+                           help=Color.s('only write the image output, not the text'))
+
+        flags.add_argument('--daemon',
+                           action='store_true',
+                           default=False,
+                           dest='daemon',
+                           help=Color.s('keep a warm render process running, the next {G}ccat{W} commands are rendered by it'))
+
         flags.add_argument('-h', '--help',
                            action='help',
                            help=Color.s('show help message and exit'))
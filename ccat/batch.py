@@ -0,0 +1,111 @@
+#!/usr/bin/python3
+# -*- coding: UTF-8 -*-
+import os
+import shutil
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from typing import Union
+
+from .config import Configuration
+from .util.color import Color
+
+
+class Batch(object):
+    '''
+        Multi-file mode: files are rendered in a process pool and the
+        output is written in argument order, so it stays deterministic.
+    '''
+
+    @staticmethod
+    def workers(jobs: int, files: int) -> int:
+        ''' Number of worker processes (jobs == 0 means the available cores) '''
+        if jobs <= 0:
+            try:
+                jobs = len(os.sched_getaffinity(0))
+            except AttributeError:
+                jobs = os.cpu_count() or 1
+        return max(min(jobs, files), 1)
+
+    @staticmethod
+    def render(filename: str, config: Union[dict, None] = None, spool: str = None) -> Union[str, None]:
+        '''
+            Renders one file (title header included). In a worker the output is written to
+            a temporary file of the spool directory, whose name is returned; otherwise it is
+            written to the standard output as it is rendered.
+            Errors are part of the output, so a bad file never stops the batch.
+        '''
+        from .ccat import ColorCat
+
+        if config is not None:
+            Configuration.restore(config)
+
+        out = name = None
+        stdout = sys.stdout
+        if spool is not None:
+            fd, name = tempfile.mkstemp(dir=spool, suffix='.out')
+            out = sys.stdout = open(fd, 'w', encoding='UTF-8', newline='')
+        try:
+            error = Configuration.check_file(filename)
+            if error is not None:
+                Color.pl(error)
+            else:
+                Configuration.filename = filename
+                ColorCat().run()
+        except SystemExit:
+            # e.g. empty files, the message was already written
+            pass
+        except Exception as e:
+            Color.pl('\n{!} {R}Error: {O}%s{W}\n' % str(e))
+        finally:
+            sys.stdout = stdout
+            if out is not None:
+                out.close()
+
+        return name
+
+    @staticmethod
+    def copy(name: str):
+        ''' Writes a rendered file of the spool directory and removes it '''
+        try:
+            with open(name, 'r', encoding='UTF-8', newline='') as f:
+                shutil.copyfileobj(f, sys.stdout, Configuration.chunk_size)
+        finally:
+            os.unlink(name)
+
+    @staticmethod
+    def run(filenames: list):
+        '''
+            Writes the files in argument order. Workers render into spool files (so nothing
+            is held in memory), copied as soon as the previous files are written.
+        '''
+        # the standard input can only be read by this process
+        workers = Batch.workers(Configuration.jobs, len(filenames)) if Configuration.STDIN not in filenames else 1
+        if workers == 1:
+            try:
+                for f in filenames:
+                    Batch.render(f)
+                    sys.stdout.flush()
+            except BrokenPipeError:
+                pass
+            return
+
+        spool = tempfile.mkdtemp(prefix='ccat-')
+        executor = ProcessPoolExecutor(max_workers=workers)
+        try:
+            # the files are already rendered in parallel, each one uses a single process
+            results = executor.map(Batch.render, filenames, repeat(dict(Configuration.snapshot(), jobs=1)),
+                                   repeat(spool))
+            for name in results:
+                Batch.copy(name)
+                sys.stdout.flush()
+        except BrokenPipeError:
+            pass
+        finally:
+            # the renders still running are waited for, so none writes to the removed spool
+            if sys.version_info >= (3, 9):
+                executor.shutdown(wait=True, cancel_futures=True)
+            else:
+                executor.shutdown(wait=True)
+            shutil.rmtree(spool, ignore_errors=True)
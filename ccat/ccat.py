@@ -1,100 +1,118 @@
 #!/usr/bin/python3
 # -*- coding: UTF-8 -*-
-import json
-import re
-from typing import Union
-
-from ansi2image.ansi2image import Ansi2Image
-from pygments.formatters.terminal256 import Terminal256Formatter
-from pygments.lexers.data import JsonLexer
-from tabulate import _table_formats, tabulate, TableFormat, Line, DataRow
-import codecs
+from bisect import bisect_right
+from collections import deque
+from itertools import chain, islice
+from typing import Iterable, Iterator, Union
 
-try:
-    from pygments import highlight
-    from pygments.lexers import (get_lexer_by_name, get_lexer_for_filename, guess_lexer)
-except (ValueError, ImportError) as e:
-    raise Exception('You may need to run ccat from the root directory (which includes README.md)', e)
+import codecs
 
 try:
-    from .config import Configuration
+    from .config import Configuration, Options
 except (ValueError, ImportError) as e:
     raise Exception('You may need to run ccat from the root directory (which includes README.md)', e)
 
 
 import sys
 import os
+from .compression import Compression
+from .jsonlines import JsonLines
+from .jsonstream import JsonStream
+from .stream import Stream
+from .util.ansi import Ansi
+from .util.cache import RenderCache
+from .util.lexers import LexerIndex
 from .util.color import Color
+from .util.logger import Logger
+from .util.table import Table
+
+# lexers whose state spans far more lines than Configuration.context,
+# for them every line is lexed even when --lines is given
+_FULL_DOCUMENT_LEXERS = {'markdown', 'rst', 'html', 'xml', 'php', 'tex', 'vue'}
+
+# context lines tried as the start of the lexing before the window is lexed from the first one
+_RESYNC_TRIES = 8
+# window lines lexed with the context when a start is tried
+_RESYNC_LOOKAHEAD = 10
+# first lines of the document lexed to check that the lexer resyncs from the context (see resyncs)
+_RESYNC_SAMPLE = 500
+_RESYNC_PROBES = 4
+
+
+class EmptyDocument(Exception):
+    ''' The document has no content (only blank lines) '''
+    pass
+
+
+class ImageTooLarge(ValueError):
+    ''' The image would be higher than the maximum height '''
+    pass
 
 
 class ColorCat(object):
     lexer = None
+    jsonl = False
+    # lines numbered before it are only lexer context (--tail)
+    first = 1
+    # whether the lexer resyncs from the context lines, None until checked (see resyncs)
+    resync = None
+
+    # formatters by (style, dim), shared by every render (and thread)
+    _formatters = {}
 
-    def __init__(self):
-        _table_formats["ccat"] = TableFormat(
-                lineabove=Line("", Color.s("{GR}─{W}"), Color.s("{GR}┬{W}"), ""),
-                linebelowheader=Line("", Color.s("{GR}─{W}"), Color.s("{GR}┼{W}"), ""),
-                linebetweenrows=None,
-                linebelow=Line("", Color.s("{GR}─{W}"), Color.s("{GR}┴{W}"), ""),
-                headerrow=DataRow("", Color.s("{GR}│{W}"), ""),
-                datarow=DataRow("", Color.s("{GR}│{W}"), ""),
-                padding=1,
-                with_header_hide=None,
-            )
+    def __init__(self, config=None):
+        # the values of the render stages: Configuration (command line) or library Options
+        self.config = config if config is not None else Configuration
 
     def main(self):
         ''' Either performs action based on arguments, or starts attack scanning '''
         Configuration.initialize()
 
-        self.run()
+        if Configuration.daemon:
+            from .daemon import Daemon
+            Daemon.serve()
+        elif len(Configuration.filenames) > 1:
+            from .batch import Batch
+            Batch.run(Configuration.filenames)
+        else:
+            self.run()
 
-    @staticmethod
-    def is_valid(line):
-        if len(Configuration.lines) == 0:
+    def is_valid(self, line):
+        if self.config.line_ranges is None:
+            self.config.compile_ranges()
+
+        if not self.config.line_ranges:
             return True
 
-        return any([
-            x for x in Configuration.lines
-            if line >= x[0] and (x[1] == 0 or line <= x[1])
-        ])
+        return self.config.line_ranges.contains(line)
 
-    @staticmethod
-    def is_highlight(line):
-        if len(Configuration.highlight_lines) == 0:
-            return True
+    def is_highlight(self, line):
+        if self.config.highlight_ranges is None:
+            self.config.compile_ranges()
 
-        return any([
-            x for x in Configuration.highlight_lines
-            if line >= x[0] and (x[1] == 0 or line <= x[1])
-        ])
+        if not self.config.highlight_ranges:
+            return True
 
-    @staticmethod
-    def is_dot(line):
-        if len(Configuration.lines) == 0:
-            return False
+        return self.config.highlight_ranges.contains(line)
 
-        if ColorCat.is_valid(line):
-            return False
+    def is_dot(self, line):
+        if self.config.line_ranges is None:
+            self.config.compile_ranges()
 
-        return any([
-            x for x in Configuration.lines
-            if x[0] != 0 and line == x[0] - 1
-        ])
+        return self.config.line_ranges.is_before(line)
 
     @staticmethod
     def format_line_number(line, max_line):
         max_line = max_line if max_line > 3 else 3
 
         if str(line) == '...':
-            return '{GR}%s' % (f'{line}'.rjust(max_line))
+            return Color.t('{GR}%s') % (f'{line}'.rjust(max_line))
         else:
-            return '{O}{D}%s' % (f'{line}'.rjust(max_line))
+            return Color.t('{O}{D}%s') % (f'{line}'.rjust(max_line))
 
     @staticmethod
     def escape_ansi(line):
-        #pattern = re.compile(r'\x1B\[\d+(;\d+){0,2}m')
-        pattern = re.compile(r'(\x9B|\x1B\[)[0-?]*[ -/]*[@-~]')
-        return pattern.sub('', line)
+        return Ansi.strip(line)
 
     @staticmethod
     def wrap_ansi(text: str, width: int) -> list:
@@ -107,201 +125,233 @@ class ColorCat(object):
         except Exception:
             return [text]
 
-        if width < 10:
-            width = 10
-
-        if len(ColorCat.escape_ansi(text)) <= width:
-            return [text]
-
-        # keep the original line's leading indentation on the wrapped rows
-        # so they line up under the original line's content
-        visible_text = ColorCat.escape_ansi(text)
-        indent = len(visible_text) - len(visible_text.lstrip(' '))
-        cont_prefix = ' ' * indent
-
-        ansi_re = re.compile(r'(\x9B|\x1B\[)[0-?]*[ -/]*[@-~]')
-        reset_re = re.compile(r'\x1B\[(0|00|39|49)?m')
-        RESET = '\x1b[0m'
-
-        lines = []
-        cur = ''
-        active = ''  # SGR codes currently in effect, carried to continuation rows
-        visible = 0
-        budget = width  # first row uses the full width
-        i = 0
-        n = len(text)
-        while i < n:
-            m = ansi_re.match(text, i)
-            if m:
-                code = m.group(0)
-                cur += code
-                # track the active color/style so a mid-token wrap keeps it
-                if reset_re.fullmatch(code):
-                    active = ''
-                else:
-                    active += code
-                i = m.end()
-                continue
-            if visible >= budget:
-                # close this chunk and re-open the same style on the next one,
-                # indented to line up under the original line's content. Start
-                # with a reset so the leading indent spaces survive tabulate's
-                # whitespace stripping (it stops at the first non-space char).
-                if active != '':
-                    cur += RESET
-                lines.append(cur)
-                cur = RESET + cont_prefix + active
-                visible = 0
-                budget = width - len(cont_prefix)
-                if budget < 10:
-                    budget = 10
-            cur += text[i]
-            visible += 1
-            i += 1
-
-        if cur != '':
-            lines.append(cur)
-
-        return lines if lines else [text]
+        return Ansi.wrap(text, width)
 
     @classmethod
     def output(cls, text):
-        print(text)
+        if not Configuration.quiet:
+            print(text)
         if Configuration.out_file is not None:
-            # larger font + a bit of line spacing render a sharper, more
-            # readable image with some breathing room around the content
-            o = Ansi2Image(0, 0, font_name=Ansi2Image.get_default_font_name(),
-                           font_size=18, line_height=1.15)
-            # extend the horizontal bars 4 chars past the content and give the
-            # content itself a little right padding, so nothing touches the edge
-            border_chars = set('─┬┼┴━')
-            img_lines = []
-            for line in text.split('\n'):
-                vis = ColorCat.escape_ansi(line).strip()
-                if vis != '' and all(ch in border_chars for ch in vis):
-                    img_lines.append(line + Color.s('{GR}────{W}'))
-                else:
-                    img_lines.append('%s  ' % line)
-            o.loads('\n'.join(img_lines))
-            o.min_margin = 26
-            o.calc_size()
-            o.save_image(Configuration.out_file, format=Configuration.format)
+            cls.save_image(text)
+
+    @staticmethod
+    def save_image(text):
+        image = ColorCat.image_output()
+        for line in text.split('\n'):
+            image.add(line)
+        image.close()
+
+    @staticmethod
+    def image_output():
+        ''' Image write stage of --output-img (see ImageOutput), None without image output '''
+        if Configuration.out_file is None:
+            return None
+
+        # PIL is only loaded when an image is requested
+        from .images import ImageOutput
+
+        return ImageOutput(Configuration.out_file, Configuration.format, lines=Configuration.lines_per_image,
+                           jobs=Configuration.jobs, max_height=Configuration.max_image_height)
+
+    @staticmethod
+    def image(text: str, format: str = 'png', max_height: int = None) -> bytes:
+        '''
+            The rendered text as an image file (png or jpeg), ImageTooLarge if it would be
+            higher than max_height pixels
+        '''
+        # PIL is only loaded when an image is requested
+        from .images import Canvas
+
+        o = Canvas()
+        # extend the horizontal bars 4 chars past the content and give the
+        # content itself a little right padding, so nothing touches the edge
+        border_chars = set('─┬┼┴━')
+        img_lines = []
+        for line in text.split('\n'):
+            vis = ColorCat.escape_ansi(line).strip()
+            if vis != '' and all(ch in border_chars for ch in vis):
+                img_lines.append(line + Color.s('{GR}────{W}'))
+            else:
+                img_lines.append('%s  ' % line)
+        o.loads('\n'.join(img_lines))
+        o.calc_size()
+        if max_height is not None and o.height > max_height:
+            raise ImageTooLarge('the image would be %d pixels high, the maximum is %d' % (o.height, max_height))
+        return o.generate_image(format=format)
+
+    @staticmethod
+    def write(lines: Iterable[str]):
+        ''' Write stage: prints each rendered line as soon as it is produced '''
+        out = sys.stdout if not Configuration.quiet else None
+        image = ColorCat.image_output()
+        try:
+            for line in lines:
+                if out is not None:
+                    out.write(line + '\n')
+                if image is not None:
+                    image.add(line)
+            if out is not None:
+                out.flush()
+        except BrokenPipeError:
+            return
+
+        if image is not None:
+            image.close()
 
     def print_formatted(self, data: Union[bytes, bytearray, str],
                         title: str = '',
                         simple=False,
                         no_tab=False):
+        Color.init()
         ini = Configuration.initialized
         Configuration.initialize(parse_arguments=False)
         if not ini:
             Configuration.simple = simple
             Configuration.no_tab = no_tab
 
-        try:
-
-            formatter = Terminal256Formatter(linenos=False, style=Configuration.style)
-
-            if data is not None:
-
-                if isinstance(data, str):
-                    data = data.encode("UTF-8")
+        if data is not None:
 
-                # Convert data to byte array
-                data = b'' + data
+            if isinstance(data, str):
+                data = data.encode("UTF-8")
 
-                if self.lexer is None:
-                    try:
-                        self.lexer = guess_lexer(data)
-                    except Exception:
-                        self.lexer = get_lexer_by_name('text')
+            self.print_stream(
+                chunks=Stream.slices(data, Configuration.chunk_size),
+                title=title,
+                count_lines=lambda chars=(b'\n',): sum(data.count(c) for c in chars) + 1)
+        else:
+            Color.pl(' ')
+
+    def print_stream(self, chunks: Iterable[bytes], title: str = '', count_lines=None):
+        '''
+            Renders raw byte chunks through the streaming pipeline.
+            count_lines is only called when the input does not fit in the first window
+            and the line number column width is needed.
+        '''
+        self._print(lambda: self.write(self.render(chunks, title, count_lines)))
+
+    def print_lines(self, lines: Iterable[tuple], title: str, total: int):
+        ''' Renders already numbered (line number, line) pairs '''
+        self._print(lambda: self.write(self.render_lines(lines, title, total)))
+
+    def print_cached(self, fp, title: str) -> bool:
+        '''
+            Prints the file from the render cache, or renders it while storing the output
+            in the cache. Returns False if the cache does not apply to this file: the views
+            of a part of the file (--lines, --head, --tail) read only that part.
+        '''
+        if not Configuration.cache or Configuration.cache_dir is None or Configuration.tail is not None or \
+                Configuration.head is not None or Configuration.line_ranges:
+            return False
 
-                # try to read
-                try:
-                    data = data.decode('utf-8-sig')
-                except Exception:
-                    try:
-                        data = data.decode('utf-8')
-                    except Exception:
-                        data = data.decode('latin-1')
+        try:
+            st = os.fstat(fp.fileno())
+            if st.st_size > Configuration.cache_max_file:
+                return False
+        except (OSError, AttributeError, ValueError):
+            return False
 
-                if data.strip(' \r\n') == '':
-                    Color.pl("\n{!} {R}Error: File is empty{W}")
-                    sys.exit(2)
+        def _unchanged():
+            now = os.fstat(fp.fileno())
+            return (now.st_size, now.st_mtime_ns) == (st.st_size, st.st_mtime_ns)
+
+        # the file is read by chunks twice (hashed, then rendered on a miss) rather than
+        # memory mapped: a file truncated while it is mapped (a log rotated) raises SIGBUS
+        fp.seek(0)
+        cache = RenderCache(Configuration.cache_dir, Configuration.cache_size)
+        key = RenderCache.key(
+            Stream.read(fp, Configuration.chunk_size),
+            version=Configuration.version,
+            title=title,
+            style=getattr(Configuration.style, 'name', Configuration.style.__name__),
+            lexer=self.lexer.name if self.lexer is not None else None,
+            jsonl=Configuration.jsonl,
+            mode='simple' if Configuration.simple else 'no_tab' if Configuration.no_tab else 'table',
+            width=self.columns(),
+            lines=Configuration.lines,
+            highlight_lines=Configuration.highlight_lines,
+            head=Configuration.head,
+            window=Configuration.window,
+            context=Configuration.context,
+            guess_size=Configuration.guess_size)
+
+        entry = cache.get(key)
+        if Configuration.verbose >= 1:
+            Logger.pl('{*} {W}Render cache %s {W}(hits: {G}%d{W}, misses: {O}%d{W})' % (
+                '{G}hit' if entry is not None else '{O}miss', cache.hits, cache.misses), out=sys.stderr)
+
+        if entry is not None:
+            self._print(lambda: ColorCat.write_cached(entry))
+        else:
+            if self.lexer is None:
+                self.guess_file_lexer(fp)
+            fp.seek(0)
+            # not stored if the file changed since it was hashed
+            self._print(lambda: self.write(cache.store(key, self.render(
+                chunks=Stream.read(fp, Configuration.chunk_size),
+                title=title,
+                count_lines=lambda chars=(b'\n',): Configuration.count_file_lines(fp.name, chars)), _unchanged)))
+
+        return True
+
+    def print_compressed(self, fp, compression: str, title: str):
+        '''
+            Renders a compressed file as it is decompressed. The lexer is the one of the inner
+            file name (app.log.gz -> app.log) or guessed from the decompressed text. Random
+            access, the render cache and the line index do not apply, the lines are counted
+            (decompressing the file again) only when the line number column needs it.
+        '''
+        if Configuration.verbose >= 2:
+            Logger.pl('{*} {W}Decompressing {G}%s{W} (%s)' % (Configuration.filename, compression), out=sys.stderr)
+
+        if self.lexer is None:
+            self.lexer = LexerIndex.get_lexer(Compression.inner_name(Configuration.filename), Configuration.cache_dir)
+
+        def _chunks():
+            try:
+                yield from Compression.read(fp, compression, Configuration.chunk_size)
+            except EOFError:
+                Logger.pl('{!} {O}%s: compressed data ended unexpectedly, the file is truncated{W}' % (
+                    Configuration.filename), out=sys.stderr)
 
-                #try parse json
-                try:
-                    tmp = json.loads(data)
-                    data = json.dumps(tmp, sort_keys=False, indent=2)
-                    data = data.strip('\r\n')
-                    self.lexer = JsonLexer()
-                except Exception:
-                    pass
-
-                data = data.replace('\t', '  ').replace('\r', '')
-                ldata = highlight(
-                    code=data,
-                    lexer=self.lexer,
-                    formatter=formatter).replace('\t', '  ').strip('\n').split('\n')
-
-                ldata = [
-                    l
-                    if ColorCat.is_highlight(i + 1) else Color.s('{GR}{D}%s{W}' % ColorCat.escape_ansi(l))
-                    for i, l in enumerate(ldata)
-                ]
-
-                if Configuration.simple:
-                    self.output('\n'.join(ldata))
-                elif Configuration.no_tab:
-                    mc = len(f'{len(ldata)}')
-                    dot_line = Color.s('  {W}%s{W}  ' % ColorCat.format_line_number('...', mc))
-                    c1_len = len(ColorCat.escape_ansi(dot_line))
-                    size = ColorCat.get_columns()
-
-                    data = [
-                        (
-                                Color.s(' {W}%s{GR}:{W}  ' % ColorCat.format_line_number(i + 1, mc)) + ColorCat.format_line(l, c1_len, size)
-                        )
-                        if ColorCat.is_valid(i + 1) else dot_line
-                        for i, l in enumerate(ldata)
-                        if ColorCat.is_valid(i + 1) or ColorCat.is_dot(i + 1)
-                    ]
-
-                    if not ColorCat.is_valid(len(ldata)):
-                        data += [dot_line]
-
-                    text = Color.s((' \033[38;5;52m=\033[38;5;88m=\033[38;5;124m=\033[38;5;160m=\033[38;5;196m> '
-                                    '{W}%s{W}\n') % title)
-
-                    text += ''.join([
-                        '%s──' % c for k, c in sorted(Color.gray_scale.items(), key=lambda x: x[0], reverse=True)
-                    ]) + Color.s('{W}\n')
-
-                    self.output(text + '\n'.join(data))
-                else:
-                    mc = len(f'{len(ldata)}')
-                    dot_line = (Color.s('  {W}%s{W} ' % ColorCat.format_line_number('...', mc)), '')
-                    size = ColorCat.get_columns()
-                    max_c2_size = size - 10 - mc
-
-                    header = ['', title]
-                    empty_num = Color.s(' {W}%s{W} ' % (' ' * mc))
-                    data = []
-                    for i, l in enumerate(ldata):
-                        if ColorCat.is_valid(i + 1):
-                            # long lines are split into aligned continuation rows
-                            chunks = ColorCat.wrap_ansi(l, max_c2_size)
-                            num = Color.s(' {W}{O}{D}%s{W} ' % ColorCat.format_line_number(i + 1, mc))
-                            data.append((num, chunks[0]))
-                            for chunk in chunks[1:]:
-                                data.append((empty_num, chunk))
-                        elif ColorCat.is_dot(i + 1):
-                            data.append(dot_line)
-
-                    if not ColorCat.is_valid(len(ldata)):
-                        data += [dot_line]
-
-                    self.output(tabulate(data, header, tablefmt='ccat'))
+        self.print_stream(
+            chunks=_chunks(),
+            title=title,
+            count_lines=lambda chars=(b'\n',): Configuration.count_file_lines(Configuration.filename, chars))
 
+    @staticmethod
+    def write_cached(filename: str):
+        ''' Write stage of a cache hit: copies the stored output '''
+        out = sys.stdout if not Configuration.quiet else None
+        image = ColorCat.image_output()
+        tail = ''
+        try:
+            for text in RenderCache.read(filename):
+                if out is not None:
+                    out.write(text)
+                if image is not None:
+                    # the entry is read by chunks, lines can span two of them
+                    lines = (tail + text).split('\n')
+                    tail = lines.pop()
+                    for line in lines:
+                        image.add(line)
+            if out is not None:
+                out.flush()
+        except BrokenPipeError:
+            return
+
+        if image is not None:
+            image.close()
+
+    def _print(self, action):
+        try:
+            action()
+
+        except EmptyDocument:
+            Color.pl("\n{!} {R}Error: File is empty{W}")
+            sys.exit(2)
+        except ImageTooLarge as e:
+            Color.pl("\n{!} {R}Error: {O}%s{R}, use {G}--lines-per-image{R} to split it{W}" % str(e))
+            sys.exit(1)
         except Exception as e:
             Color.pl("\n{!} {R}Error: {O}%s" % str(e))
             if Configuration.verbose > 0 or True:
@@ -316,21 +366,875 @@ class ColorCat(object):
         except KeyboardInterrupt as e:
             raise e
 
-        Color.pl(' ')
+        if not Configuration.quiet:
+            Color.pl(' ')
+
+    def formatter(self):
+        ''' The formatter of the style, created once '''
+        from .formatter import SGRFormatter
+
+        dim = (Color.s('{GR}{D}'), Color.s('{W}'))
+        formatter = ColorCat._formatters.get((self.config.style, dim))
+        if formatter is None:
+            formatter = ColorCat._formatters[(self.config.style, dim)] = SGRFormatter(
+                style=self.config.style, dim=dim)
+        return formatter
+
+    def render(self, chunks: Iterable[bytes], title: str = '', count_lines=None) -> Iterator[str]:
+        ''' Yields the rendered output lines for the raw byte chunks '''
+
+        # filters may have been changed by library callers since the last render
+        self.config.compile_ranges()
+
+        report = None
+        if self.config.verbose >= 1:
+            report = lambda encoding: Logger.pl('{*} {W}Encoding: {G}%s{W}' % encoding, out=sys.stderr)
+
+        lines = Stream.strip_edges(Stream.split_lines(Stream.decode(chunks, report)))
+
+        # the first window is buffered to guess the lexer, check for empty
+        # files and (when it is the whole document) reformat JSON
+        window = self.config.window if self.config.window > 0 else 1
+        head = list(islice(lines, window + 1))
+        complete = len(head) <= window
+
+        if self.lexer is None:
+            self.lexer = ColorCat.guess_lexer(head, config=self.config)
+
+        if complete and all(l.strip(' ') == '' for l in head):
+            raise EmptyDocument()
+
+        # JSON Lines records are re-indented one by one, keeping the line numbers of the file
+        self.jsonl = self.config.jsonl or JsonLines.sniff(head, self.config.filename)
+
+        # re-indent JSON documents (streamed, without building the objects)
+        reindented = False
+        if not self.jsonl and (JsonStream.is_json_lexer(self.lexer) or JsonStream.sniff(head)):
+            out, lines = JsonStream.reindent(chain(head, lines), window)
+            if out is not None:
+                from .jsonlexer import IndentedJsonLexer
+                head, complete, reindented = out, len(out) <= window, True
+                self.lexer = IndentedJsonLexer()
+            else:
+                head = list(islice(lines, window + 1))
+
+        pairs = enumerate(chain(head, lines), 1)
+        ldata = None
+        if self.config.head is not None:
+            # the document ends after its first lines, nothing else is read
+            head = head[:self.config.head]
+            complete = complete or self.config.head <= window
+            pairs = islice(pairs, self.config.head)
+            count_lines = lambda chars=None: self.config.head
+        elif self.config.tail is not None and not complete:
+            # not a regular file (see seek_tail): the whole document is read, only its last
+            # lines (and their lexer context) are kept
+            if self.jsonl or self.needs_full_document() or self.resyncs(head, self.formatter()):
+                pairs = deque(pairs, maxlen=self.config.tail + max(self.config.context, 0))
+                self.first = max(pairs[-1][0] - self.config.tail + 1, 1)
+                count_lines = lambda chars=None: pairs[-1][0]
+            else:
+                # every line is lexed, only the highlight of the last ones is kept
+                ldata = deque(self.highlight_all(pairs, self.formatter()), maxlen=self.config.tail + 1)
+                self.first = max(ldata[-1][0] - self.config.tail + 1, 1)
+                ldata = [(n, l) for n, l in ldata if n >= self.first]
+                count_lines = lambda chars=None: ldata[-1][0]
+        elif self.config.tail is not None:
+            self.first = max(len(head) - self.config.tail + 1, 1)
+
+        total = len(head) if complete else None
+        if total is None and not self.config.simple:
+            if count_lines is None:
+                total = 0
+            elif reindented:
+                total = count_lines(JsonStream.BREAKS)
+            else:
+                total = count_lines()
+
+        if ldata is not None:
+            yield from self.render_rows(ldata, title, total, complete)
+        else:
+            yield from self.render_lines(pairs, title, total, complete)
+
+    def render_lines(self, lines: Iterable[tuple], title: str, total: int, complete: bool = False) -> Iterator[str]:
+        '''
+            Yields the rendered output for (line number, line) pairs. The pairs may be sparse
+            (random access path), as long as every selected line comes with its leading context.
+        '''
+        formatter = self.formatter()
+        if self.jsonl:
+            ldata = self.highlight_records(lines, formatter)
+        else:
+            ldata = self.highlight(lines, formatter)
+        yield from self.render_rows(ldata, title, total, complete)
+
+    def render_rows(self, ldata: Iterable[tuple], title: str, total: int, complete: bool = False) -> Iterator[str]:
+        ''' Yields the rendered output for the highlighted (line number, line) pairs (see highlight) '''
+        if self.config.simple:
+            yield from (l for _, l in ldata)
+            return
+
+        mc = len(f'{total}')
+        if self.config.no_tab:
+            yield from self.render_no_tab(ldata, title, mc)
+        elif complete:
+            yield from self.render_table(ldata, title, mc)
+        else:
+            yield from self.render_table_stream(ldata, title, mc)
 
-    def run(self):
+    @staticmethod
+    def guess_lexer(lines: Iterable[str], tail: str = '', config=Configuration):
+        '''
+            Guesses the lexer from the first config.guess_size characters of the lines
+            (tail is the end of the document, checked for modelines)
+        '''
+        sample = []
+        size = 0
+        for line in lines:
+            if size >= config.guess_size:
+                break
+            sample.append(line)
+            size += len(line) + 1
+
+        return LexerIndex.guess('\n'.join(sample)[:config.guess_size], tail)
+
+    def guess_file_lexer(self, fp):
+        ''' Guesses the lexer reading only the bounded samples of the beginning and of the end of the file '''
+        size = fp.seek(0, 2)
+        fp.seek(max(size - LexerIndex.TAIL, 0))
+        tail = fp.read(LexerIndex.TAIL).decode('UTF-8', 'replace').replace('\r', '')
+        if size > LexerIndex.TAIL:
+            # the first line may be incomplete
+            tail = tail.split('\n', 1)[-1]
+
+        fp.seek(0)
+        self.lexer = ColorCat.guess_lexer(Stream.strip_edges(Stream.split_lines(Stream.decode(
+            Stream.read(fp, min(Configuration.chunk_size, Configuration.guess_size * 4))))), tail)
+
+    def needs_full_document(self) -> bool:
+        ''' True if the lexer can not resync from a few lines of context '''
+        return self.lexer is not None and len(
+            set(self.lexer.aliases).intersection(_FULL_DOCUMENT_LEXERS)) > 0
+
+    def highlight(self, lines: Iterable[tuple], formatter) -> Iterator[tuple]:
+        '''
+            Lex stage: highlights one window of (line number, line) pairs at a time.
+            Without filters every line is lexed (see highlight_all).
+
+            With a --lines filter only the selected lines are lexed, each window
+            prefixed by the --context lines so the lexer state can resync. When it does
+            not on the first lines of the document (see resyncs) every line is lexed.
+            Yields (number, highlighted line) for selected lines and (number, None)
+            for the '...' marks and the last line of the document.
+
+            Lines out of the --highlight-lines filter are not lexed (only kept as context,
+            the first one after a range is its lookahead): their plain text is dimmed as it
+            is. Lines before self.first are only context.
+        '''
+        # edges were already stripped for the whole document, so the lexer
+        # must not strip the blank lines at the edges of each window
+        self.lexer.stripnl = False
+
+        full = self.needs_full_document()
+        filtered = bool(self.config.line_ranges) and not self.config.simple and not full
+        dimmed = bool(self.config.highlight_ranges) and not full
+        if not full and (filtered or dimmed or self.first > 1) and self.resync is None:
+            lines = iter(lines)
+            head = list(islice(lines, _RESYNC_SAMPLE))
+            lines = chain(head, lines)
+            # a sparse source (random access path) was checked on the first lines of the file
+            sample = []
+            for num, line in head:
+                if num != len(sample) + 1:
+                    break
+                sample.append(line)
+            if len(sample) > 0:
+                self.resyncs(sample, formatter)
+        if full or not (filtered or dimmed or self.first > 1) or self.resync is False:
+            yield from self.highlight_all(lines, formatter)
+            return
+
+        dim_on, dim_off = formatter.dim
+        size = self.config.window if self.config.window > 0 else 1
+        context = deque(maxlen=max(self.config.context, 0))
+        window = []
+
+        def _flush(lookahead: list = ()):
+            res = self.lex([l for _, l in context], window, formatter, lookahead)
+            context.extend(window)
+            window.clear()
+            return res
+
+        prev = 0
+        emitted = 0
+        for num, line in lines:
+            if num != prev + 1:
+                # gap in a sparse source: the context is no longer contiguous
+                if len(window) > 0:
+                    yield from _flush()
+                context.clear()
+            prev = num
+
+            if num < self.first:
+                context.append((num, line))
+                continue
+
+            selected = not filtered or self.is_valid(num)
+            if selected and (not dimmed or self.is_highlight(num)):
+                window.append((num, line))
+                if len(window) >= size:
+                    yield from _flush()
+                    emitted = num
+                continue
+
+            if len(window) > 0:
+                # end of a range: the next line is lexed too (output dropped), it may close
+                # what the last lines opened (e.g. a docstring)
+                yield from _flush([line])
+            context.append((num, line))
+            if selected:
+                yield num, dim_on + line + dim_off
+                emitted = num
+            elif self.is_dot(num):
+                yield num, None
+                emitted = num
+
+        if len(window) > 0:
+            yield from _flush()
+            emitted = prev
+
+        if prev != emitted:
+            yield prev, None
+
+    def highlight_all(self, lines: Iterable[tuple], formatter) -> Iterator[tuple]:
+        '''
+            Lex stage lexing every line, with the same output as highlight. The lexer state
+            at a window is the one it had at the end of the previous window: the window is
+            lexed after the lines that come out as they did at the end of the previous one
+            (see lex). The lines out of the filters are lexed too, their output is dropped.
+            The tokens open at the end of a window are closed by the lexer as they are in the
+            file (_RESYNC_LOOKAHEAD lines after): they are highlighted with the next window.
+        '''
+        filtered = bool(self.config.line_ranges) and not self.config.simple
+        dimmed = bool(self.config.highlight_ranges)
+        dim_on, dim_off = formatter.dim
+        size = self.config.window if self.config.window > 0 else 1
+        keep = max(self.config.context, 1)
+        self.lexer.stripnl = False
+        # lines lexed before the window, the highlight of the last ones
+        context = deque(maxlen=max(size, keep))
+        reference = deque(maxlen=keep)
+        window = []
+        prev = 0
+        emitted = 0
+
+        def _shown(num):
+            return num >= self.first and (not filtered or self.is_valid(num)) and (
+                not dimmed or self.is_highlight(num))
+
+        def _flush(hold=0):
+            # the last hold lines are lexed again with the next window, which tells how the
+            # tokens left open at the end of this one close; lines not shown are formatted
+            # only to be the reference of the next window
+            done = window[:len(window) - hold]
+            last = done[-1][0]
+            res = self.lex(list(context), done, formatter, [l for _, l in window[len(done):]],
+                           reference=list(reference), plain=lambda num: num <= last - keep and not _shown(num))
+            context.extend(l for _, l in done)
+            reference.extend(l for _, l in res)
+            del window[:len(done)]
+            return _output(done, res)
+
+        def _output(lines, res):
+            nonlocal emitted
+            for (num, line), (_, text) in zip(lines, res):
+                if num < self.first:
+                    continue
+                elif not filtered or self.is_valid(num):
+                    yield num, text if not dimmed or self.is_highlight(num) else dim_on + line + dim_off
+                    emitted = num
+                elif self.is_dot(num):
+                    yield num, None
+                    emitted = num
+
+        hold = _RESYNC_LOOKAHEAD if size > 2 * _RESYNC_LOOKAHEAD else 0
+        for num, line in lines:
+            if num != prev + 1 and len(window) > 0:
+                # gap in a sparse source: the context is no longer contiguous
+                yield from _flush()
+                context.clear()
+                reference.clear()
+            prev = num
+
+            window.append((num, line))
+            if len(window) >= size:
+                yield from _flush(hold)
+
+        if len(window) > 0:
+            yield from _flush()
+
+        if prev != emitted:
+            yield prev, None
+
+    def highlight_records(self, lines: Iterable[tuple], formatter) -> Iterator[tuple]:
+        '''
+            Lex stage of the JSON Lines mode, with the same output as highlight: each
+            selected record is re-indented and highlighted on its own (see JsonLines),
+            its lines joined by '\\n'. The lines are sent to JsonLines.run in batches.
+        '''
+        filtered = bool(self.config.line_ranges) and not self.config.simple
+        dimmed = bool(self.config.highlight_ranges)
+        prev = 0
+
+        def _batches():
+            nonlocal prev
+            batch = []
+            size = 0
+            for num, line in lines:
+                prev = num
+                if num < self.first:
+                    continue
+                elif not filtered or self.is_valid(num):
+                    batch.append((num, line, dimmed and not self.is_highlight(num)))
+                    size += len(line)
+                elif self.is_dot(num):
+                    batch.append((num, None, False))
+                else:
+                    continue
+
+                if len(batch) >= JsonLines.BATCH or size >= JsonLines.BATCH_CHARS:
+                    yield batch
+                    batch = []
+                    size = 0
+
+            if len(batch) > 0:
+                yield batch
+
+        emitted = 0
+        for results in JsonLines.run(_batches(), formatter, self.config.jobs):
+            yield from results
+            emitted = results[-1][0]
+
+        if prev != emitted:
+            yield prev, None
+
+    def lex(self, context: list, window: list, formatter, lookahead: list = (), reference: list = None,
+            plain=None) -> list:
+        '''
+            Highlights the window of (line number, line) pairs, lexed after the context
+            lines (so the lexer state can resync) and before the lookahead lines, whose
+            output is dropped. plain(line number) tells the window lines formatted as
+            plain text (default: the ones out of --highlight-lines).
+
+            reference is the highlight of the last context lines, when they were lexed
+            before: the lexing starts at the first context line (see resync_starts) from
+            which they come out the same, so the lexer reaches the window in the state it
+            had then. When none does, the one matching most of their last lines is used.
+        '''
+        nums = [n for n, _ in window]
+        code = [l for _, l in window] + list(lookahead)
+        reference = reference[-len(context):] if reference and len(context) > 0 else []
+        # first context line of the reference
+        start = len(context) - len(reference)
+        if plain is None:
+            plain = lambda num: not self.is_highlight(num)
+
+        def _lex(top, lines):
+            skip = len(context) - top
+
+            def _plain(i):
+                # context lines are lexed only to be dropped (or compared with the reference)
+                if i < skip:
+                    return i < start - top
+                return i - skip < len(nums) and plain(nums[i - skip])
+
+            text = context[top:] + lines
+            return list(islice(self.format_lines(text, formatter, _plain), len(text))), skip
+
+        def _matching(out, top):
+            # number of last reference lines lexed that came out the same, whether all did
+            count = 0
+            for ref, line in zip(reversed(reference), reversed(out[max(start - top, 0):len(context) - top])):
+                if ref != line and formatter.runs(ref) != formatter.runs(line):
+                    break
+                count += 1
+            return count, count == len(context) - max(start, top)
+
+        starts = ColorCat.resync_starts(context, start)
+        out, skip = _lex(starts[0], code)
+        count, same = _matching(out, starts[0])
+        if len(reference) > 0 and not same:
+            best, most = starts[0], count
+            for top in starts[1:_RESYNC_TRIES]:
+                count, same = _matching(_lex(top, code[:_RESYNC_LOOKAHEAD])[0], top)
+                if same:
+                    best = top
+                    break
+                if count > most:
+                    best, most = top, count
+            if best != starts[0]:
+                out, skip = _lex(best, code)
+
+        return list(zip(nums, out[skip:skip + len(nums)]))
+
+    @staticmethod
+    def resync_starts(context: list, start: int) -> list:
+        '''
+            Context lines the lexing may start at, the most likely places for the lexer to be
+            back in a top level state first: the least indented lines from start (first line
+            of the reference), then the least indented lines before it, the nearest first.
+            Without reference (start is the end of the context) only the first least
+            indented line.
+        '''
+        def _least(first, last):
+            indents = [(i, len(context[i]) - len(context[i].lstrip(' '))) for i in range(first, last)
+                       if context[i].strip(' ') != '']
+            least = min((n for _, n in indents), default=0)
+            return [i for i, n in indents if n == least]
+
+        if start >= len(context):
+            return (_least(0, len(context)) + [0])[:1]
+        return _least(start, len(context)) + _least(0, start)[::-1] or [start]
+
+    def resyncs(self, lines: list, formatter) -> bool:
+        '''
+            True if the lexer resyncs from the --context lines (so the windows of the selected
+            lines can be lexed on their own), checked once on the first lines of the document:
+            a few windows of the sample, lexed after their context lines only, must come out as
+            they do lexing the sample from its start. A sample not longer than the context
+            (and a few lines) is not checked.
+        '''
+        if self.resync is not None:
+            return self.resync
+
+        self.lexer.stripnl = False
+        lines = lines[:_RESYNC_SAMPLE]
+        context = max(self.config.context, 0)
+        if len(lines) <= context + _RESYNC_LOOKAHEAD:
+            self.resync = True
+            return True
+
+        full = list(islice(self.format_lines(lines, formatter), len(lines)))
+        last = len(lines) - _RESYNC_LOOKAHEAD
+        self.resync = True
+        for p in sorted(set(context + (last - context) * i // _RESYNC_PROBES for i in range(_RESYNC_PROBES))):
+            window = list(enumerate(lines[p:p + _RESYNC_LOOKAHEAD], p))
+            res = self.lex(lines[p - context:p], window, formatter, lines[p + _RESYNC_LOOKAHEAD:][:_RESYNC_LOOKAHEAD],
+                           plain=lambda num: False)
+            if any(formatter.runs(full[n]) != formatter.runs(line) for n, line in res):
+                self.resync = False
+                break
+        return self.resync
+
+    def format_lines(self, code: list, formatter, plain=None) -> Iterator[str]:
+        ''' Lexes and formats the lines (see SGRFormatter.lines) '''
+        out = None
+        if hasattr(self.lexer, 'format_lines'):
+            out = self.lexer.format_lines(code, formatter, plain)
+        if out is None:
+            out = formatter.lines(self.lexer.get_tokens('\n'.join(code) + '\n'), plain=plain)
+        return out
+
+    def seek_lines(self, fp) -> Union[tuple, None]:
+        '''
+            Random access path for --lines on regular files: only the selected
+            spans (plus their lexer context) are read, decoded and lexed.
+            Returns ((line number, line) pairs, total lines) or None when the
+            whole file must be streamed instead.
+        '''
+        if Configuration.tail is not None:
+            return self.seek_tail(fp)
+        elif Configuration.head is not None:
+            # streamed up to the last line of the head
+            return None
+
+        if Configuration.simple or not Configuration.line_ranges or self.needs_full_document():
+            return None
+
+        # re-indented JSON lines do not map to the lines of the file (JSON Lines
+        # records keep the number of their line)
+        fp.seek(0)
+        sample = fp.read(Configuration.guess_size).decode('utf-8-sig', 'replace').split('\n')
+        self.jsonl = Configuration.jsonl or JsonLines.sniff(sample, Configuration.filename)
+        if not self.jsonl and (JsonStream.is_json_lexer(self.lexer) or JsonStream.sniff(sample)):
+            return None
+
+        window = Configuration.window if Configuration.window > 0 else 1
+        index = Configuration.get_line_index(getattr(fp, 'name', None))
+        raw_total = len(index) if index is not None else Stream.count_lines(fp, Configuration.chunk_size)
+        if raw_total <= window:
+            return None
+
+        # leading and trailing blank lines are not numbered (see Stream.strip_edges)
+        leading = Stream.blank_lines(fp, Configuration.chunk_size, reverse=False)
+        trailing = Stream.blank_lines(fp, Configuration.chunk_size, reverse=True)
+        if leading is None or trailing is None or leading + trailing >= raw_total:
+            return None
+
+        total = raw_total - leading - trailing
+        context = max(Configuration.context, 1)
+
+        spans = [(total, total)]
+        for start, end in Configuration.line_ranges:
+            if start <= total:
+                spans.append((max(start - context, 1), int(min(end, total))))
+        for mark in Configuration.line_ranges.marks:
+            if 1 <= mark - 1 <= total:
+                spans.append((mark - 1, mark - 1))
+
+        merged = []
+        for start, end in sorted(spans):
+            if len(merged) > 0 and start <= merged[-1][1] + 1:
+                merged[-1][1] = max(end, merged[-1][1])
+            else:
+                merged.append([start, end])
+
+        if index is not None:
+            offsets = index
+        else:
+            offsets = Stream.line_offsets(
+                fp, sorted(set([s + leading for s, _ in merged] + [e + leading + 1 for _, e in merged])),
+                Configuration.chunk_size)
+
+        if self.lexer is None:
+            fp.seek(0)
+            self.lexer = ColorCat.guess_lexer(
+                Stream.strip_edges(Stream.split_lines(Stream.decode(Stream.read(fp, Configuration.chunk_size)))))
+            if self.needs_full_document():
+                return None
+
+        if not self.file_resyncs(fp):
+            # every line is lexed
+            return None
+
+        def _pairs():
+            for start, end in merged:
+                first = offsets[start + leading]
+                last = offsets.get(end + leading + 1)
+                fp.seek(first)
+                data = fp.read() if last is None else fp.read(last - first)
+                yield from zip(
+                    range(start, end + 1),
+                    Stream.split_lines(Stream.decode([data])))
+
+        return _pairs(), total
+
+    def seek_tail(self, fp) -> Union[tuple, None]:
+        '''
+            Random access path for --tail on regular files: the last lines (and Configuration.context
+            lines before them, only lexed) are found reading the file backwards. The line numbers
+            need the lines before them to be counted, unless they are not shown (simple mode).
+            Returns ((line number, line) pairs, total lines) or None when the whole file must be
+            streamed instead.
+        '''
+        fp.seek(0)
+        sample = fp.read(Configuration.guess_size).decode('utf-8-sig', 'replace').split('\n')
+        self.jsonl = Configuration.jsonl or JsonLines.sniff(sample, Configuration.filename)
+        if self.needs_full_document() or (not self.jsonl and (
+                JsonStream.is_json_lexer(self.lexer) or JsonStream.sniff(sample) or not self.file_resyncs(fp))):
+            return None
+
+        context = max(Configuration.context, 0) if not self.jsonl else 0
+        start, end = Stream.last_lines(fp, Configuration.tail + context, Configuration.chunk_size)
+        fp.seek(start)
+        lines = list(Stream.split_lines(Stream.decode([fp.read(end - start)])))
+        if start == 0:
+            # leading blank lines are not numbered
+            lines = list(Stream.strip_edges(lines))
+            if len(lines) == 0:
+                return None
+
+        first = 1
+        if start > 0 and (not Configuration.simple or Configuration.highlight_lines):
+            leading = Stream.blank_lines(fp, Configuration.chunk_size, reverse=False)
+            if leading is None:
+                return None
+
+            index = Configuration.get_line_index(getattr(fp, 'name', None))
+            if index is not None:
+                # raw line starting at start
+                first = bisect_right(index.offsets, start) - leading
+            else:
+                first = Stream.count_lines(fp, Configuration.chunk_size, start) - leading
+
+        total = first + len(lines) - 1
+        self.first = max(total - Configuration.tail + 1, first)
+        return zip(range(first, total + 1), lines), total
+
+    def file_resyncs(self, fp) -> bool:
+        ''' resyncs checked on the first lines of the file '''
+        fp.seek(0)
+        head = islice(Stream.strip_edges(Stream.split_lines(Stream.decode(
+            Stream.read(fp, Configuration.chunk_size)))), _RESYNC_SAMPLE)
+        return self.resyncs(list(head), self.formatter())
+
+    def rows(self, ldata: Iterable[tuple]) -> Iterator[tuple]:
+        '''
+            Filter stage: yields (line number, line) for the selected lines and
+            (None, None) where a '...' separator must be shown
+        '''
+        last = 0
+        for num, l in ldata:
+            last = num
+            if self.is_valid(num):
+                yield num, l
+            elif self.is_dot(num):
+                yield None, None
+
+        if not self.is_valid(last):
+            yield None, None
 
+    @staticmethod
+    def no_tab_header(title: str) -> str:
+        text = Color.t(' \033[38;5;52m=\033[38;5;88m=\033[38;5;124m=\033[38;5;160m=\033[38;5;196m> '
+                       '{W}%s{W}\n') % title
+
+        text += ''.join([
+            '%s──' % c for k, c in sorted(Color.gray_scale.items(), key=lambda x: x[0], reverse=True)
+        ]) + Color.s('{W}')
+
+        return text
+
+    def no_tab_rows(self, ldata: Iterable[str], mc: int) -> Iterator[str]:
+        ''' Format stage of the no tab mode '''
+        dot_line = Color.t('  {W}%s{W}  ') % ColorCat.format_line_number('...', mc)
+        c1_len = len(ColorCat.escape_ansi(dot_line))
+        size = self.columns()
+
+        number = Color.t(' {W}%s{GR}:{W}  ')
+        for num, l in self.rows(ldata):
+            if num is None:
+                yield dot_line
+            else:
+                # JSON Lines records span several lines
+                yield number % ColorCat.format_line_number(num, mc) + ('\n' + ' ' * c1_len).join(
+                    ColorCat.format_line(t, c1_len, size) for t in l.split('\n'))
+
+    def render_no_tab(self, ldata: Iterable[str], title: str, mc: int) -> Iterator[str]:
+        yield ColorCat.no_tab_header(title)
+
+        empty = True
+        for line in self.no_tab_rows(ldata, mc):
+            empty = False
+            yield line
+
+        if empty:
+            yield ''
+
+    def table_rows(self, ldata: Iterable[str], mc: int) -> Iterator[tuple]:
+        ''' Format stage of the table mode: yields the (number, content) cells '''
+        dot_line = (Color.t('  {W}%s{W} ') % ColorCat.format_line_number('...', mc), '')
+        size = self.columns()
+        max_c2_size = size - 10 - mc
+
+        empty_num = Color.t(' {W}%s{W} ') % (' ' * mc)
+        number = Color.t(' {W}{O}{D}%s{W} ')
+        for num, l in self.rows(ldata):
+            if num is None:
+                yield dot_line
+                continue
+            # long lines (and the lines of JSON Lines records) are split into aligned continuation rows
+            chunks = [c for t in l.split('\n') for c in ColorCat.wrap_ansi(t, max_c2_size)]
+            yield number % ColorCat.format_line_number(num, mc), chunks[0]
+            for chunk in chunks[1:]:
+                yield empty_num, chunk
+
+    def render_table(self, ldata: Iterable[str], title: str, mc: int) -> Iterator[str]:
+        ''' Table mode for complete documents, sized to the widest line (as tabulate did) '''
+        yield from Table.render(self.table_rows(ldata, mc), ['', title])
+
+    def render_table_stream(self, ldata: Iterable[str], title: str, mc: int) -> Iterator[str]:
+        '''
+            Table mode for documents bigger than one window: rows are written as they
+            are produced, so the content column is sized to the wrap width instead of
+            the widest line of the document
+        '''
+        w1 = mc if mc > 3 else 3
+        w2 = max(self.columns() - 10 - mc, len(ColorCat.escape_ansi(title)) + 2)
+        yield from Table.stream(self.table_rows(ldata, mc), ['', title], [w1, w2])
+
+    def follow(self, title: str):
+        ''' Follow mode: renders the last lines of the file, then the lines appended to it until interrupted '''
+        from .follow import Follow
+
+        count = Configuration.tail if Configuration.tail is not None else Follow.LINES
+        source = Follow(Configuration.filename, Configuration.chunk_size)
         try:
+            lines = source.tail(count + Configuration.context, Configuration.get_line_index(Configuration.filename))
+            self.jsonl = Configuration.jsonl or JsonLines.sniff(
+                (l for _, l in lines[-count:]), Configuration.filename)
+
+            if Configuration.verbose >= 2:
+                Logger.pl('{*} {W}Following {G}%s{W} (%s)' % (
+                    Configuration.filename, 'inotify' if source.inotify else 'polling'), out=sys.stderr)
+
+            self.print_live(chain([(None, lines[-count:])], source), title,
+                            [l for _, l in lines[:-count]])
+        finally:
+            source.close()
+
+    def read_stdin(self, title: str):
+        '''
+            Renders the standard input. When it ends within the first window it is rendered as
+            a file would be, otherwise the lines are written as they arrive (see print_live),
+            except for JSON documents (re-indented by the streaming pipeline) and the --head/--tail
+            views, rendered by the streaming pipeline too.
+        '''
+        from .pipe import Pipe
+
+        pipe = Pipe(sys.stdin.buffer, Configuration.chunk_size)
+        window = Configuration.window if Configuration.window > 0 else 1
+        data = pipe.prefix(window + 1, Configuration.chunk_size)
+
+        if pipe.eof and data.count(b'\n') <= window:
+            pipe.pending = b''
+            self.print_stream(
+                chunks=[data],
+                title=title,
+                count_lines=lambda chars=(b'\n',): sum(data.count(c) for c in chars) + 1)
+            return
+
+        lines = list(Stream.split_lines(Stream.decode([data])))
+        if self.lexer is None:
+            self.lexer = ColorCat.guess_lexer(lines)
+
+        # more input follows a complete JSON object on the first line: a JSON Lines record
+        first = next((l.strip() for l in lines[:-1] if l.strip() != ''), '')
+        self.jsonl = Configuration.jsonl or JsonLines.sniff(lines) or (
+            first[:1] in ('{', '[') and JsonLines.is_record(first))
+
+        if Configuration.out_file is not None or Configuration.head is not None or \
+                Configuration.tail is not None or (not self.jsonl and (
+                JsonStream.is_json_lexer(self.lexer) or JsonStream.sniff(lines))):
+            self.print_stream(chunks=pipe.chunks(), title=title)
+        else:
+            self.print_live(((None, lines) for lines in pipe.batches(window)), title)
+
+    def print_live(self, batches: Iterable[tuple], title: str, context: list = None):
+        '''
+            Incremental write stage (follow mode and pipes): batches yields (reason, (line number,
+            line) pairs), reason tells why the numbers restarted from 1. Each batch is written as
+            it arrives and only its lines are lexed, after the --context lines of the
+            previous ones (resynced against their highlight, see lex). The table keeps fixed column widths, the line number column grows
+            when the numbers get more digits.
+        '''
+        formatter = self.formatter()
+        self.lexer.stripnl = False
+        context = deque(context or [], maxlen=max(self.config.context, 0))
+        # highlight of the last context lines, when they were written (see lex)
+        reference = deque(maxlen=max(self.config.context, 0))
+
+        def _widths(mc):
+            return [mc, max(self.columns() - 10 - mc, len(ColorCat.escape_ansi(title)) + 2)]
+
+        out = sys.stdout
+        mc = 3
+        widths = None
+        try:
+            if self.config.simple:
+                pass
+            elif self.config.no_tab:
+                out.write(ColorCat.no_tab_header(title) + '\n')
+            else:
+                widths = _widths(mc)
+                out.write(''.join('%s\n' % l for l in Table.header(['', title], widths)))
+            out.flush()
+
+            for reason, lines in batches:
+                text = []
+                if reason is not None:
+                    Logger.pl('{!} {O}%s: file %s, following it from the beginning{W}' % (
+                        self.config.filename, reason), out=sys.stderr)
+                    context.clear()
+                    reference.clear()
+                    # '...' row where the numbers restart
+                    dot_line = ColorCat.format_line_number('...', mc)
+                    if self.config.no_tab:
+                        text.append(Color.t('  {W}%s{W}  ') % dot_line)
+                    elif widths is not None:
+                        text.append(Table.row([Color.t('  {W}%s{W} ') % dot_line, ''], widths))
+
+                if self.jsonl:
+                    ldata = list(self.highlight_records(lines, formatter))
+                else:
+                    ldata = self.lex(list(context), lines, formatter, reference=list(reference))
+                    context.extend(l for _, l in lines)
+                    if self.config.highlight_ranges:
+                        # dimmed lines are not a reference
+                        reference.clear()
+                    else:
+                        reference.extend(l for _, l in ldata)
+
+                if self.config.simple:
+                    text += (l for _, l in ldata)
+                elif len(ldata) > 0:
+                    if len(f'{ldata[-1][0]}') > mc:
+                        mc = len(f'{ldata[-1][0]}')
+                        if widths is not None:
+                            widths = _widths(mc)
+                            text.append(Table.separator(widths))
+
+                    if self.config.no_tab:
+                        text += self.no_tab_rows(ldata, mc)
+                    else:
+                        text += (Table.row(cells, widths) for cells in self.table_rows(ldata, mc))
+
+                if len(text) > 0:
+                    out.write(''.join('%s\n' % l for l in text))
+                    out.flush()
+
+            if widths is not None:
+                out.write(Table.bottom(widths) + '\n')
+            out.flush()
+
+        except KeyboardInterrupt:
+            # the usual way out of the follow mode
+            if widths is not None:
+                out.write(Table.bottom(widths) + '\n')
+        except BrokenPipeError:
+            pass
 
-            try:
-                self.lexer = get_lexer_for_filename(Configuration.filename)
-            except Exception:
-                self.lexer = None
+    def run(self):
 
-            with open(Configuration.filename, 'rb') as f:
-                data = f.read()
+        try:
 
-            self.print_formatted(data=data, title=Color.s('{O}File: {G}%s{W}' % Configuration.filename))
+            if Configuration.lexer is not None:
+                self.lexer = Configuration.get_lexer(Configuration.lexer)
+            else:
+                try:
+                    self.lexer = LexerIndex.get_lexer(Configuration.filename, Configuration.cache_dir)
+                except Exception:
+                    self.lexer = None
+
+            if Configuration.filename == Configuration.STDIN:
+                self._print(lambda: self.read_stdin(Color.t('{O}File: {G}%s{W}') % 'stdin'))
+            else:
+                title = Color.t('{O}File: {G}%s{W}') % Configuration.filename
+                with open(Configuration.filename, 'rb') as f:
+                    Configuration.compile_ranges()
+                    compression = Compression.detect(f)
+                    if compression is not None:
+                        self.print_compressed(f, compression, title)
+                        source = False
+                    elif Configuration.follow:
+                        if self.lexer is None:
+                            self.guess_file_lexer(f)
+                        self._print(lambda: self.follow(title))
+                        source = False
+                    elif self.print_cached(f, title):
+                        source = False
+                    else:
+                        if self.lexer is None:
+                            self.guess_file_lexer(f)
+                        source = self.seek_lines(f)
+                    if source:
+                        self.print_lines(source[0], title, source[1])
+                    elif source is None:
+                        f.seek(0)
+                        self.print_stream(
+                            chunks=Stream.read(f, Configuration.chunk_size),
+                            title=title,
+                            count_lines=lambda chars=(b'\n',): Configuration.count_file_lines(Configuration.filename, chars))
 
         except Exception as e:
             Color.pl("\n{!} {R}Error: {O}%s" % str(e))
@@ -346,7 +1250,12 @@ class ColorCat(object):
         except KeyboardInterrupt as e:
             raise e
 
-        Color.pl(' ')
+        if not Configuration.quiet:
+            Color.pl(' ')
+
+    def columns(self) -> int:
+        ''' Width of the output: the one of the options, or the terminal one '''
+        return self.config.columns or ColorCat.get_columns()
 
     @staticmethod
     def get_columns():
@@ -365,7 +1274,7 @@ class ColorCat(object):
 
     @staticmethod
     def format_line(text: str, number_line: int, max_cols: int = 200) -> str:
-        tab = 2
+        ''' Wraps the line of the no tab mode, the continuation rows aligned after the line number '''
         try:
             max_cols = int(max_cols)
         except Exception:
@@ -373,62 +1282,60 @@ class ColorCat(object):
 
         if max_cols < 50:
             max_cols = 50
-        if len(ColorCat.escape_ansi(text)) < max_cols:
-            return text
 
-        text = text.replace('\t', ' ' * tab)
+        # one column is kept for the space before each break
+        chunks = Ansi.wrap(text, max_cols - number_line - 1)
+        return (' \n' + ' ' * number_line).join(chunks)
+
+
+def render(data: Union[bytes, bytearray, str], *, options: Options = None, title: str = '',
+           stream: bool = False) -> Union[str, Iterator[str]]:
+    '''
+        Library API: returns the rendered text of data (the same output as the command line,
+        with a line break after each line), without printing it or reading Configuration.
+        With stream, returns an iterator of the output lines, rendered as they are consumed.
+        An empty document renders as nothing.
+
+        The calls only share read-only caches (styles, formatters, lexer classes), so render
+        can be called from any number of threads with the same or different options.
+    '''
+    if options is None:
+        options = Options()
+
+    if isinstance(data, str):
+        data = data.encode('UTF-8')
+
+    o = ColorCat(options)
+    o.lexer = options.new_lexer()
+    if o.lexer is None and options.filename is not None:
+        o.lexer = LexerIndex.get_lexer(options.filename, Configuration.cache_dir)
+
+    def _lines():
         try:
-            parts = []
-            escaped_text = ColorCat.escape_ansi(text)
-            diff = (len(escaped_text) - len(escaped_text.lstrip()))
-            start = text.index(escaped_text.lstrip()[0]) - diff
-
-            if start > 0:
-                parts.append(text[0:start])
-
-            pattern = re.compile(r'(\x9B|\x1B\[)[0-?]*[ -/]*[@-~]')
-            ansi_codes = [
-                (m.start(), m.end())
-                for m in pattern.finditer(text)
-            ]
-
-            c = max_cols
-            o = start
-            size = max_cols
-            first_line = True
-            while c <= len(text):
-                p = text[o:c]
-                while len(ColorCat.escape_ansi(p)) + number_line + diff < size:
-                    c += 1
-                    p = text[o:c]
-                    if o + c >= len(text):
-                        break
-                (idxs, idxe) = next((
-                    a for a in ansi_codes
-                    if a[0] <= c <= a[1]
-                ), (None, None))
-                if idxs is not None:
-                    c = idxe
-                p = text[o:c]
-                if first_line:
-                    size = max_cols - diff - tab
-                    first_line = False
-                else:
-                    parts.append(' \n' + (' ' * (number_line + diff + tab)))
-                o = c
-                c += size - 4
-                parts.append(p)
+            yield from o.render(
+                chunks=Stream.slices(data, options.chunk_size),
+                title=title,
+                count_lines=lambda chars=(b'\n',): sum(data.count(c) for c in chars) + 1)
+        except EmptyDocument:
+            return
 
-            if o < len(text):
-                parts.append(' \n' + (' ' * (number_line + diff + tab)))
-                parts.append(text[o:])
+    if stream:
+        return _lines()
+    return ''.join('%s\n' % l for l in _lines())
 
-            return ''.join(parts)
-        except Exception:
-            return text
+
+def render_image(data: Union[bytes, bytearray, str], *, options: Options = None, title: str = '',
+                 format: str = 'png') -> bytes:
+    ''' Library API: the output of render as an image file (png or jpeg), ValueError if the document is empty '''
+    text = render(data, options=options, title=title)
+    if text == '':
+        raise ValueError('the document is empty')
+    return ColorCat.image(text[:-1], format)
 
 
 def run():
+    Color.init()
+
     # Explicitly changing the stdout encoding format
     if sys.stdout.encoding is None:
         # Output is redirected to a file
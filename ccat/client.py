@@ -0,0 +1,136 @@
+#!/usr/bin/python3
+# -*- coding: UTF-8 -*-
+import json
+import os
+import signal
+import socket
+import struct
+import sys
+from array import array
+from typing import Union
+
+from .__meta__ import __version__
+
+
+class Client(object):
+    '''
+        Thin client of the render daemon (ccat --daemon), the ccat command itself.
+
+        It only imports the standard library: the arguments, working directory and
+        the variables of ENV are sent over the daemon Unix socket along with the
+        standard input, output and error descriptors, so the daemon renders straight
+        to the terminal (or pipe) of the client, using its width, and only returns the
+        exit code. Without daemon (or with one of another version, or of another user)
+        the file is rendered in this process.
+    '''
+
+    # environment of the client the rendering depends on, the only part sent to the daemon
+    ENV = ('HOME', 'PATH', 'TERM', 'COLUMNS', 'LINES', 'LANG', 'LC_ALL', 'LC_CTYPE', 'TZ', 'XDG_CACHE_HOME')
+
+    @staticmethod
+    def path() -> str:
+        ''' Path of the daemon socket, one per user '''
+        directory = os.environ.get('XDG_RUNTIME_DIR') or os.environ.get('TMPDIR') or '/tmp'
+        return os.path.join(directory, 'ccat-%d.sock' % os.getuid())
+
+    @staticmethod
+    def supported() -> bool:
+        return hasattr(socket, 'AF_UNIX') and hasattr(socket, 'SCM_RIGHTS') and hasattr(os, 'fork')
+
+    @staticmethod
+    def owner(sock: socket.socket, path: str = None) -> Union[int, None]:
+        '''
+            User id of the process at the other end of a Unix socket. Without SO_PEERCRED,
+            the owner of the socket file at path (None if there is no such file).
+        '''
+        if hasattr(socket, 'SO_PEERCRED'):
+            creds = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i'))
+            _, uid, _ = struct.unpack('3i', creds)
+            return uid
+
+        try:
+            return os.lstat(path).st_uid if path is not None else None
+        except OSError:
+            return None
+
+    @staticmethod
+    def connect() -> Union[socket.socket, None]:
+        '''
+            Connection to the running daemon, None if there is none. A socket of another
+            user (e.g. created first in a shared /tmp) is not used: it would get the
+            descriptors and the environment of the client.
+        '''
+        if not Client.supported():
+            return None
+
+        path = Client.path()
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(path)
+            if Client.owner(sock, path) != os.getuid():
+                sock.close()
+                return None
+        except OSError:
+            sock.close()
+            return None
+        return sock
+
+    @staticmethod
+    def forward(argv: list) -> Union[int, None]:
+        '''
+            Renders argv in the daemon, returning the exit code. None if there is no daemon
+            or it declined the request (nothing was written then).
+        '''
+        sock = Client.connect()
+        if sock is None:
+            return None
+
+        with sock:
+            try:
+                header = json.dumps({
+                    'version': __version__,
+                    'argv': argv,
+                    'cwd': os.getcwd(),
+                    'env': {k: v for k, v in os.environ.items() if k in Client.ENV},
+                }).encode('UTF-8', 'surrogateescape')
+                data = struct.pack('!I', len(header)) + header
+                sent = sock.sendmsg([data], [(socket.SOL_SOCKET, socket.SCM_RIGHTS, array('i', [0, 1, 2]))])
+                sock.sendall(data[sent:])
+                reply = sock.makefile('rb')
+                status = reply.readline().split()
+            except OSError:
+                return None
+
+            # declined (e.g. another version), or the daemon stopped
+            if len(status) != 2 or status[0] != b'pid':
+                return None
+
+            pid = int(status[1])
+            while True:
+                try:
+                    status = reply.readline().split()
+                    break
+                except KeyboardInterrupt:
+                    # the daemon is not in the process group of the terminal
+                    try:
+                        os.kill(pid, signal.SIGINT)
+                    except OSError:
+                        break
+                except OSError:
+                    break
+
+            if len(status) != 2 or status[0] != b'exit':
+                return 1
+            return int(status[1])
+
+
+def run():
+    ''' Entry point of the ccat command '''
+    if '--daemon' not in sys.argv[1:]:
+        code = Client.forward(sys.argv[1:])
+        if code is not None:
+            sys.exit(code)
+
+    from .ccat import run as render
+
+    render()
@@ -0,0 +1,77 @@
+#!/usr/bin/python3
+# -*- coding: UTF-8 -*-
+import os
+from typing import BinaryIO, Iterator, Union
+
+
+class Compression(object):
+    '''
+        Compressed files (gzip, bzip2, xz), detected by their magic bytes.
+
+        The files are decompressed as they are read, one chunk at a time (concatenated
+        streams, like the ones of rotated logs, included), so they are never inflated
+        in memory.
+    '''
+
+    MAGIC = (
+        (b'\x1f\x8b', 'gzip'),
+        (b'BZh', 'bzip2'),
+        (b'\xfd7zXZ\x00', 'xz'),
+    )
+    EXTENSIONS = ('.gz', '.bz2', '.xz')
+
+    @staticmethod
+    def detect(fp: BinaryIO) -> Union[str, None]:
+        ''' Name of the compression of the open binary file (None if not compressed), fp is not moved '''
+        pos = fp.tell()
+        header = fp.read(6)
+        fp.seek(pos)
+        return next((name for magic, name in Compression.MAGIC if header.startswith(magic)), None)
+
+    @staticmethod
+    def detect_file(filename: str) -> Union[str, None]:
+        try:
+            with open(filename, 'rb') as fp:
+                return Compression.detect(fp)
+        except OSError:
+            return None
+
+    @staticmethod
+    def inner_name(filename: str) -> str:
+        ''' Name of the decompressed file: app.log.gz -> app.log '''
+        name, ext = os.path.splitext(filename)
+        return name if ext.lower() in Compression.EXTENSIONS else filename
+
+    @staticmethod
+    def open(fp: BinaryIO, compression: str) -> BinaryIO:
+        ''' Decompressing reader of the open binary file '''
+        if compression == 'gzip':
+            import gzip
+
+            return gzip.GzipFile(fileobj=fp, mode='rb')
+        elif compression == 'bzip2':
+            import bz2
+
+            return bz2.BZ2File(fp, mode='rb')
+        elif compression == 'xz':
+            import lzma
+
+            return lzma.LZMAFile(fp, mode='rb')
+
+        raise ValueError('unsupported compression %s' % compression)
+
+    @staticmethod
+    def read(fp: BinaryIO, compression: str, chunk_size: int = 1024 * 1024, strict: bool = True) -> Iterator[bytes]:
+        '''
+            Yields decompressed chunks of at most chunk_size bytes. A truncated file (e.g. still
+            being compressed) raises EOFError after its last chunk, unless not strict.
+        '''
+        with Compression.open(fp, compression) as reader:
+            try:
+                b = reader.read1(chunk_size)
+                while b:
+                    yield b
+                    b = reader.read1(chunk_size)
+            except EOFError:
+                if strict:
+                    raise
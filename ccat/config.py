@@ -1,38 +1,74 @@
 #!/usr/bin/python3
 # -*- coding: UTF-8 -*-
 import errno
+import glob
 import os
 import sys
 from pathlib import Path
+from typing import Union
 
+from .compression import Compression
+from .util.lineindex import LineIndex
 from .util.logger import Logger
+from .util.ranges import LineRanges
 from .__meta__ import __version__
 
-try:
-    from pygments.styles import get_style_by_name
-except (ValueError, ImportError):
-    Logger.pl('{!} {R}Error: library {O}pygments{R} not found{W}\n     Install with {O}pip3 install Pygments{W} command.')
-    sys.exit(3)
-
 _FORMATS = ['jpg', 'jpeg', 'png']
 
+# values copied to the worker processes of the multi-file mode
+_SNAPSHOT = [
+    'version', 'name', 'verbose', 'jobs', 'simple', 'no_tab', 'jsonl', 'style', 'lexer', 'lines', 'highlight_lines',
+    'head', 'tail', 'out_file', 'format', 'window', 'context', 'guess_size', 'chunk_size', 'cache_dir', 'index',
+    'index_min_size', 'cache', 'cache_size', 'cache_max_file', 'lines_per_image', 'max_image_height', 'quiet',
+]
+
 
 class Configuration(object):
     ''' Stores configuration variables and functions for Tfileindexer. '''
     version = '0.0.0'
     name = ""
 
+    # file name of the standard input
+    STDIN = '-'
+
     initialized = False # Flag indicating config has been initialized
     verbose = 0
     filename = None
+    filenames = []
+    jobs = 0
     cmd_line = ''
     simple = False
     no_tab = False
+    jsonl = False
+    follow = False
+    daemon = False
+    # output width, None for the one of the terminal
+    columns = None
     style = None
+    lexer = None
     lines = []
     highlight_lines = []
+    head = None
+    tail = None
+    line_ranges = None
+    highlight_ranges = None
     out_file = None
     format = ''
+    # lines by image of the image output, 0 for a single image
+    lines_per_image = 0
+    # pixels, above it the image output has to be split with --lines-per-image
+    max_image_height = 65000
+    quiet = False
+    window = 5000
+    context = 100
+    guess_size = 16 * 1024
+    chunk_size = 1024 * 1024
+    cache_dir = None
+    index = True
+    index_min_size = 8 * 1024 * 1024
+    cache = False
+    cache_size = 256 * 1024 * 1024
+    cache_max_file = 64 * 1024 * 1024
 
     @staticmethod
     def initialize(parse_arguments=True):
@@ -58,8 +94,50 @@ class Configuration(object):
         if parse_arguments:
             Configuration.load_from_arguments()
 
+        if Configuration.style is None:
+            Configuration.style = Configuration.get_style("gruvbox-dark")
+
+    @staticmethod
+    def get_style(name: str):
+        ''' Resolves a pygments style, importing pygments only when something is rendered '''
+        try:
+            from pygments.styles import get_style_by_name
+        except (ValueError, ImportError):
+            Logger.pl('{!} {R}Error: library {O}pygments{R} not found{W}\n     Install with {O}pip3 install Pygments{W} command.')
+            sys.exit(3)
+
+        return get_style_by_name(name)
+
+    @staticmethod
+    def get_lexer(name: str):
+        ''' Resolves the --lexer name (a pygments lexer alias) '''
+        from pygments.lexers import get_lexer_by_name
+
+        return get_lexer_by_name(name)
+
     @staticmethod
-    def count_file_lines(filename: str):
+    def get_line_index(filename: str):
+        ''' Returns the persistent line offset index of big files (None if disabled or not applicable) '''
+        if not Configuration.index or filename is None:
+            return None
+
+        try:
+            if not os.path.isfile(filename) or os.path.getsize(filename) < Configuration.index_min_size:
+                return None
+            if Compression.detect_file(filename) is not None:
+                # the offsets would be the ones of the compressed bytes
+                return None
+            return LineIndex.open(filename, Configuration.cache_dir, Configuration.chunk_size)
+        except OSError:
+            return None
+
+    @staticmethod
+    def count_file_lines(filename: str, chars: tuple = (b'\n',)):
+        ''' Number of lines (chars are the bytes counted as line breaks) '''
+        index = Configuration.get_line_index(filename) if chars == (b'\n',) else None
+        if index is not None:
+            return len(index)
+
         def _count_generator(reader):
             b = reader(1024 * 1024)
             while b:
@@ -67,17 +145,103 @@ class Configuration(object):
                 b = reader(1024 * 1024)
 
         with open(filename, 'rb') as fp:
+            compression = Compression.detect(fp)
+            if compression is not None:
+                # the decompressed lines, decompressing the file once more
+                return sum(buffer.count(c) for buffer in Compression.read(fp, compression, strict=False) for c in chars) + 1
+
             c_generator = _count_generator(fp.raw.read)
             # count each \n
-            count = sum(buffer.count(b'\n') for buffer in c_generator)
+            count = sum(buffer.count(c) for buffer in c_generator for c in chars)
             return count + 1
 
+    @staticmethod
+    def expand_filenames(names: list) -> list:
+        '''
+            Expands directories (recursively, skipping hidden entries) and glob patterns,
+            keeping the argument order. Names that match nothing are kept, so the error
+            is reported in place.
+        '''
+        filenames = []
+        for name in names:
+            if name is None or name.strip() == '':
+                continue
+
+            if os.path.isdir(name):
+                for root, dirs, files in os.walk(name):
+                    dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+                    filenames += [os.path.join(root, f) for f in sorted(files) if not f.startswith('.')]
+            elif not os.path.exists(name) and glob.has_magic(name):
+                matches = sorted(glob.glob(name, recursive=True))
+                filenames += Configuration.expand_filenames(matches) if len(matches) > 0 else [name]
+            else:
+                filenames.append(name)
+
+        return filenames
+
+    @staticmethod
+    def check_file(filename: str) -> Union[str, None]:
+        ''' Returns the error message if filename can not be read '''
+        if filename == Configuration.STDIN:
+            return None
+
+        if not os.path.isfile(filename):
+            return '{!} {R}error: filename does not exists {O}%s{R} {W}\r\n' % filename
+
+        try:
+            with open(filename, 'r'):
+                # file opened only to check it is readable
+                pass
+        except IOError as x:
+            if x.errno == errno.EACCES:
+                return '{!} {R}Error: could not open file {O}permission denied{R}{W}\r\n'
+            elif x.errno == errno.EISDIR:
+                return '{!} {R}Error: could not open file {O}it is an directory{R}{W}\r\n'
+            else:
+                return '{!} {R}Error: could not openfile {W}\r\n'
+
+        return None
+
+    @staticmethod
+    def snapshot() -> dict:
+        ''' Picklable copy of the values used to render, restored in worker processes '''
+        return {k: getattr(Configuration, k) for k in _SNAPSHOT}
+
+    @staticmethod
+    def restore(values: dict):
+        Configuration.initialized = True
+        for k, v in values.items():
+            setattr(Configuration, k, v)
+        Configuration.compile_ranges()
+
+    @staticmethod
+    def compile_ranges():
+        ''' Compiles the lines and highlight_lines filters into interval indexes '''
+        Configuration.line_ranges = LineRanges(Configuration.lines)
+        Configuration.highlight_ranges = LineRanges(Configuration.highlight_lines)
+
     @staticmethod
     def load_defaults():
         Configuration.verbose = 1
         Configuration.simple = False
         Configuration.no_tab = False
-        Configuration.style = get_style_by_name("gruvbox-dark")
+        Configuration.jsonl = False
+        Configuration.follow = False
+        Configuration.daemon = False
+        Configuration.quiet = False
+        Configuration.lines_per_image = 0
+        Configuration.head = None
+        Configuration.tail = None
+        Configuration.style = None
+        Configuration.lexer = None
+        Configuration.window = 5000
+        Configuration.context = 100
+        Configuration.guess_size = 16 * 1024
+        Configuration.chunk_size = 1024 * 1024
+        Configuration.cache_dir = os.path.join(
+            os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache')), 'ccat')
+        Configuration.index = True
+        Configuration.cache = False
 
     @staticmethod
     def load_from_arguments():
@@ -96,48 +260,110 @@ class Configuration(object):
             Configuration.cmd_line += "%s " % a
 
         Configuration.verbose = args.args.v
-        Configuration.filename = args.args.filename
 
-        if Configuration.filename is None or Configuration.filename.strip() == '':
-            Logger.pl('{!} {R}error: filename is invalid {O}%s{R} {W}\r\n' % (
-                args.args.config_file))
-            exit(1)
+        if args.args.daemon:
+            # no file: the files are the ones of the requests
+            Configuration.daemon = True
+            return
 
-        if not os.path.isfile(Configuration.filename):
-            Logger.pl('{!} {R}error: filename does not exists {O}%s{R} {W}\r\n' % (
-                Configuration.filename))
+        Configuration.filenames = Configuration.expand_filenames(args.args.filename)
+
+        # no file name: read the standard input, unless it is the terminal
+        if len(args.args.filename) == 0 and not sys.stdin.isatty():
+            Configuration.filenames = [Configuration.STDIN]
+
+        if len(Configuration.filenames) == 0:
+            Logger.pl('{!} {R}error: filename is invalid {O}%s{R} {W}\r\n' % (
+                ' '.join(args.args.filename)))
             exit(1)
 
-        try:
-            with open(Configuration.filename, 'r'):
-                # file opened only to check it is readable
-                pass
-        except IOError as x:
-            if x.errno == errno.EACCES:
-                Logger.pl('{!} {R}Error: could not open file {O}permission denied{R}{W}\r\n')
-                sys.exit(1)
-            elif x.errno == errno.EISDIR:
-                Logger.pl('{!} {R}Error: could not open file {O}it is an directory{R}{W}\r\n')
-                sys.exit(1)
-            else:
-                Logger.pl('{!} {R}Error: could not openfile {W}\r\n')
+        if len(Configuration.filenames) == 1:
+            Configuration.filename = Configuration.filenames[0]
+            error = Configuration.check_file(Configuration.filename)
+            if error is not None:
+                Logger.pl(error)
                 sys.exit(1)
 
-        fs = os.path.getsize(Configuration.filename)
-        if fs > (1024 * 1024 * 100):
-            Logger.pl("\n{!} {R}Error: File is to big. The maxim supported file size is 500MB{W}")
-            sys.exit(2)
+        if args.args.jobs < 0:
+            Logger.pl('{!} {R}error: invalid number of jobs {O}%s{R} {W}\r\n' % (
+                args.args.jobs))
+            exit(1)
 
-        lc = Configuration.count_file_lines(Configuration.filename)
-        if lc > 1000000:
-            Logger.pl("\n{!} {R}Error: File is to big. The maxim supported file lines size is 1.000.000{W}")
-            sys.exit(2)
+        Configuration.jobs = args.args.jobs
 
         Configuration.simple = args.args.simple
         Configuration.no_tab = args.args.no_tab
+        Configuration.jsonl = args.args.jsonl
+        Configuration.follow = args.args.follow
+
+        if Configuration.follow and len(Configuration.filenames) > 1:
+            Logger.pl('{!} {R}error: follow mode is only supported with a single file {W}\r\n')
+            exit(1)
+
+        if Configuration.follow and Compression.detect_file(Configuration.filename) is not None:
+            Logger.pl('{!} {R}error: follow mode is not supported with compressed files {W}\r\n')
+            exit(1)
+
+        for name in ('head', 'tail'):
+            if getattr(args.args, name) is not None and getattr(args.args, name) < 1:
+                Logger.pl('{!} {R}error: invalid number of lines {O}%s{R}, it must be greater than zero {W}\r\n' % (
+                    getattr(args.args, name)))
+                exit(1)
+
+        if args.args.head is not None and args.args.tail is not None:
+            Logger.pl('{!} {R}error: --head and --tail can not be used together {W}\r\n')
+            exit(1)
+
+        if args.args.head is not None and Configuration.follow:
+            Logger.pl('{!} {R}error: --head is not supported in follow mode {W}\r\n')
+            exit(1)
+
+        Configuration.head = args.args.head
+        Configuration.tail = args.args.tail
+
+        if args.args.window < 1:
+            Logger.pl('{!} {R}error: invalid window size {O}%s{R}, it must be greater than zero {W}\r\n' % (
+                args.args.window))
+            exit(1)
+
+        Configuration.window = args.args.window
+
+        if args.args.context < 0:
+            Logger.pl('{!} {R}error: invalid context size {O}%s{R}, it must be zero or greater {W}\r\n' % (
+                args.args.context))
+            exit(1)
+
+        Configuration.context = args.args.context
+
+        if args.args.guess_size < 1:
+            Logger.pl('{!} {R}error: invalid guess size {O}%s{R}, it must be greater than zero {W}\r\n' % (
+                args.args.guess_size))
+            exit(1)
+
+        Configuration.guess_size = args.args.guess_size
+        Configuration.index = args.args.index
+        Configuration.cache = args.args.cache
+
+        if args.args.cache_dir is not None and args.args.cache_dir.strip() != '':
+            if os.path.exists(args.args.cache_dir) and not os.path.isdir(args.args.cache_dir):
+                Logger.pl('{!} {R}error: invalid cache directory {O}%s{R} {W}\r\n' % (
+                    args.args.cache_dir))
+                exit(1)
+
+            Configuration.cache_dir = args.args.cache_dir
+
+        if args.args.lexer is not None and args.args.lexer.strip() != '':
+            try:
+                Configuration.get_lexer(args.args.lexer)
+            except Exception:
+                Logger.pl('{!} {R}error: invalid lexer name {O}%s{R}{W}\n     {W}{D}Check available lexers at https://pygments.org/docs/lexers/{W}\r\n' % (
+                    args.args.lexer))
+                exit(1)
+
+            Configuration.lexer = args.args.lexer
 
         try:
-            Configuration.style = get_style_by_name(args.args.style)
+            Configuration.style = Configuration.get_style(args.args.style)
         except Exception as e:
             Logger.pl('{!} {R}Error selecting style {O}%s{R}: {G}%s{W}\n     {W}{D}Check available styles at https://pygments.org/styles/{W}' % (args.args.style, str(e)), out=sys.stderr)
             sys.exit(1)
@@ -198,6 +424,8 @@ class Configuration(object):
 
             Configuration.highlight_lines.sort(key=lambda x: x[0])
 
+        Configuration.compile_ranges()
+
         if args.args.out_file is not None and args.args.out_file.strip() != '':
 
             if os.path.isdir(args.args.out_file):
@@ -205,6 +433,14 @@ class Configuration(object):
                     args.args.out_file))
                 exit(1)
 
+            if len(Configuration.filenames) > 1:
+                Logger.pl('{!} {R}error: image output is only supported with a single file {W}\r\n')
+                exit(1)
+
+            if Configuration.follow:
+                Logger.pl('{!} {R}error: image output is not supported in follow mode {W}\r\n')
+                exit(1)
+
             Configuration.out_file = args.args.out_file
             fmt = Path(Configuration.out_file).suffix.strip('. ').lower()
 
@@ -216,3 +452,126 @@ class Configuration(object):
             Configuration.format = fmt.lower()
             if Configuration.format == 'jpg':
                 Configuration.format = 'jpeg'
+
+        if args.args.lines_per_image is not None:
+            if Configuration.out_file is None:
+                Logger.pl('{!} {R}error: {O}--lines-per-image{R} requires the image output ({O}--output-img{R}) {W}\r\n')
+                exit(1)
+
+            if args.args.lines_per_image <= 0:
+                Logger.pl('{!} {R}error: invalid number of lines per image {O}%s{R} {W}\r\n' % (
+                    args.args.lines_per_image))
+                exit(1)
+
+            from .images import Canvas
+
+            fit = Canvas.fit(Configuration.max_image_height)
+            if args.args.lines_per_image > fit:
+                Logger.pl('{!} {R}error: at most {O}%d{R} lines fit in an image of {O}%d{R} pixels {W}\r\n' % (
+                    fit, Configuration.max_image_height))
+                exit(1)
+
+            Configuration.lines_per_image = args.args.lines_per_image
+
+        if args.args.quiet:
+            if Configuration.out_file is None:
+                Logger.pl('{!} {R}error: {O}--quiet{R} is only supported with the image output ({O}--output-img{R}) {W}\r\n')
+                exit(1)
+
+            Configuration.quiet = True
+
+
+class Options(object):
+    '''
+        Immutable rendering options of the library API (see ccat.ccat.render), the per call
+        counterpart of the Configuration values: the render stages read the same names from
+        either one. The style and the lexer are resolved and the line filters compiled on
+        creation, so the same Options can be used by any number of threads at once.
+
+        filename is only used to pick the lexer (by its extension) and to detect JSON Lines.
+    '''
+
+    __slots__ = ('simple', 'no_tab', 'jsonl', 'style', 'lexer', 'lines', 'highlight_lines', 'head', 'tail',
+                 'columns', 'window', 'context', 'guess_size', 'jobs', 'filename', 'line_ranges',
+                 'highlight_ranges', '_lexer')
+
+    # command line only values, fixed for in memory documents
+    verbose = 0
+    out_file = None
+    follow = False
+    cache = False
+    cache_dir = None
+    index = False
+    chunk_size = 1024 * 1024
+
+    # resolved styles, shared by every Options
+    _styles = {}
+
+    def __init__(self, simple: bool = False, no_tab: bool = False, jsonl: bool = False,
+                 style='gruvbox-dark', lexer: str = None, lines: list = (), highlight_lines: list = (),
+                 head: int = None, tail: int = None, columns: int = 120, window: int = 5000,
+                 context: int = 100, guess_size: int = 16 * 1024, jobs: int = 1, filename: str = None):
+        for name, value in (('head', head), ('tail', tail), ('columns', columns), ('window', window),
+                            ('guess_size', guess_size)):
+            if value is not None and value < 1:
+                raise ValueError('invalid %s %s, it must be greater than zero' % (name, value))
+        if context < 0:
+            raise ValueError('invalid context %s, it must be zero or greater' % context)
+        if jobs < 0:
+            raise ValueError('invalid number of jobs %s' % jobs)
+        if head is not None and tail is not None:
+            raise ValueError('head and tail can not be used together')
+
+        if isinstance(style, str):
+            name = style
+            style = Options._styles.get(name)
+            if style is None:
+                style = Options._styles[name] = Configuration.get_style(name)
+
+        _set = super().__setattr__
+        _set('simple', simple)
+        _set('no_tab', no_tab)
+        _set('jsonl', jsonl)
+        _set('style', style)
+        _set('lexer', lexer)
+        _set('lines', tuple(sorted(lines)))
+        _set('highlight_lines', tuple(sorted(highlight_lines)))
+        _set('head', head)
+        _set('tail', tail)
+        _set('columns', columns)
+        _set('window', window)
+        _set('context', context)
+        _set('guess_size', guess_size)
+        _set('jobs', jobs)
+        _set('filename', filename)
+        _set('line_ranges', LineRanges(self.lines))
+        _set('highlight_ranges', LineRanges(self.highlight_lines))
+        _set('_lexer', type(Configuration.get_lexer(lexer)) if lexer is not None else None)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Options are immutable, use replace()')
+
+    def __repr__(self):
+        return 'Options(%s)' % ', '.join('%s=%r' % kv for kv in self.values().items())
+
+    def values(self) -> dict:
+        ''' The arguments the options were created with (the style resolved) '''
+        return {k: getattr(self, k) for k in self.__slots__ if k[0] != '_' and not k.endswith('_ranges')}
+
+    def replace(self, **kwargs) -> 'Options':
+        ''' Copy of the options with the given values changed '''
+        values = self.values()
+        values.update(kwargs)
+        return Options(**values)
+
+    def __reduce__(self):
+        # pickled for the worker processes (see ccat.aio) by their arguments
+        return Options, tuple(self.values().values())
+
+    def compile_ranges(self):
+        ''' The filters are compiled on creation '''
+        pass
+
+    def new_lexer(self):
+        ''' Instance of the lexer given by name (lexers are not shared between renders), None to guess it '''
+        return self._lexer() if self._lexer is not None else None
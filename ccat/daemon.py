@@ -0,0 +1,218 @@
+#!/usr/bin/python3
+# -*- coding: UTF-8 -*-
+import json
+import os
+import signal
+import socket
+import struct
+import sys
+from array import array
+from typing import Tuple, Union
+
+from .__meta__ import __version__
+from .client import Client
+from .config import Configuration
+from .util.color import Color
+from .util.logger import Logger
+
+
+class Daemon(object):
+    '''
+        Render daemon (ccat --daemon): a warm process (Pygments, the style, its SGR table
+        and the lexers loaded) listening on the Unix socket of Client.path.
+
+        Every request is rendered by a forked child, so the requests do not share any
+        state but what was loaded on start: the child takes the descriptors, arguments,
+        working directory and environment of the client and runs ccat the same way the
+        client would have. The child exits when the client goes away (e.g. killed while
+        following a file).
+    '''
+
+    # lexers imported on start (the lexer index and the guesser are loaded as well)
+    WARM = ('a.py', 'a.json', 'a.yaml', 'a.md', 'a.sh', 'a.js', 'a.html', 'a.xml', 'a.c', 'a.ini', 'a.log')
+    # size limit of the request (arguments, working directory and environment)
+    MAX_REQUEST = 1024 * 1024
+
+    @staticmethod
+    def warm():
+        ''' Loads what every invocation would load '''
+        from pygments.lexers import guess_lexer
+
+        from . import batch, follow, formatter, jsonlexer, pipe  # noqa: F401
+        from .util.lexers import LexerIndex
+
+        Color.init()
+        formatter.SGRFormatter.sgr_table(Configuration.style)
+        for name in Daemon.WARM:
+            LexerIndex.get_lexer(name, Configuration.cache_dir)
+
+        # imports the plugins and every lexer module
+        guess_lexer('ccat')
+
+    @staticmethod
+    def serve():
+        if not Client.supported():
+            Logger.pl('{!} {R}error: the daemon is not supported on this platform {W}\r\n')
+            exit(1)
+
+        path = Client.path()
+        sock = Client.connect()
+        if sock is not None:
+            sock.close()
+            Logger.pl('{!} {R}error: a daemon is already running at {O}%s{R} {W}\r\n' % path)
+            exit(1)
+
+        Daemon.warm()
+
+        # left behind by a daemon that was killed
+        if os.path.exists(path):
+            os.unlink(path)
+
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        umask = os.umask(0o177)
+        try:
+            server.bind(path)
+        finally:
+            os.umask(umask)
+        server.listen(128)
+
+        # the children are reaped by the system
+        signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+        Logger.pl('{+} {W}Daemon listening on {G}%s{W} (pid {G}%d{W})' % (path, os.getpid()))
+        try:
+            while True:
+                conn, _ = server.accept()
+                if not Daemon.allowed(conn):
+                    conn.close()
+                    continue
+
+                # raised in a fork hook, the SystemExit of SIGTERM would be ignored
+                signal.pthread_sigmask(signal.SIG_BLOCK, {signal.SIGTERM})
+                if os.fork() == 0:
+                    server.close()
+                    Daemon.handle(conn)
+                conn.close()
+                signal.pthread_sigmask(signal.SIG_UNBLOCK, {signal.SIGTERM})
+        finally:
+            server.close()
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+    @staticmethod
+    def allowed(conn: socket.socket) -> bool:
+        ''' Only the processes of the same user are served (the socket is only writable by it anyway) '''
+        if not hasattr(socket, 'SO_PEERCRED'):
+            return True
+
+        return Client.owner(conn) == os.getuid()
+
+    @staticmethod
+    def receive(conn: socket.socket) -> Tuple[Union[dict, None], list]:
+        ''' Reads the request: (header, [stdin, stdout, stderr] descriptors) '''
+        fds = array('i')
+        data, ancdata, _, _ = conn.recvmsg(64 * 1024, socket.CMSG_SPACE(3 * fds.itemsize))
+        for level, kind, payload in ancdata:
+            if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+                fds.frombytes(payload[:len(payload) - len(payload) % fds.itemsize])
+
+        if len(data) < 4:
+            return None, list(fds)
+        size = struct.unpack('!I', data[:4])[0]
+        if size > Daemon.MAX_REQUEST:
+            return None, list(fds)
+
+        chunks = [data[4:]]
+        received = len(data) - 4
+        while received < size:
+            chunk = conn.recv(size - received)
+            if not chunk:
+                return None, list(fds)
+            chunks.append(chunk)
+            received += len(chunk)
+
+        try:
+            return json.loads(b''.join(chunks).decode('UTF-8', 'surrogateescape')), list(fds)
+        except ValueError:
+            return None, list(fds)
+
+    @staticmethod
+    def watch(conn: socket.socket):
+        ''' Exits when the client closes the connection (SIGIO on the socket) '''
+        import fcntl
+
+        if not hasattr(fcntl, 'F_SETOWN') or not hasattr(os, 'O_ASYNC'):
+            return
+
+        def _closed(signum, frame):
+            try:
+                if conn.recv(1, socket.MSG_PEEK | socket.MSG_DONTWAIT) == b'':
+                    os._exit(1)
+            except BlockingIOError:
+                pass
+            except OSError:
+                os._exit(1)
+
+        signal.signal(signal.SIGIO, _closed)
+        fcntl.fcntl(conn.fileno(), fcntl.F_SETOWN, os.getpid())
+        fcntl.fcntl(conn.fileno(), fcntl.F_SETFL, fcntl.fcntl(conn.fileno(), fcntl.F_GETFL) | os.O_ASYNC)
+
+    @staticmethod
+    def handle(conn: socket.socket):
+        ''' Renders the request of conn in this (forked) process, never returns '''
+        code = 1
+        try:
+            signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.pthread_sigmask(signal.SIG_UNBLOCK, {signal.SIGTERM})
+            # the Ctrl+C of the client (ignored by daemons started in background)
+            signal.signal(signal.SIGINT, signal.default_int_handler)
+
+            request, fds = Daemon.receive(conn)
+            if request is None or request.get('version') != __version__ or len(fds) != 3:
+                # the client renders it
+                conn.sendall(b'reject\n')
+                os._exit(0)
+
+            Daemon.watch(conn)
+            for target, fd in enumerate(fds):
+                os.dup2(fd, target)
+                os.close(fd)
+
+            # line buffered on terminals, as the standard streams of the client
+            sys.stdin = open(0, 'r', encoding=sys.stdin.encoding, errors=sys.stdin.errors, closefd=False)
+            sys.stdout = open(1, 'w', buffering=1 if os.isatty(1) else -1, encoding=sys.stdout.encoding,
+                              errors=sys.stdout.errors, closefd=False)
+            sys.stderr = open(2, 'w', buffering=1, encoding=sys.stderr.encoding, errors=sys.stderr.errors,
+                              closefd=False)
+
+            os.chdir(request['cwd'])
+            os.environ.clear()
+            os.environ.update(request['env'])
+            sys.argv = ['ccat'] + request['argv']
+            Configuration.initialized = False
+            Configuration.cmd_line = ''
+
+            conn.sendall(b'pid %d\n' % os.getpid())
+
+            from .ccat import run
+
+            try:
+                run()
+                code = 0
+            except SystemExit as e:
+                code = e.code if isinstance(e.code, int) else int(e.code is not None)
+        finally:
+            try:
+                sys.stdout.flush()
+                sys.stderr.flush()
+            except (OSError, ValueError):
+                pass
+            try:
+                conn.sendall(b'exit %d\n' % code)
+            except OSError:
+                pass
+            os._exit(0)
@@ -0,0 +1,195 @@
+#!/usr/bin/python3
+# -*- coding: UTF-8 -*-
+import os
+import select
+import sys
+import time
+from bisect import bisect_right
+from typing import Iterator, List, Union
+
+from .stream import Stream
+
+
+class Follow(object):
+    '''
+        Source of the follow mode (-f): the last lines of a file, then the lines appended to it.
+
+        Only complete lines are returned (a last line without line break waits for it). The
+        changes are waited for with inotify where available (Linux, through ctypes), polling
+        otherwise. Either way the file is checked at least every INTERVAL seconds, so a
+        truncated file (smaller than what was read) or a replaced one (another inode at the
+        path, e.g. log rotation) is read again from its beginning, numbered from 1.
+    '''
+
+    # lines of the existing content rendered before following
+    LINES = 10
+    INTERVAL = 1.0
+
+    # inotify events
+    IN_MODIFY = 0x002
+    IN_ATTRIB = 0x004
+    IN_CLOSE_WRITE = 0x008
+    IN_MOVED_TO = 0x080
+    IN_CREATE = 0x100
+    IN_DELETE_SELF = 0x400
+    IN_MOVE_SELF = 0x800
+
+    def __init__(self, filename: str, chunk_size: int = 1024 * 1024):
+        self.filename = filename
+        self.chunk_size = chunk_size
+        self.fp = open(filename, 'rb')
+        self.inode = os.fstat(self.fp.fileno()).st_ino
+        self.number = 0
+        self.pending = b''
+        self._libc = None
+        self._inotify = None
+        self._watch()
+
+    def close(self):
+        self.fp.close()
+        if self._inotify is not None:
+            os.close(self._inotify)
+            self._inotify = None
+
+    def _watch(self):
+        ''' Adds inotify watches on the file and on its directory (new files at the path) '''
+        if not sys.platform.startswith('linux'):
+            return
+
+        try:
+            if self._inotify is None:
+                import ctypes
+
+                self._libc = ctypes.CDLL(None, use_errno=True)
+                fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+                if fd < 0:
+                    return
+                self._inotify = fd
+
+            self._libc.inotify_add_watch(
+                self._inotify, os.fsencode(self.filename),
+                Follow.IN_MODIFY | Follow.IN_ATTRIB | Follow.IN_CLOSE_WRITE | Follow.IN_DELETE_SELF | Follow.IN_MOVE_SELF)
+            self._libc.inotify_add_watch(
+                self._inotify, os.fsencode(os.path.dirname(os.path.abspath(self.filename))),
+                Follow.IN_CREATE | Follow.IN_MOVED_TO)
+        except (OSError, AttributeError):
+            if self._inotify is not None:
+                os.close(self._inotify)
+            self._inotify = None
+
+    @property
+    def inotify(self) -> bool:
+        return self._inotify is not None
+
+    def wait(self):
+        ''' Waits for an inotify event (or for INTERVAL seconds) '''
+        if self._inotify is None:
+            time.sleep(Follow.INTERVAL)
+            return
+
+        ready, _, _ = select.select([self._inotify], [], [], Follow.INTERVAL)
+        if len(ready) > 0:
+            try:
+                # the events themselves do not matter, the file is checked anyway
+                while os.read(self._inotify, 4096):
+                    pass
+            except BlockingIOError:
+                pass
+
+    def _lines(self, data: bytes) -> List[tuple]:
+        ''' Numbered lines of data (complete lines, without the last line break) '''
+        lines = list(Stream.split_lines(Stream.decode([data])))
+        first = self.number + 1
+        self.number += len(lines)
+        return list(zip(range(first, self.number + 1), lines))
+
+    def tail(self, count: int, index=None) -> List[tuple]:
+        '''
+            Returns the last count complete lines of the file as (number, line), leaving it read up
+            to its end. They are found reading the file backwards (see Stream.last_lines), the line
+            breaks before them are counted with the line index where it covers them (see LineIndex).
+        '''
+        # one more line: the last one may not be complete yet
+        start, _ = Stream.last_lines(self.fp, max(count, 0) + 1, self.chunk_size)
+        self.fp.seek(start)
+        data = self.fp.read()
+        end = data.rfind(b'\n')
+        self.pending = data[end + 1:]
+        if end < 0 or count <= 0:
+            self.number = self._breaks(start + end + 1, index)
+            lines = []
+        else:
+            lines = data[:end].split(b'\n')
+            skipped = lines[:-count]
+            lines = lines[-count:]
+            self.number = self._breaks(start + sum(len(l) + 1 for l in skipped), index)
+
+        # the appended data is read from there
+        self.fp.seek(start + len(data))
+        return self._lines(b'\n'.join(lines)) if len(lines) > 0 else []
+
+    def _breaks(self, end: int, index=None) -> int:
+        ''' Number of line breaks before the byte offset end '''
+        start = breaks = 0
+        if index is not None:
+            # the file may have grown since it was indexed
+            start = min(end, index.size)
+            breaks = bisect_right(index.offsets, start) - 1
+        return breaks + Stream.count_lines(self.fp, self.chunk_size, end, start) - 1
+
+    def read(self) -> List[tuple]:
+        ''' The complete lines appended since the last read (about chunk_size bytes at most) '''
+        data = self.pending
+        while True:
+            chunk = self.fp.read(self.chunk_size)
+            if not chunk:
+                self.pending = data
+                return []
+            data += chunk
+            if b'\n' in chunk:
+                break
+
+        end = data.rfind(b'\n')
+        self.pending = data[end + 1:]
+        return self._lines(data[:end])
+
+    def check(self) -> Union[str, None]:
+        ''' Returns why the file is read again from its beginning (truncated or replaced), if it is '''
+        try:
+            st = os.stat(self.filename)
+        except OSError:
+            # moved away, the new file is not there yet
+            return None
+
+        if st.st_ino != self.inode:
+            self.fp.close()
+            self.fp = open(self.filename, 'rb')
+            self.inode = os.fstat(self.fp.fileno()).st_ino
+            reason = 'replaced'
+            self._watch()
+        elif st.st_size < self.fp.tell():
+            self.fp.seek(0)
+            reason = 'truncated'
+        else:
+            return None
+
+        self.number = 0
+        self.pending = b''
+        return reason
+
+    def __iter__(self) -> Iterator[tuple]:
+        '''
+            Yields (reason, lines) for the lines appended to the file, reason is None or
+            why the numbers restarted from 1 (see check)
+        '''
+        while True:
+            lines = self.read()
+            if len(lines) > 0:
+                yield None, lines
+                continue
+
+            reason = self.check()
+            if reason is not None:
+                yield reason, self.read()
+            else:
+                self.wait()
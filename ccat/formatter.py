@@ -0,0 +1,119 @@
+#!/usr/bin/python3
+# -*- coding: UTF-8 -*-
+import re
+from typing import Callable, Iterable, Iterator, Tuple
+
+from pygments.formatter import Formatter
+
+
+class SGRFormatter(Formatter):
+    '''
+        256 colors terminal formatter yielding one finished line at a time.
+
+        The escape sequences are the same (byte for byte) as Terminal256Formatter
+        ones: its style -> SGR table is computed once per style and each token type
+        is resolved (walking up its parents) only once. Lines selected by the plain
+        callback are emitted as text wrapped in the dim sequences, without highlight.
+
+        Options: style, dim (prefix, suffix) of the plain lines.
+    '''
+
+    name = 'CCat SGR'
+    aliases = ['ccat']
+    filenames = []
+
+    _tables = {}
+    _escape = re.compile(r'(\x1b\[[\d;]*m)')
+
+    def __init__(self, **options):
+        Formatter.__init__(self, **options)
+        self.dim = options.get('dim', ('', ''))
+        self.table = SGRFormatter.sgr_table(self.style)
+        self.resolved = {}
+
+    @staticmethod
+    def sgr_table(style) -> dict:
+        ''' {token type name: (on, off)} of the style, shared by every formatter using it '''
+        table = SGRFormatter._tables.get(style)
+        if table is None:
+            from pygments.formatters.terminal256 import Terminal256Formatter
+
+            table = SGRFormatter._tables[style] = dict(Terminal256Formatter(style=style).style_string)
+        return table
+
+    def sgr(self, ttype) -> Tuple[str, str]:
+        sgr = self.resolved.get(ttype)
+        if sgr is None:
+            t = ttype
+            while t and str(t) not in self.table:
+                t = t.parent
+            # tokens without style are written as they are
+            sgr = self.resolved[ttype] = self.table[str(t)] if t else ('', '')
+        return sgr
+
+    def lines(self, tokensource: Iterable[tuple], plain: Callable[[int], bool] = None) -> Iterator[str]:
+        '''
+            Yields the formatted lines (without line break) of the token stream.
+            plain(index) tells if the line at that (0 based) index is dimmed.
+        '''
+        index = 0
+        dim = plain is not None and plain(0)
+        parts = [self.dim[0]] if dim else []
+        for ttype, value in tokensource:
+            on, off = self.sgr(ttype)
+            if '\n' not in value:
+                if value:
+                    if dim:
+                        parts.append(value)
+                    else:
+                        parts += (on, value, off)
+                continue
+
+            spl = value.split('\n')
+            for text in spl[:-1]:
+                if text:
+                    if dim:
+                        parts.append(text)
+                    else:
+                        parts += (on, text, off)
+                if dim:
+                    parts.append(self.dim[1])
+                yield ''.join(parts)
+
+                index += 1
+                dim = plain is not None and plain(index)
+                parts = [self.dim[0]] if dim else []
+
+            if spl[-1]:
+                if dim:
+                    parts.append(spl[-1])
+                else:
+                    parts += (on, spl[-1], off)
+
+        if dim:
+            parts.append(self.dim[1])
+        yield ''.join(parts)
+
+    @staticmethod
+    def runs(line: str) -> list:
+        '''
+            [(escape sequence, text)] of a formatted line, the same for lines displayed
+            the same even when lexed into other tokens (e.g. a string split in two)
+        '''
+        runs = []
+        sgr = ''
+        for i, part in enumerate(SGRFormatter._escape.split(line)):
+            if i % 2 == 1:
+                sgr = part
+            elif part:
+                if runs and runs[-1][0] == sgr:
+                    runs[-1] = (sgr, runs[-1][1] + part)
+                else:
+                    runs.append((sgr, part))
+        return runs
+
+    def format_unencoded(self, tokensource, outfile):
+        for i, line in enumerate(self.lines(tokensource)):
+            if i > 0:
+                outfile.write('\n')
+            outfile.write(line)
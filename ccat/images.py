@@ -0,0 +1,141 @@
+#!/usr/bin/python3
+# -*- coding: UTF-8 -*-
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from ansi2image.ansi2image import Ansi2Image
+from ansi2image.fonts.truetypefont import TrueTypeFont
+
+from .batch import Batch
+from .config import Configuration
+from .util.logger import Logger
+
+
+class Canvas(Ansi2Image):
+    '''
+        Ansi2Image with the font of ccat. Ansi2Image measures the font by rasterizing
+        glyphs, twice per image: here it is measured once per process.
+    '''
+
+    FONT_SIZE = 18
+    LINE_HEIGHT = 1.15
+
+    # (font path, size, index) -> (cell width, cell height)
+    _metrics = {}
+
+    def __init__(self):
+        # larger font + a bit of line spacing render a sharper, more
+        # readable image with some breathing room around the content
+        super().__init__(0, 0, font_name=Ansi2Image.get_default_font_name(),
+                         font_size=Canvas.FONT_SIZE, line_height=Canvas.LINE_HEIGHT)
+        self.min_margin = 26
+
+    @classmethod
+    def textlength(cls, font) -> tuple:
+        key = (font.path, font.size, font.index)
+        metrics = Canvas._metrics.get(key)
+        if metrics is None:
+            metrics = Canvas._metrics[key] = super().textlength(font)
+        return metrics
+
+    @staticmethod
+    def fit(height: int) -> int:
+        ''' Number of lines of the highest image within height pixels '''
+        font = TrueTypeFont(name=Ansi2Image.get_default_font_name(), size=Canvas.FONT_SIZE)
+        _, h = Canvas.textlength(font.truetype)
+        return max(int((height - 2 * Ansi2Image.max_margin) // (h * Canvas.LINE_HEIGHT)), 0)
+
+
+class ImageOutput(object):
+    '''
+        Image write stage (--output-img): the rendered lines are written as one image or,
+        with --lines-per-image, as pages of lines (out.png -> out-0001.png, out-0002.png, ...).
+        Each page is rasterized as soon as its lines are rendered, in a worker process when
+        there is more than one page. At most two pages per worker are in flight, so only
+        those are kept in memory.
+    '''
+
+    def __init__(self, filename: str, format: str, lines: int = 0, jobs: int = 0, max_height: int = None):
+        self.filename = filename
+        self.format = format
+        self.lines = lines
+        self.max_height = max_height
+        self.workers = Batch.workers(jobs, sys.maxsize)
+        self.pages = 0
+        self.page = []
+        # the first page, rasterized in this process if it is the only one
+        self.first = None
+        self.executor = None
+        self.pending = deque()
+
+    @staticmethod
+    def page_name(filename: str, number: int) -> str:
+        ''' out.png -> out-0001.png '''
+        path = Path(filename)
+        return str(path.with_name('%s-%04d%s' % (path.stem, number, path.suffix)))
+
+    @staticmethod
+    def save(filename: str, text: str, format: str, max_height: int = None) -> str:
+        from .ccat import ColorCat
+
+        data = ColorCat.image(text, format, max_height)
+        with open(filename, 'wb') as f:
+            f.write(data)
+        return filename
+
+    def add(self, line: str):
+        self.page.append(line)
+        if len(self.page) == self.lines:
+            self._flush()
+
+    def _flush(self):
+        text = '\n'.join(self.page)
+        self.page = []
+        self.pages += 1
+        if self.lines <= 0:
+            ImageOutput.save(self.filename, text, self.format, self.max_height)
+            return
+
+        name = ImageOutput.page_name(self.filename, self.pages)
+        if self.pages == 1 or self.workers == 1:
+            if self.workers == 1:
+                ImageOutput.save(name, text, self.format, self.max_height)
+            else:
+                self.first = (name, text)
+            return
+
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=self.workers)
+            self._submit(*self.first)
+            self.first = None
+        self._submit(name, text)
+
+    def _submit(self, name: str, text: str):
+        if len(self.pending) >= 2 * self.workers:
+            self.pending.popleft().result()
+        self.pending.append(self.executor.submit(ImageOutput.save, name, text, self.format, self.max_height))
+
+    def close(self) -> int:
+        ''' Writes the remaining pages, returns the number of images '''
+        try:
+            if len(self.page) > 0 or self.pages == 0:
+                self._flush()
+            if self.first is not None:
+                ImageOutput.save(*self.first, self.format, self.max_height)
+                self.first = None
+            while len(self.pending) > 0:
+                self.pending.popleft().result()
+        finally:
+            if self.executor is not None:
+                if sys.version_info >= (3, 9):
+                    self.executor.shutdown(wait=False, cancel_futures=True)
+                else:
+                    self.executor.shutdown(wait=False)
+
+        if Configuration.verbose >= 1:
+            Logger.pl('{+} {W}Image output: {G}%s{W} (%d image%s)' % (
+                self.filename if self.lines <= 0 else ImageOutput.page_name(self.filename, 1),
+                self.pages, 's' if self.pages != 1 else ''), out=sys.stderr)
+        return self.pages
@@ -0,0 +1,74 @@
+#!/usr/bin/python3
+# -*- coding: UTF-8 -*-
+import re
+from typing import Callable, Iterator, List, Union
+
+from pygments.lexers.data import JsonLexer
+from pygments.token import Keyword, Name, Number, Punctuation, String, Whitespace
+
+
+class IndentedJsonLexer(JsonLexer):
+    '''
+        JsonLexer for the output of JsonStream.
+
+        Every re-indented line has the same shape (indent, optional key, optional value,
+        punctuation), so format_lines formats each line from a single regex match, writing
+        the same bytes as SGRFormatter does for the JsonLexer tokens, without going through
+        one token at a time. Any other text (comments, raw text left after an error) is
+        lexed by JsonLexer.
+    '''
+
+    _string = r'"(?:[^"\\]|\\[^u]|\\u[0-9a-fA-F]{4})*"'
+    _line = re.compile(
+        r'( *)'
+        r'(?:(' + _string + r')(:)( ))?'
+        r'(?:(' + _string + r')|(-?[0-9][-0-9]*)([.eE+][-0-9.eE+]*)?|(true|false|null))?'
+        r'([{}\[\],]*)')
+    # strings only separated by whitespace, queued together by JsonLexer
+    _strings = re.compile(r'"[ \n]*\n *"')
+
+    def format_lines(self, lines: List[str], formatter, plain: Callable[[int], bool] = None) -> Union[Iterator[str], None]:
+        '''
+            Same lines as formatter.lines(self.get_tokens('\\n'.join(lines) + '\\n'), plain), or None
+            when the lines do not have the re-indented shape.
+        '''
+        matches = [IndentedJsonLexer._line.fullmatch(line) for line in lines]
+        if None in matches or IndentedJsonLexer._strings.search('\n'.join(lines)) is not None:
+            return None
+        return self._format(lines, matches, formatter, plain)
+
+    @staticmethod
+    def _format(lines: List[str], matches: list, formatter, plain: Callable[[int], bool]) -> Iterator[str]:
+        ws_on, ws_off = formatter.sgr(Whitespace)
+        tag_on, tag_off = formatter.sgr(Name.Tag)
+        p_on, p_off = formatter.sgr(Punctuation)
+        s_on, s_off = formatter.sgr(String.Double)
+        i_on, i_off = formatter.sgr(Number.Integer)
+        f_on, f_off = formatter.sgr(Number.Float)
+        c_on, c_off = formatter.sgr(Keyword.Constant)
+        dim_on, dim_off = formatter.dim
+        key_sep = p_on + ':' + p_off + ws_on + ' ' + ws_off
+
+        for i, m in enumerate(matches):
+            if plain is not None and plain(i):
+                yield dim_on + lines[i] + dim_off
+                continue
+
+            indent, key, _, _, string, integer, fraction, constant, punctuation = m.groups()
+            parts = []
+            if indent:
+                parts += (ws_on, indent, ws_off)
+            if key is not None:
+                parts += (tag_on, key, tag_off, key_sep)
+            if string is not None:
+                parts += (s_on, string, s_off)
+            elif integer is not None:
+                if fraction is not None:
+                    parts += (f_on, integer, fraction, f_off)
+                else:
+                    parts += (i_on, integer, i_off)
+            elif constant is not None:
+                parts += (c_on, constant, c_off)
+            if punctuation:
+                parts += (p_on, punctuation, p_off)
+            yield ''.join(parts)
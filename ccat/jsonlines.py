@@ -0,0 +1,153 @@
+#!/usr/bin/python3
+# -*- coding: UTF-8 -*-
+import os
+import sys
+from collections import deque
+from itertools import islice
+from typing import Iterable, Iterator, List
+
+from .compression import Compression
+from .config import Configuration
+from .jsonstream import JsonStream
+
+
+class JsonLines(object):
+    '''
+        JSON Lines mode: every line of the file is a record, re-indented and
+        highlighted on its own.
+
+        Records do not share any lexer state, so they are formatted in batches by a
+        process pool (when there is more than one batch) and the results are written
+        in order. A record keeps the number of its line in the file, its re-indented
+        lines are joined by '\\n' and shown as rows without number.
+    '''
+
+    EXTENSIONS = ('.jsonl', '.ndjson')
+    # a batch is sent to a worker once it has this many records or characters
+    BATCH = 512
+    BATCH_CHARS = 1024 * 1024
+
+    _lexer = None
+    _formatters = {}
+
+    @staticmethod
+    def is_record(line: str) -> bool:
+        ''' True if line holds one complete JSON value '''
+        try:
+            for _ in JsonStream([line]):
+                pass
+        except ValueError:
+            return False
+        return True
+
+    @staticmethod
+    def sniff(lines: Iterable[str], filename: str = None) -> bool:
+        '''
+            JSON Lines files are the .jsonl/.ndjson ones (compressed or not), or the ones whose first two non
+            blank lines are objects or arrays, the first one complete on its line
+        '''
+        if filename is not None and \
+                os.path.splitext(Compression.inner_name(filename))[1].lower() in JsonLines.EXTENSIONS:
+            return True
+
+        records = []
+        for line in lines:
+            line = line.strip()
+            if line != '':
+                records.append(line)
+                if len(records) == 2:
+                    break
+
+        return len(records) == 2 and all(r[0] in '{[' for r in records) and JsonLines.is_record(records[0])
+
+    @staticmethod
+    def lexer():
+        if JsonLines._lexer is None:
+            from .jsonlexer import IndentedJsonLexer
+
+            JsonLines._lexer = IndentedJsonLexer(stripnl=False)
+        return JsonLines._lexer
+
+    @staticmethod
+    def format(line: str, formatter, plain: bool = False) -> str:
+        '''
+            The record re-indented and highlighted, its lines joined by '\\n'.
+            Lines that are not valid JSON are only highlighted.
+        '''
+        if line.strip() == '':
+            return line
+
+        try:
+            lines = list(JsonStream([line]))
+        except ValueError:
+            lines = [line]
+
+        lexer = JsonLines.lexer()
+        _plain = (lambda i: True) if plain else None
+        out = lexer.format_lines(lines, formatter, _plain)
+        if out is None:
+            out = formatter.lines(lexer.get_tokens('\n'.join(lines) + '\n'), plain=_plain)
+        return '\n'.join(islice(out, len(lines)))
+
+    @staticmethod
+    def format_batch(batch: List[tuple], formatter) -> List[tuple]:
+        '''
+            [(number, line, plain)] -> [(number, formatted record)]
+            Entries without line ('...' marks) are kept as (number, None).
+        '''
+        return [(num, JsonLines.format(line, formatter, plain) if line is not None else None)
+                for num, line, plain in batch]
+
+    @staticmethod
+    def _work(batch: List[tuple], style, dim: tuple) -> List[tuple]:
+        ''' format_batch in a worker process, one formatter per style '''
+        formatter = JsonLines._formatters.get((style, dim))
+        if formatter is None:
+            from .formatter import SGRFormatter
+
+            formatter = JsonLines._formatters[(style, dim)] = SGRFormatter(style=style, dim=dim)
+        return JsonLines.format_batch(batch, formatter)
+
+    @staticmethod
+    def run(batches: Iterable[List[tuple]], formatter, jobs: int = None) -> Iterator[List[tuple]]:
+        '''
+            Formats the batches and yields the results in order. A single batch is formatted
+            in this process, otherwise at most two batches per worker are in flight, so the
+            input is read as the output is written. jobs defaults to Configuration.jobs.
+        '''
+        from .batch import Batch
+
+        batches = iter(batches)
+        first = next(batches, None)
+        if first is None:
+            return
+        second = next(batches, None)
+
+        # the files of the multi-file mode are already rendered in parallel (jobs is 1 there)
+        workers = Batch.workers(Configuration.jobs if jobs is None else jobs, sys.maxsize)
+        if second is None or workers == 1:
+            yield JsonLines.format_batch(first, formatter)
+            if second is not None:
+                yield JsonLines.format_batch(second, formatter)
+                for batch in batches:
+                    yield JsonLines.format_batch(batch, formatter)
+            return
+
+        from concurrent.futures import ProcessPoolExecutor
+
+        executor = ProcessPoolExecutor(max_workers=workers)
+        pending = deque()
+        try:
+            for batch in (first, second):
+                pending.append(executor.submit(JsonLines._work, batch, formatter.style, formatter.dim))
+            for batch in batches:
+                if len(pending) >= 2 * workers:
+                    yield pending.popleft().result()
+                pending.append(executor.submit(JsonLines._work, batch, formatter.style, formatter.dim))
+            while len(pending) > 0:
+                yield pending.popleft().result()
+        finally:
+            if sys.version_info >= (3, 9):
+                executor.shutdown(wait=False, cancel_futures=True)
+            else:
+                executor.shutdown(wait=False)
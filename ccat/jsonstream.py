@@ -0,0 +1,204 @@
+#!/usr/bin/python3
+# -*- coding: UTF-8 -*-
+import json
+import re
+from itertools import chain
+from typing import Iterable, Iterator
+
+
+class JsonStream(object):
+    '''
+        Streaming JSON re-indenter.
+
+        Reads the document one line at a time (JSON tokens never span lines) and yields
+        the lines json.dumps(json.loads(document), indent=2) would write, without building
+        the Python objects: only the stack of open containers is kept.
+
+        While strict, an invalid document raises ValueError and every line read so far is
+        kept in consumed, so the caller can show the raw text instead. Once the caller has
+        committed to the output (strict set to False), an error writes the rest of the
+        document as it is.
+    '''
+
+    _space = re.compile(r'[ \t\r\n]*')
+    _token = re.compile(
+        r'(?P<s>"(?:[^"\\\x00-\x1f]|\\["\\/bfnrt]|\\u[0-9a-fA-F]{4})*")'
+        r'|(?P<c>true|false|null|NaN|Infinity|-Infinity)'
+        r'|(?P<n>-?(?:0|[1-9][0-9]*)(?P<f>(?:\.[0-9]+)?(?:[eE][-+]?[0-9]+)?))'
+        r'|(?P<p>[{}\[\],:])')
+    # bytes counted to bound the number of re-indented lines: each ',' ends a line and
+    # each non empty container adds two (after the opening and before the closing bracket)
+    BREAKS = (b',', b'{', b'{', b'[', b'[')
+
+    _sniff = re.compile(r'[ \t\r\n]*(?:\{[ \t\r\n]*(?:["}]|$)|\[[ \t\r\n]*(?:["{\[\]\-0-9]|(?:true|false|null)\b|$))')
+
+    def __init__(self, lines: Iterable[str], indent: int = 2):
+        self.source = iter(lines)
+        self.indent = indent
+        self.strict = True
+        self.consumed = []
+
+    @staticmethod
+    def sniff(lines: Iterable[str], size: int = 1024) -> bool:
+        ''' Cheap check of the beginning of the document: an object or an array of JSON values '''
+        sample = []
+        for line in lines:
+            sample.append(line)
+            size -= len(line) + 1
+            if size <= 0:
+                break
+        return JsonStream._sniff.match('\n'.join(sample)) is not None
+
+    @staticmethod
+    def is_json_lexer(lexer) -> bool:
+        return lexer is not None and 'json' in lexer.aliases
+
+    @staticmethod
+    def string(token: str) -> str:
+        ''' The string as json.dumps writes it (ASCII only, shortest escapes) '''
+        if token.isascii() and '\\' not in token:
+            return token
+        return json.dumps(json.loads(token))
+
+    @staticmethod
+    def number(token: str, fraction: str) -> str:
+        if fraction == '':
+            return token if token != '-0' else '0'
+        value = float(token)
+        if value != value:
+            return 'NaN'
+        elif value == float('inf'):
+            return 'Infinity'
+        elif value == -float('inf'):
+            return '-Infinity'
+        return float.__repr__(value)
+
+    def _error(self, num: int, pos: int, message: str) -> ValueError:
+        return ValueError('%s at line %d column %d' % (message, num, pos + 1))
+
+    def __iter__(self) -> Iterator[str]:
+        # what is expected next
+        VALUE, KEY_OR_CLOSE, VALUE_OR_CLOSE, KEY, COLON, COMMA_OR_CLOSE, END = range(7)
+        indent = ' ' * self.indent
+        stack = []
+        expect = VALUE
+        opened = False  # the last token opened a container (written as {} / [] if closed right away)
+        cur = []
+
+        num = 0
+        for line in self.source:
+            num += 1
+            if self.consumed is not None:
+                self.consumed.append(line)
+
+            pos = 0
+            end = len(line)
+            while True:
+                pos = JsonStream._space.match(line, pos).end()
+                if pos >= end:
+                    break
+
+                m = JsonStream._token.match(line, pos)
+                kind = m.lastgroup if m is not None else None
+                token = m.group(0) if m is not None else None
+
+                if kind == 'p' and token in '}]':
+                    if (expect in (KEY_OR_CLOSE, COMMA_OR_CLOSE) and stack[-1:] == ['{'] and token == '}') or \
+                            (expect in (VALUE_OR_CLOSE, COMMA_OR_CLOSE) and stack[-1:] == ['['] and token == ']'):
+                        stack.pop()
+                        if not opened:
+                            yield ''.join(cur)
+                            cur = [indent * len(stack)]
+                        cur.append(token)
+                        opened = False
+                        expect = COMMA_OR_CLOSE if len(stack) > 0 else END
+                        pos = m.end()
+                        continue
+                elif kind == 'p' and token == ',':
+                    if expect == COMMA_OR_CLOSE:
+                        cur.append(',')
+                        yield ''.join(cur)
+                        cur = [indent * len(stack)]
+                        expect = KEY if stack[-1] == '{' else VALUE
+                        pos = m.end()
+                        continue
+                elif kind == 'p' and token == ':':
+                    if expect == COLON:
+                        cur.append(': ')
+                        expect = VALUE
+                        pos = m.end()
+                        continue
+                elif kind is not None and (
+                        expect in (VALUE, VALUE_OR_CLOSE) or (kind == 's' and expect in (KEY, KEY_OR_CLOSE))):
+                    if opened:
+                        yield ''.join(cur)
+                        cur = [indent * len(stack)]
+                        opened = False
+
+                    if kind == 'p':
+                        # { or [
+                        cur.append(token)
+                        stack.append(token)
+                        opened = True
+                        expect = KEY_OR_CLOSE if token == '{' else VALUE_OR_CLOSE
+                    else:
+                        if kind == 's':
+                            cur.append(JsonStream.string(token))
+                        elif kind == 'n':
+                            cur.append(JsonStream.number(token, m.group('f')))
+                        else:
+                            cur.append(token)
+
+                        if kind == 's' and expect in (KEY, KEY_OR_CLOSE):
+                            expect = COLON
+                        else:
+                            expect = COMMA_OR_CLOSE if len(stack) > 0 else END
+                    pos = m.end()
+                    continue
+
+                # invalid token or token out of place
+                if self.strict:
+                    raise self._error(num, pos, 'invalid JSON')
+                if ''.join(cur).strip() != '':
+                    yield ''.join(cur)
+                yield line[pos:]
+                yield from self.source
+                return
+
+        if expect != END:
+            if self.strict:
+                raise self._error(num, 0, 'incomplete JSON')
+            if ''.join(cur).strip() != '':
+                yield ''.join(cur)
+            return
+
+        yield ''.join(cur)
+
+    def commit(self) -> None:
+        ''' The output is being written: stop keeping the raw lines, errors no longer raise '''
+        self.strict = False
+        self.consumed = None
+
+    @staticmethod
+    def reindent(lines: Iterable[str], window: int) -> tuple:
+        '''
+            Re-indents the document if its beginning is valid JSON.
+
+            Returns (first window + 1 re-indented lines, iterator of the others), or
+            (None, iterator of the raw lines) when it is not JSON.
+        '''
+        stream = JsonStream(lines)
+        out = iter(stream)
+        try:
+            head = []
+            for line in out:
+                head.append(line)
+                if len(head) > window:
+                    break
+        except ValueError:
+            raw = stream.consumed
+            stream.consumed = None
+            return None, chain(raw, stream.source)
+
+        stream.commit()
+        return head, out
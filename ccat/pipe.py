@@ -0,0 +1,157 @@
+#!/usr/bin/python3
+# -*- coding: UTF-8 -*-
+import os
+import queue
+import select
+import threading
+from typing import BinaryIO, Iterator, List, Union
+
+from .stream import Stream
+
+
+class Pipe(object):
+    '''
+        Reader of pipes (stdin).
+
+        The input is read as it arrives (os.read returns whatever is available), so each
+        batch holds the complete lines available at that moment, up to a window of lines:
+        the lines of slow producers are rendered right away, fast producers get big batches.
+
+        Waiting for data with a timeout needs select, which does not work on the pipes of
+        Windows (nor on files without descriptor): a thread then reads the input, handing
+        the chunks over through a queue.
+    '''
+
+    # chunks read ahead by the reader thread
+    QUEUE = 16
+
+    # the prefix (lexer guess sample) stops waiting when no data arrives for this long
+    WAIT = 0.05
+
+    def __init__(self, fp: BinaryIO, chunk_size: int = 1024 * 1024):
+        self.fp = fp
+        self.chunk_size = chunk_size
+        self.eof = False
+        self.pending = b''
+        self.number = 0
+        try:
+            self.fd = fp.fileno()
+        except (OSError, AttributeError, ValueError):
+            self.fd = None
+        self.queue = None
+
+    def _read_chunk(self) -> bytes:
+        if self.fd is None:
+            return self.fp.read1(self.chunk_size) if hasattr(self.fp, 'read1') else self.fp.read(self.chunk_size)
+        return os.read(self.fd, self.chunk_size)
+
+    def _start_reader(self):
+        ''' Reads the input in a thread from now on (see _read) '''
+        self.queue = queue.Queue(maxsize=Pipe.QUEUE)
+
+        def _reader():
+            data = None
+            while data != b'':
+                try:
+                    data = self._read_chunk()
+                except (OSError, ValueError):
+                    data = b''
+                self.queue.put(data)
+
+        threading.Thread(target=_reader, name='ccat-pipe', daemon=True).start()
+
+    def _read(self, timeout: float = None) -> Union[bytes, None]:
+        ''' Reads the available bytes, None if nothing arrived within timeout (None waits for data) '''
+        if self.eof:
+            return b''
+
+        if self.queue is None and timeout is not None:
+            try:
+                if self.fd is None:
+                    raise ValueError()
+                ready, _, _ = select.select([self.fd], [], [], timeout)
+            except (OSError, ValueError):
+                # not selectable
+                self._start_reader()
+            else:
+                if len(ready) == 0:
+                    return None
+
+        if self.queue is not None:
+            try:
+                data = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                return None
+        else:
+            data = self._read_chunk()
+
+        if not data:
+            self.eof = True
+        return data
+
+    def prefix(self, lines: int, size: int) -> bytes:
+        '''
+            Reads the beginning of the input: up to its end, lines line breaks, size bytes or
+            until no data arrives for WAIT seconds. The bytes are still returned by chunks
+            and batches.
+        '''
+        chunks = [self.pending] if self.pending else []
+        data = self._read()
+        breaks = 0
+        length = 0
+        while data:
+            chunks.append(data)
+            breaks += data.count(b'\n')
+            length += len(data)
+            if breaks >= lines or length >= size:
+                break
+            data = self._read(Pipe.WAIT)
+
+        self.pending = b''.join(chunks)
+        return self.pending
+
+    def chunks(self) -> Iterator[bytes]:
+        ''' The raw input, for the streaming pipeline '''
+        if self.pending:
+            yield self.pending
+            self.pending = b''
+
+        data = self._read()
+        while data:
+            yield data
+            data = self._read()
+
+    def _lines(self, data: bytes) -> List[tuple]:
+        ''' Numbered lines of data (without the last line break) '''
+        lines = list(Stream.split_lines(Stream.decode([data])))
+        first = self.number + 1
+        self.number += len(lines)
+        return list(zip(range(first, self.number + 1), lines))
+
+    def batches(self, size: int) -> Iterator[List[tuple]]:
+        '''
+            Yields lists of (line number, line): the complete lines available when the previous
+            batch was written (at most about size lines). Waits for data only when there is no
+            complete line to return. The last line is returned at the end of the input.
+        '''
+        parts = [self.pending] if self.pending else []
+        self.pending = b''
+        breaks = sum(p.count(b'\n') for p in parts)
+        while True:
+            while not self.eof and breaks < size:
+                data = self._read(0 if breaks > 0 else None)
+                if data is None:
+                    break
+                parts.append(data)
+                breaks += data.count(b'\n')
+
+            data = b''.join(parts)
+            if self.eof:
+                if data:
+                    yield self._lines(data[:-1] if data.endswith(b'\n') else data)
+                return
+
+            end = data.rfind(b'\n')
+            parts = [data[end + 1:]]
+            breaks = 0
+            yield self._lines(data[:end])
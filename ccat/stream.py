@@ -0,0 +1,244 @@
+#!/usr/bin/python3
+# -*- coding: UTF-8 -*-
+import codecs
+from itertools import islice
+from typing import Callable, Iterable, Iterator, BinaryIO, Union
+
+
+class Stream(object):
+    '''
+        Generator based render stages.
+
+        Each stage consumes the previous one lazily, so only one window of
+        lines is held in memory at a time:
+
+            read -> decode -> split_lines -> strip_edges -> windows -> (lex/filter/format/write)
+    '''
+
+    @staticmethod
+    def read(fp: BinaryIO, chunk_size: int = 1024 * 1024) -> Iterator[bytes]:
+        ''' Yields raw chunks from an open binary file '''
+        b = fp.read(chunk_size)
+        while b:
+            yield b
+            b = fp.read(chunk_size)
+
+    @staticmethod
+    def slices(data: Union[bytes, bytearray], chunk_size: int = 1024 * 1024) -> Iterator[memoryview]:
+        ''' Yields chunks of data as memoryview slices, without copying them '''
+        with memoryview(data) as view:
+            for start in range(0, len(view), chunk_size):
+                with view[start:start + chunk_size] as chunk:
+                    yield chunk
+
+    @staticmethod
+    def decode(chunks: Iterable[bytes], report: Callable[[str], None] = None) -> Iterator[str]:
+        '''
+            Incrementally decodes the chunks as UTF-8 (with optional BOM).
+            If a chunk is not valid UTF-8, it and everything after it is decoded as latin-1.
+            report is called with the encoding decided for the first chunk and on the fallback.
+        '''
+        decoder = codecs.getincrementaldecoder('utf-8-sig')()
+        fallback = None
+        offset = 0
+        # first bytes, checked for the BOM
+        prefix = b'' if report is not None else None
+        for chunk in chunks:
+            if fallback is None:
+                try:
+                    text = decoder.decode(chunk)
+                except UnicodeDecodeError as e:
+                    # bytes kept by the decoder (partial multi-byte char) belong to this chunk
+                    kept = decoder.getstate()[0]
+                    chunk = kept + chunk
+                    fallback = codecs.getincrementaldecoder('latin-1')()
+                    if report is not None:
+                        prefix = None
+                        report('latin-1 (invalid UTF-8 at byte %d)' % (offset - len(kept) + e.start))
+                else:
+                    if prefix is not None:
+                        prefix += bytes(chunk[:3 - len(prefix)])
+                        if len(prefix) >= 3:
+                            report('UTF-8 with BOM' if prefix == codecs.BOM_UTF8 else 'UTF-8')
+                            prefix = None
+                    offset += len(chunk)
+                    yield text
+                    continue
+            yield fallback.decode(chunk)
+            offset += len(chunk)
+
+        if fallback is None:
+            if prefix:
+                # less than 3 bytes
+                report('UTF-8')
+            try:
+                yield decoder.decode(b'', final=True)
+            except UnicodeDecodeError:
+                if report is not None:
+                    report('latin-1 (incomplete UTF-8 at the end)')
+                yield decoder.getstate()[0].decode('latin-1')
+
+    @staticmethod
+    def split_lines(texts: Iterable[str]) -> Iterator[str]:
+        ''' Splits decoded text into lines (without the line break), expanding tabs and removing \\r '''
+        pending = []
+        for text in texts:
+            if text == '':
+                continue
+            parts = text.replace('\t', '  ').replace('\r', '').split('\n')
+            if len(parts) == 1:
+                pending.append(parts[0])
+                continue
+            pending.append(parts[0])
+            yield ''.join(pending)
+            yield from islice(parts, 1, len(parts) - 1)
+            pending = [parts[-1]]
+
+        yield ''.join(pending)
+
+    @staticmethod
+    def strip_edges(lines: Iterable[str]) -> Iterator[str]:
+        '''
+            Drops leading and trailing empty lines, the same way pygments stripnl does
+            for the whole document. Inner blank runs are only counted, never buffered.
+        '''
+        blank = 0
+        started = False
+        for line in lines:
+            if line == '':
+                if started:
+                    blank += 1
+                continue
+            started = True
+            while blank > 0:
+                yield ''
+                blank -= 1
+            yield line
+
+    @staticmethod
+    def windows(lines: Iterable[str], size: int) -> Iterator[list]:
+        ''' Groups lines in lists of at most size lines '''
+        size = size if size > 0 else 1
+        it = iter(lines)
+        w = list(islice(it, size))
+        while w:
+            yield w
+            w = list(islice(it, size))
+
+    @staticmethod
+    def count_lines(fp: BinaryIO, chunk_size: int = 1024 * 1024, end: int = None, start: int = 0) -> int:
+        '''
+            Counts the raw lines of an open binary file (number of \\n + 1), or the line
+            breaks before the byte offset end + 1 (the raw line number of that offset).
+            Only the line breaks from the byte offset start on are counted.
+        '''
+        fp.seek(start)
+        if end is None:
+            return sum(b.count(b'\n') for b in Stream.read(fp, chunk_size)) + 1
+
+        count = 1
+        end -= start
+        while end > 0:
+            b = fp.read(min(chunk_size, end))
+            if not b:
+                break
+            count += b.count(b'\n')
+            end -= len(b)
+        return count
+
+    @staticmethod
+    def last_lines(fp: BinaryIO, count: int, chunk_size: int = 1024 * 1024) -> tuple:
+        '''
+            Finds the last count lines of an open binary file, reading it backwards one chunk
+            at a time. Trailing empty lines are not counted (see strip_edges).
+            Returns (byte offset where they start, byte offset where the last non empty line ends).
+        '''
+        pos = fp.seek(0, 2)
+        end = None
+        found = 0
+        while pos > 0:
+            start = max(pos - chunk_size, 0)
+            fp.seek(start)
+            data = fp.read(pos - start)
+            i = len(data)
+            if end is None:
+                i = len(data.rstrip(b'\r\n'))
+                if i == 0:
+                    pos = start
+                    continue
+                end = start + i
+                if count <= 0:
+                    return end, end
+
+            while True:
+                i = data.rfind(b'\n', 0, i)
+                if i < 0:
+                    break
+                found += 1
+                if found == count:
+                    return start + i + 1, end
+            pos = start
+
+        return 0, end if end is not None else 0
+
+    @staticmethod
+    def blank_lines(fp: BinaryIO, chunk_size: int = 1024 * 1024, reverse: bool = False) -> Union[int, None]:
+        '''
+            Counts the empty raw lines at the beginning (or at the end, if reverse) of the file.
+            Returns None if the first (or last) chunk holds only empty lines.
+        '''
+        size = fp.seek(0, 2)
+        fp.seek(max(size - chunk_size, 0) if reverse else 0)
+        data = fp.read(chunk_size)
+        whole = len(data) >= size
+        if not reverse and data.startswith(codecs.BOM_UTF8):
+            data = data[len(codecs.BOM_UTF8):]
+
+        lines = data.split(b'\n')
+        if not whole:
+            # the line cut by the chunk boundary is incomplete
+            lines = lines[:-1] if not reverse else lines[1:]
+        if reverse:
+            lines.reverse()
+
+        count = 0
+        for line in lines:
+            if line.replace(b'\r', b'') != b'':
+                return count
+            count += 1
+
+        return count if whole else None
+
+    @staticmethod
+    def line_offsets(fp: BinaryIO, lines: Iterable[int], chunk_size: int = 1024 * 1024) -> dict:
+        '''
+            Returns {raw line number: byte offset} for the (sorted) requested line numbers,
+            scanning the file once. Lines beyond the end of the file are left out.
+        '''
+        offsets = {}
+        targets = iter(lines)
+        target = next(targets, None)
+        while target is not None and target <= 1:
+            offsets[target] = 0
+            target = next(targets, None)
+
+        seen = 0
+        pos = 0
+        fp.seek(0)
+        for chunk in Stream.read(fp, chunk_size):
+            if target is None:
+                break
+            n = chunk.count(b'\n')
+            idx = -1
+            found = 0
+            while target is not None and seen + n >= target - 1:
+                # line target starts right after the (target - 1)th line break
+                while seen + found < target - 1:
+                    idx = chunk.find(b'\n', idx + 1)
+                    found += 1
+                offsets[target] = pos + idx + 1
+                target = next(targets, None)
+            seen += n
+            pos += len(chunk)
+
+        return offsets
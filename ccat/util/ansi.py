@@ -0,0 +1,133 @@
+#!/usr/bin/python3
+# -*- coding: UTF-8 -*-
+import re
+from typing import List
+
+
+class Ansi(object):
+    '''
+        Helpers for text holding ANSI escape sequences (SGR colors).
+
+        A line is split once (a single regex pass) into the visible texts and the
+        escape sequences between them, and every operation works on whole texts,
+        so long lines cost O(n).
+    '''
+
+    RESET = '\x1b[0m'
+    # SGR parameters ending attributes: 22 ends bold and faint, 39 the foreground...
+    ENDS = {22: (1, 2), 23: (3,), 24: (4,), 25: (5, 6), 27: (7,), 28: (8,), 29: (9,), 39: ('fg',), 49: ('bg',)}
+
+    _sequence = re.compile(r'(\x9B|\x1B\[)[0-?]*[ -/]*[@-~]')
+    # the capture group makes re.split return the sequences between the texts
+    _split = re.compile(r'((?:\x9B|\x1B\[)[0-?]*[ -/]*[@-~])')
+
+    @staticmethod
+    def strip(text: str) -> str:
+        ''' Visible text, without escape sequences '''
+        if '\x1b' not in text and '\x9b' not in text:
+            return text
+        return Ansi._sequence.sub('', text)
+
+    @staticmethod
+    def apply(state: dict, code: str):
+        '''
+            Updates state (SGR attribute -> parameters in effect) with the escape sequence
+            code. Only the last foreground, background and each attribute are kept, so the
+            state never holds more than a few entries (the compound resets of Pygments,
+            '\\x1b[39;49;00m', clear it).
+        '''
+        if not code.endswith('m'):
+            return
+        params = code[2:-1].split(';') if code.startswith('\x1b') else code[1:-1].split(';')
+        i = 0
+        while i < len(params):
+            try:
+                p = int(params[i]) if params[i] != '' else 0
+            except ValueError:
+                return
+            if p in (38, 48):
+                # 38;5;n or 38;2;r;g;b
+                size = 3 if params[i + 1:i + 2] == ['5'] else 5
+                state['fg' if p == 38 else 'bg'] = ';'.join(params[i:i + size])
+                i += size
+                continue
+
+            if p == 0:
+                state.clear()
+            elif p in Ansi.ENDS:
+                for key in Ansi.ENDS[p]:
+                    state.pop(key, None)
+            elif 30 <= p <= 37 or 90 <= p <= 97:
+                state['fg'] = params[i]
+            elif 40 <= p <= 47 or 100 <= p <= 107:
+                state['bg'] = params[i]
+            else:
+                state[p] = params[i]
+            i += 1
+
+    @staticmethod
+    def sequence(state: dict) -> str:
+        ''' The single SGR sequence setting state, empty if there is nothing in effect '''
+        return '\x1b[%sm' % ';'.join(state.values()) if len(state) > 0 else ''
+
+    @staticmethod
+    def wrap(text: str, width: int, min_width: int = 10) -> List[str]:
+        '''
+            Wraps text at the given visible width, keeping the escape sequences intact.
+
+            Continuation chunks start with a reset, the leading indentation of the line
+            (so they line up under its content) and a sequence of the SGR attributes in
+            effect at the break (see apply), so a token broken in two keeps its color.
+        '''
+        width = width if width >= min_width else min_width
+        parts = Ansi._split.split(text)
+        texts = parts[::2]
+        if sum(map(len, texts)) <= width:
+            return [text]
+
+        visible_text = ''.join(texts)
+        indent = ' ' * (len(visible_text) - len(visible_text.lstrip(' ')))
+        cont_width = width - len(indent) if width - len(indent) >= min_width else min_width
+
+        # parts alternate text, sequence, text...: pair each text with the sequence before it
+        codes = parts[1::2]
+        codes.insert(0, '')
+
+        chunks = []
+        cur = []
+        active = {}  # SGR attributes in effect, carried to continuation chunks
+        visible = 0
+        budget = width  # first chunk uses the full width
+        for code, t in zip(codes, texts):
+            if code != '':
+                cur.append(code)
+                Ansi.apply(active, code)
+
+            n = len(t)
+            if visible + n <= budget:
+                if n > 0:
+                    cur.append(t)
+                    visible += n
+                continue
+
+            pos = 0
+            while pos < n:
+                if visible >= budget:
+                    # close this chunk and re-open the same style on the next one. Start
+                    # with a reset so the leading indent spaces survive tabulate's
+                    # whitespace stripping (it stops at the first non-space char).
+                    if len(active) > 0:
+                        cur.append(Ansi.RESET)
+                    chunks.append(''.join(cur))
+                    cur = [Ansi.RESET, indent, Ansi.sequence(active)]
+                    visible = 0
+                    budget = cont_width
+                take = min(budget - visible, n - pos)
+                cur.append(t[pos:pos + take])
+                visible += take
+                pos += take
+
+        if len(cur) > 0:
+            chunks.append(''.join(cur))
+
+        return chunks
@@ -0,0 +1,184 @@
+#!/usr/bin/python3
+# -*- coding: UTF-8 -*-
+import hashlib
+import json
+import os
+from typing import Callable, Iterable, Iterator, Union
+
+from ..stream import Stream
+
+
+class RenderCache(object):
+    '''
+        Content addressed disk cache of rendered output.
+
+        Entries are plain UTF-8 files named by the hash of the file content and of
+        every option that changes the output, readable only by the user (the
+        directories are 0700, the files 0600). The least recently used entries
+        (by mtime, refreshed on every hit) are evicted when the cache grows over
+        max_size bytes.
+
+        Nothing is rewritten on a lookup or a store: the hit and miss counters are
+        append-only files of one byte per lookup (their sizes are the counts) and
+        the size of every stored entry is appended to a log. The entries are only
+        listed when the logged size crosses max_size, the log then restarts from
+        the size left.
+    '''
+
+    def __init__(self, cache_dir: str, max_size: int = 256 * 1024 * 1024):
+        self.path = os.path.join(cache_dir, 'render')
+        self.max_size = max_size
+
+    @property
+    def hits(self) -> int:
+        return self._counter('hits')
+
+    @property
+    def misses(self) -> int:
+        return self._counter('misses')
+
+    @staticmethod
+    def key(data: Union[bytes, Iterable[bytes]], **params) -> str:
+        ''' data is the content or its chunks (see Stream.read) '''
+        h = hashlib.sha256()
+        for chunk in Stream.slices(data) if isinstance(data, (bytes, bytearray)) else data:
+            h.update(chunk)
+        h.update(json.dumps(params, sort_keys=True, default=str).encode('UTF-8'))
+        return h.hexdigest()
+
+    @staticmethod
+    def makedirs(path: str):
+        ''' Creates path and its missing parents, accessible only by the user '''
+        if os.path.isdir(path):
+            return
+        parent = os.path.dirname(path)
+        if parent != path:
+            RenderCache.makedirs(parent)
+        try:
+            os.mkdir(path, 0o700)
+        except FileExistsError:
+            pass
+
+    def entry(self, key: str) -> str:
+        return os.path.join(self.path, key[:2], key)
+
+    def get(self, key: str) -> Union[str, None]:
+        ''' Returns the entry filename on a hit (refreshing its LRU time), None on a miss '''
+        filename = self.entry(key)
+        try:
+            os.utime(filename)
+            hit = True
+        except OSError:
+            hit = False
+
+        self._append('hits' if hit else 'misses', b'.')
+        return filename if hit else None
+
+    @staticmethod
+    def read(filename: str, chunk_size: int = 1024 * 1024) -> Iterator[str]:
+        with open(filename, 'r', encoding='UTF-8', newline='') as f:
+            b = f.read(chunk_size)
+            while b:
+                yield b
+                b = f.read(chunk_size)
+
+    def store(self, key: str, lines: Iterable[str], valid: Callable[[], bool] = None) -> Iterator[str]:
+        '''
+            Passes the rendered lines through, writing them to a temporary file that
+            becomes the cache entry only if the whole output was produced (and valid(),
+            if given, tells the key still matches it)
+        '''
+        filename = self.entry(key)
+        tmp = '%s.%d.tmp' % (filename, os.getpid())
+        try:
+            RenderCache.makedirs(os.path.dirname(filename))
+            f = open(os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'w', encoding='UTF-8', newline='')
+        except OSError:
+            yield from lines
+            return
+
+        done = False
+        try:
+            for line in lines:
+                f.write(line + '\n')
+                yield line
+            done = valid is None or valid()
+        finally:
+            f.close()
+            try:
+                if done:
+                    os.replace(tmp, filename)
+                    size = os.stat(filename).st_size
+                else:
+                    os.unlink(tmp)
+            except OSError:
+                done = False
+
+        if done:
+            self._append('sizes', b'%d\n' % size)
+            if self._logged_size() > self.max_size:
+                self.evict()
+
+    def evict(self):
+        ''' Removes the least recently used entries until the cache fits in max_size '''
+        entries = []
+        total = 0
+        for root, _, files in os.walk(self.path):
+            if root == self.path:
+                # counters and size log
+                continue
+            for name in files:
+                if name.endswith('.tmp'):
+                    continue
+                try:
+                    st = os.stat(os.path.join(root, name))
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, os.path.join(root, name)))
+                total += st.st_size
+
+        for _, size, filename in sorted(entries):
+            if total <= self.max_size:
+                break
+            try:
+                os.unlink(filename)
+                total -= size
+            except OSError:
+                pass
+
+        # the log restarts from the size left (sizes appended meanwhile are lost, the
+        # estimate is only used to tell when to list the entries again)
+        sizes = os.path.join(self.path, 'sizes')
+        tmp = '%s.%d.tmp' % (sizes, os.getpid())
+        try:
+            with open(os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'wb') as f:
+                f.write(b'%d\n' % total)
+            os.replace(tmp, sizes)
+        except OSError:
+            pass
+
+    def _append(self, name: str, data: bytes):
+        ''' Appends to one of the counter/log files (a single write, atomic with O_APPEND) '''
+        try:
+            RenderCache.makedirs(self.path)
+            fd = os.open(os.path.join(self.path, name), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+            try:
+                os.write(fd, data)
+            finally:
+                os.close(fd)
+        except OSError:
+            pass
+
+    def _counter(self, name: str) -> int:
+        try:
+            return os.stat(os.path.join(self.path, name)).st_size
+        except OSError:
+            return 0
+
+    def _logged_size(self) -> int:
+        ''' Size of the cache: the one left by the last eviction plus the entries stored since '''
+        try:
+            with open(os.path.join(self.path, 'sizes'), 'rb') as f:
+                return sum(int(l) for l in f.read().split() if l.isdigit())
+        except (OSError, ValueError):
+            return 0
@@ -1,9 +1,8 @@
 #!/usr/bin/python3
 # -*- coding: UTF-8 -*-
 
+import re
 import sys
-import colorama
-colorama.init(strip=False)
 
 
 class Color(object):
@@ -35,14 +34,32 @@ class Color(object):
     }
 
     last_sameline_length = 0
+    initialized = False
+
+    # compiled tag tables: (regex, {tag: colored}, {tag: non colored})
+    _compiled = None
+    _templates = {}
+
+    @staticmethod
+    def init():
+        ''' Initializes colorama (once), on the first output instead of at import time '''
+        if Color.initialized:
+            return
+        Color.initialized = True
+
+        import colorama
+        colorama.init(strip=False)
 
     @staticmethod
-    def p(text, out=sys.stdout):
+    def p(text, out=None):
         '''
         Prints text using colored format on same line.
         Example:
             Color.p("{R}This text is red. {W} This text is white")
         '''
+        Color.init()
+        if out is None:
+            out = sys.stdout
         try:
             out.write(Color.s(text))
             out.flush()
@@ -55,7 +72,7 @@ class Color(object):
             pass
 
     @staticmethod
-    def pl(text, out=sys.stdout):
+    def pl(text, out=None):
         '''Prints text using colored format with trailing new line.'''
         Color.p('%s\n' % text, out)
         Color.last_sameline_length = 0
@@ -63,28 +80,56 @@ class Color(object):
     @staticmethod
     def pe(text):
         '''Prints text using colored format with leading and trailing new line to STDERR.'''
+        Color.init()
         sys.stderr.write(Color.s('%s\n' % text))
         Color.last_sameline_length = 0
 
+    @staticmethod
+    def compile():
+        '''
+            Compiles every tag (helper replacements already expanded) into one regex,
+            so a text is colored in a single pass instead of one replace per tag
+        '''
+        colored = {}
+        plain = {}
+        for (key, value) in Color.replacements.items():
+            colored[key] = value
+            plain[key] = value
+            for (k, v) in Color.colors.items():
+                colored[key] = colored[key].replace("{%s}" % k, v)
+                plain[key] = plain[key].replace("{%s}" % k, '')
+        for (key, value) in Color.colors.items():
+            colored.setdefault("{%s}" % key, value)
+            plain.setdefault("{%s}" % key, '')
+
+        tags = re.compile('|'.join(re.escape(k) for k in sorted(colored, key=len, reverse=True)))
+        Color._compiled = (tags, colored, plain)
+        Color._templates = {}
+        return Color._compiled
+
     @staticmethod
     def s(text):
         ''' Returns colored string '''
-        output = text
-        for (key,value) in Color.replacements.items():
-            output = output.replace(key, value)
-        for (key,value) in Color.colors.items():
-            output = output.replace("{%s}" % key, value)
-        return output
+        tags, colored, _ = Color._compiled or Color.compile()
+        return tags.sub(lambda m: colored[m.group(0)], text)
 
     @staticmethod
     def sc(text):
         ''' Returns non colored string '''
-        output = text
-        for (key,value) in Color.replacements.items():
-            output = output.replace(key, value)
-        for (key,value) in Color.colors.items():
-            output = output.replace("{%s}" % key, '')
-        return output
+        tags, _, plain = Color._compiled or Color.compile()
+        return tags.sub(lambda m: plain[m.group(0)], text)
+
+    @staticmethod
+    def t(template):
+        '''
+            Returns the template with its tags colored, compiled once and cached.
+            Apply the values after, so they are never read as tags:
+                Color.t('{O}{D}%s{W}') % value
+        '''
+        compiled = Color._templates.get(template)
+        if compiled is None:
+            compiled = Color._templates[template] = Color.s(template)
+        return compiled
 
     @staticmethod
     def clear_line():
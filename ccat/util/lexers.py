@@ -0,0 +1,284 @@
+#!/usr/bin/python3
+# -*- coding: UTF-8 -*-
+import fnmatch
+import hashlib
+import importlib
+import json
+import os
+import re
+from typing import Union
+
+
+class LexerIndex(object):
+    '''
+        Pre-computed file name -> lexer class lookup table.
+
+        Pygments get_lexer_for_filename fnmatches every pattern of every lexer
+        (importing the plugins on the way). The table maps every simple '*.ext'
+        pattern and exact file name to the lexer get_lexer_for_filename picks for
+        it. It is generated from the installed Pygments when the package is built (see
+        setup.py) and only used by that same Pygments version: other versions build
+        their own table once, in the cache directory. Names matching one of the
+        remaining glob patterns ('Makefile.*', '*.php[345]', ...) still go
+        through the registry.
+    '''
+
+    VERSION = 1
+    # bytes read from the end of the file looking for modelines
+    TAIL = 4096
+    # guessed lexers kept in memory
+    GUESSES = 1024
+    FILENAME = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lexers.json')
+
+    _simple = re.compile(r'\*(\.[^.*?\[\]]+)')
+    _magic = re.compile(r'[*?\[]')
+    _version = re.compile(r'[\d.]+$')
+    _emacs = re.compile(r'-\*-\s*(?:.*?\bmode:\s*)?([\w+#.-]+?)\s*(?:;.*?)?-\*-', re.IGNORECASE)
+
+    # interpreters whose name is not a pygments alias
+    INTERPRETERS = {'node': 'javascript', 'nodejs': 'javascript', 'tclsh': 'tcl', 'wish': 'tcl', 'Rscript': 'r'}
+
+    _table = None
+    _patterns = None
+    _memo = {}
+    _guesses = {}
+
+    @staticmethod
+    def build() -> dict:
+        '''
+            Builds the lookup table from the installed Pygments. Every name is matched against the
+            patterns that can match it (its extension, its exact name and the glob patterns) and the
+            lexer is picked the way get_lexer_for_filename does, without fnmatching every pattern.
+        '''
+        import pygments
+        from pygments.lexers import _iter_lexerclasses
+
+        extensions = set()
+        names = set()
+        patterns = set()
+        by_extension = {}
+        by_name = {}
+        globs = []
+        for cls in _iter_lexerclasses():
+            for p in cls.filenames:
+                m = LexerIndex._simple.fullmatch(p)
+                if m is not None:
+                    by_extension.setdefault(m.group(1), []).append((cls, p))
+                elif LexerIndex._magic.search(p) is None:
+                    by_name.setdefault(p, []).append((cls, p))
+                else:
+                    globs.append((cls, p, re.compile(fnmatch.translate(p))))
+
+            for p in list(cls.filenames) + list(cls.alias_filenames):
+                m = LexerIndex._simple.fullmatch(p)
+                if m is not None:
+                    extensions.add(m.group(1))
+                elif LexerIndex._magic.search(p) is None:
+                    names.add(p)
+                else:
+                    patterns.add(p)
+
+        def _lexer(name):
+            matches = list(by_name.get(name, []))
+            if '.' in name:
+                matches += by_extension.get('.' + name.rsplit('.', 1)[1], [])
+            matches += [(cls, p) for cls, p, regex in globs if regex.match(name)]
+            if len(matches) == 0:
+                return None
+            # the rating of find_lexer_class_for_filename: explicit names get a bonus
+            cls, _ = sorted(matches, key=lambda m: (m[0].priority + ('*' not in m[1] and 0.5 or 0), m[0].__name__))[-1]
+            return '%s:%s' % (cls.__module__, cls.__qualname__)
+
+        return {
+            'version': LexerIndex.VERSION,
+            'pygments': pygments.__version__,
+            'extensions': {e: _lexer('x' + e) for e in sorted(extensions)},
+            'names': {n: _lexer(n) for n in sorted(names)},
+            'patterns': sorted(patterns),
+        }
+
+    @staticmethod
+    def save(filename: str = None, table: dict = None):
+        ''' Writes the table (the one of the installed Pygments by default), replacing filename at once '''
+        filename = filename or LexerIndex.FILENAME
+        tmp = '%s.%d.tmp' % (filename, os.getpid())
+        with open(tmp, 'w', encoding='UTF-8') as f:
+            json.dump(table or LexerIndex.build(), f, indent=1, sort_keys=True)
+            f.write('\n')
+        os.replace(tmp, filename)
+
+    @staticmethod
+    def load(filename: str) -> dict:
+        ''' The table of filename, empty if it is missing or was built for another Pygments version '''
+        import pygments
+
+        try:
+            with open(filename, 'r', encoding='UTF-8') as f:
+                table = json.load(f)
+            if table.get('version') == LexerIndex.VERSION and table.get('pygments') == pygments.__version__:
+                return table
+        except (OSError, ValueError):
+            pass
+        return {}
+
+    @staticmethod
+    def table(cache_dir: str = None) -> Union[dict, None]:
+        '''
+            Returns the shipped table or, if it was built for another Pygments version, the one
+            built for the installed version in cache_dir (built on the first call). None without
+            any (no cache directory, or it is not writable).
+        '''
+        if LexerIndex._table is None or (len(LexerIndex._table) == 0 and cache_dir is not None):
+            import pygments
+
+            table = LexerIndex.load(LexerIndex.FILENAME)
+            if len(table) == 0 and cache_dir is not None:
+                filename = os.path.join(cache_dir, 'lexers-%s.json' % pygments.__version__)
+                table = LexerIndex.load(filename)
+                if len(table) == 0:
+                    table = LexerIndex.build()
+                    try:
+                        os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+                        LexerIndex.save(filename, table)
+                    except OSError:
+                        pass
+            LexerIndex._table = table
+
+        return LexerIndex._table if len(LexerIndex._table) > 0 else None
+
+    @staticmethod
+    def registry_patterns() -> tuple:
+        ''' (exact names, glob patterns) of the registry, when there is no table '''
+        if LexerIndex._patterns is None:
+            from pygments.lexers import find_plugin_lexers
+            from pygments.lexers._mapping import LEXERS
+
+            filenames = [p for _, _, _, patterns, _ in LEXERS.values() for p in patterns]
+            filenames += [p for cls in find_plugin_lexers() for p in cls.filenames]
+            LexerIndex._patterns = (
+                set(p for p in filenames if LexerIndex._magic.search(p) is None),
+                [p for p in filenames if LexerIndex._simple.fullmatch(p) is None and LexerIndex._magic.search(p)])
+        return LexerIndex._patterns
+
+    @staticmethod
+    def lookup(filename: str, cache_dir: str = None):
+        '''
+            Returns the lexer class for filename (None if there is none), the one of
+            get_lexer_for_filename: dotfiles named like an extension ('.ini') match it.
+            The result is memoized per extension (or exact name), so the session and
+            daemon modes resolve each kind of file only once, with or without table.
+        '''
+        name = os.path.basename(filename)
+        table = LexerIndex.table(cache_dir)
+        names, patterns = (table['names'], table['patterns']) if table is not None else LexerIndex.registry_patterns()
+        if name not in names and not any(fnmatch.fnmatchcase(name, p) for p in patterns):
+            # '*.ini' matches '.ini' too (the table was built the same way, see build)
+            key = (None, os.path.splitext('x' + name)[1])
+        else:
+            key = (name, None)
+
+        if key not in LexerIndex._memo:
+            LexerIndex._memo[key] = LexerIndex._resolve(name, key[1], table)
+        return LexerIndex._memo[key]
+
+    @staticmethod
+    def _resolve(name: str, extension: Union[str, None], table: Union[dict, None]):
+        path = None
+        if table is not None:
+            if extension is None:
+                path = table['names'].get(name)
+            else:
+                path = table['extensions'].get(extension)
+                if path is None:
+                    # every simple pattern is in the table, so nothing matches this name
+                    return None
+
+        if path is not None:
+            module, cls = path.split(':')
+            try:
+                return getattr(importlib.import_module(module), cls)
+            except (ImportError, AttributeError):
+                pass
+
+        # not covered by the table: ask the registry
+        from pygments.lexers import get_lexer_for_filename
+        try:
+            return type(get_lexer_for_filename(name))
+        except Exception:
+            return None
+
+    @staticmethod
+    def get_lexer(filename: str, cache_dir: str = None):
+        ''' Same as pygments get_lexer_for_filename, returning None when there is no lexer '''
+        cls = LexerIndex.lookup(filename, cache_dir)
+        return cls() if cls is not None else None
+
+    @staticmethod
+    def hint(sample: str, tail: str = '') -> Union[str, None]:
+        ''' Returns the lexer alias named by the shebang or by a vim/emacs modeline, if any '''
+        first = sample.split('\n', 1)[0]
+        if first.startswith('#!'):
+            # #!/usr/bin/env -S python3 -u
+            words = [w for w in first[2:].split() if not w.startswith('-')]
+            if len(words) > 1 and os.path.basename(words[0]) == 'env':
+                words = words[1:]
+            if len(words) > 0:
+                name = os.path.basename(words[0])
+                return LexerIndex.INTERPRETERS.get(name, name)
+
+        from pygments.modeline import get_filetype_from_buffer
+
+        name = get_filetype_from_buffer(sample + '\n' + tail)
+        if name is not None:
+            return name
+
+        m = LexerIndex._emacs.search(first)
+        return m.group(1).lower() if m is not None else None
+
+    @staticmethod
+    def guess(sample: str, tail: str = ''):
+        '''
+            Returns a lexer for the bounded sample (beginning of the document) and tail (end of
+            the document, only used for modelines). Shebang and modeline hints are checked before
+            running every lexer analyse_text. The decision is cached in memory by the signature
+            of the content (the last GUESSES ones, so a daemon does not grow with every file).
+        '''
+        import pygments
+        from pygments.lexers import get_lexer_by_name, guess_lexer
+
+        key = hashlib.sha1(('%s\0%s\0%s' % (pygments.__version__, sample, tail)).encode(
+            'UTF-8', 'surrogateescape')).hexdigest()
+
+        path = LexerIndex._guesses.get(key)
+        if path is not None:
+            module, cls = path.split(':')
+            return getattr(importlib.import_module(module), cls)()
+
+        lexer = None
+        name = LexerIndex.hint(sample, tail)
+        if name is not None:
+            for alias in (name, LexerIndex._version.sub('', name)):
+                try:
+                    lexer = get_lexer_by_name(alias)
+                    break
+                except Exception:
+                    pass
+
+        if lexer is None:
+            try:
+                lexer = guess_lexer(sample)
+            except Exception:
+                lexer = get_lexer_by_name('text')
+
+        if len(LexerIndex._guesses) >= LexerIndex.GUESSES:
+            # the oldest decision (unless another thread changed the cache meanwhile)
+            try:
+                del LexerIndex._guesses[next(iter(LexerIndex._guesses))]
+            except (KeyError, RuntimeError, StopIteration):
+                pass
+        LexerIndex._guesses[key] = '%s:%s' % (type(lexer).__module__, type(lexer).__qualname__)
+        return lexer
+
+
+if __name__ == '__main__':
+    LexerIndex.save()
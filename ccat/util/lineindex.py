@@ -0,0 +1,166 @@
+#!/usr/bin/python3
+# -*- coding: UTF-8 -*-
+import hashlib
+import mmap
+import os
+import re
+import struct
+import zlib
+from array import array
+from typing import Union
+
+
+class LineIndex(object):
+    '''
+        Byte offset of the start of every line of a file, persisted as a compact
+        array('Q') sidecar in the cache directory.
+
+        The sidecar is keyed by path, size, mtime and inode. When a file only grew
+        (same inode and the bytes before the old size are unchanged) the index is
+        extended with the appended lines instead of being rebuilt.
+    '''
+
+    MAGIC = b'CCATIDX1'
+    # magic, file size, mtime (ns), inode, crc32 of the last indexed block, padding
+    HEADER = struct.Struct('<8sQQQII')
+    CRC_BLOCK = 64 * 1024
+
+    _newline = re.compile(b'\n')
+
+    def __init__(self, filename: str, offsets: Union[array, memoryview], size: int):
+        self.filename = filename
+        self.offsets = offsets
+        self.size = size
+
+    def __len__(self):
+        ''' Number of raw lines (number of \\n + 1) '''
+        return len(self.offsets)
+
+    def get(self, line: int, default=None) -> Union[int, None]:
+        ''' Byte offset where the (1-based) raw line starts '''
+        if 1 <= line <= len(self.offsets):
+            return self.offsets[line - 1]
+        return default
+
+    def __getitem__(self, line: int) -> int:
+        offset = self.get(line)
+        if offset is None:
+            raise IndexError('line %d out of range' % line)
+        return offset
+
+    @staticmethod
+    def sidecar(filename: str, cache_dir: str) -> str:
+        key = hashlib.sha1(os.path.realpath(filename).encode('UTF-8', 'surrogateescape')).hexdigest()
+        return os.path.join(cache_dir, 'index', '%s.idx' % key)
+
+    @staticmethod
+    def open(filename: str, cache_dir: str = None, chunk_size: int = 1024 * 1024) -> 'LineIndex':
+        '''
+            Returns the index of filename, loading it from the sidecar when it is still
+            valid, extending it when the file was appended to, or building it otherwise.
+            The sidecar is (re)written when cache_dir is given and writable.
+        '''
+        st = os.stat(filename)
+        sidecar = LineIndex.sidecar(filename, cache_dir) if cache_dir is not None else None
+
+        header = LineIndex._header_of(sidecar) if sidecar is not None else None
+        if header is not None:
+            _, size, mtime, inode, crc, _ = header
+            if inode == st.st_ino and size == st.st_size and mtime == st.st_mtime_ns:
+                offsets = LineIndex._map(sidecar)
+                if offsets is not None:
+                    return LineIndex(filename, offsets, size)
+
+            if inode == st.st_ino and size < st.st_size and crc == LineIndex._crc(filename, size):
+                offsets = LineIndex._load(sidecar)
+            else:
+                offsets = None
+
+            if offsets is not None:
+                indexed = len(offsets)
+                LineIndex._scan(filename, offsets, size, st.st_size, chunk_size)
+                index = LineIndex(filename, offsets, st.st_size)
+                index._append(sidecar, st, indexed)
+                return index
+
+        offsets = array('Q', [0])
+        LineIndex._scan(filename, offsets, 0, st.st_size, chunk_size)
+        index = LineIndex(filename, offsets, st.st_size)
+        if sidecar is not None:
+            index._save(sidecar, st)
+        return index
+
+    @staticmethod
+    def _scan(filename: str, offsets: array, start: int, end: int, chunk_size: int):
+        ''' Appends the start of every line between the bytes start and end (single pass) '''
+        pos = start
+        with open(filename, 'rb') as f:
+            f.seek(start)
+            b = f.read(min(chunk_size, end - pos))
+            while b:
+                offsets.extend(m.end() + pos for m in LineIndex._newline.finditer(b))
+                pos += len(b)
+                b = f.read(min(chunk_size, end - pos))
+
+    @staticmethod
+    def _crc(filename: str, size: int) -> int:
+        with open(filename, 'rb') as f:
+            f.seek(max(size - LineIndex.CRC_BLOCK, 0))
+            return zlib.crc32(f.read(min(size, LineIndex.CRC_BLOCK)))
+
+    def _header(self, st) -> bytes:
+        return LineIndex.HEADER.pack(
+            LineIndex.MAGIC, self.size, st.st_mtime_ns, st.st_ino, LineIndex._crc(self.filename, self.size), 0)
+
+    @staticmethod
+    def _header_of(sidecar: str) -> Union[tuple, None]:
+        try:
+            with open(sidecar, 'rb') as f:
+                header = LineIndex.HEADER.unpack(f.read(LineIndex.HEADER.size))
+                return header if header[0] == LineIndex.MAGIC else None
+        except (OSError, struct.error):
+            return None
+
+    @staticmethod
+    def _map(sidecar: str) -> Union[memoryview, None]:
+        ''' Maps the offsets read-only, so opening a valid index is O(1) '''
+        try:
+            with open(sidecar, 'rb') as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            return memoryview(mm)[LineIndex.HEADER.size:].cast('Q')
+        except (OSError, ValueError, TypeError):
+            return None
+
+    @staticmethod
+    def _load(sidecar: str) -> Union[array, None]:
+        try:
+            with open(sidecar, 'rb') as f:
+                f.seek(LineIndex.HEADER.size)
+                offsets = array('Q')
+                offsets.frombytes(f.read())
+                return offsets
+        except (OSError, ValueError):
+            return None
+
+    def _save(self, sidecar: str, st):
+        try:
+            os.makedirs(os.path.dirname(sidecar), exist_ok=True)
+            tmp = '%s.%d.tmp' % (sidecar, os.getpid())
+            with open(tmp, 'wb') as f:
+                f.write(self._header(st))
+                self.offsets.tofile(f)
+            os.replace(tmp, sidecar)
+        except OSError:
+            # the index still works in memory
+            pass
+
+    def _append(self, sidecar: str, st, indexed: int):
+        ''' Writes only the new offsets and the updated header '''
+        try:
+            with open(sidecar, 'r+b') as f:
+                f.seek(0, 2)
+                self.offsets[indexed:].tofile(f)
+                f.seek(0)
+                f.write(self._header(st))
+        except OSError:
+            pass
@@ -1,7 +1,6 @@
 #!/usr/bin/python3
 # -*- coding: UTF-8 -*-
 
-import sys
 from ..util.color import Color
 
 class Logger(object):
@@ -10,7 +9,7 @@ class Logger(object):
     out_file = ''
 
     @staticmethod
-    def pl(text, out=sys.stdout):
+    def pl(text, out=None):
         '''Prints text using colored format with trailing new line.'''
         Color.pl(text, out=out)
 
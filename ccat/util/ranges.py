@@ -0,0 +1,73 @@
+#!/usr/bin/python3
+# -*- coding: UTF-8 -*-
+from bisect import bisect_right
+from typing import Iterable, Tuple
+
+
+class LineRanges(object):
+    '''
+        Merged and sorted line intervals compiled from the (start, end) filters
+        parsed by Configuration (end == 0 means up to the end of the file).
+
+        Lookups are O(log R) using bisect, and O(1) when the lines are
+        queried in increasing order (the index of the last hit is kept).
+    '''
+
+    OPEN = float('inf')
+
+    def __init__(self, ranges: Iterable[Tuple[int, int]] = ()):
+        ranges = list(ranges)
+        merged = []
+        for start, end in sorted((s, e if e != 0 else LineRanges.OPEN) for s, e in ranges):
+            if end < start:
+                # selects nothing, but its start still gets a '...' mark
+                continue
+            if len(merged) > 0 and start <= merged[-1][1] + 1:
+                if end > merged[-1][1]:
+                    merged[-1][1] = end
+            else:
+                merged.append([start, end])
+
+        self.starts = [s for s, _ in merged]
+        self.ends = [e for _, e in merged]
+        self.marks = set(s for s, _ in ranges if s != 0)
+        self.filtered = len(ranges) > 0
+        self._hint = 0
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __bool__(self):
+        ''' False when no filter was given at all (everything is selected) '''
+        return self.filtered
+
+    def __iter__(self):
+        return iter(zip(self.starts, self.ends))
+
+    def _find(self, line: int) -> int:
+        ''' Returns the index of the last interval starting at or before line (-1 if none) '''
+        i = self._hint
+        if i < len(self.starts) and self.starts[i] <= line and (
+                i + 1 == len(self.starts) or line < self.starts[i + 1]):
+            return i
+
+        i = bisect_right(self.starts, line) - 1
+        if i >= 0:
+            self._hint = i
+        return i
+
+    def contains(self, line: int) -> bool:
+        i = self._find(line)
+        return i >= 0 and line <= self.ends[i]
+
+    def __contains__(self, line: int) -> bool:
+        return self.contains(line)
+
+    def is_before(self, line: int) -> bool:
+        ''' True if line is not selected but the next one starts an interval '''
+        return (line + 1) in self.marks and not self.contains(line)
+
+    @property
+    def last(self) -> float:
+        ''' Last selected line (LineRanges.OPEN if the last interval has no end) '''
+        return self.ends[-1] if len(self.ends) > 0 else 0
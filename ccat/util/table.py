@@ -0,0 +1,259 @@
+#!/usr/bin/python3
+# -*- coding: UTF-8 -*-
+import math
+import re
+from collections import namedtuple
+from typing import Iterable, Iterator, List
+
+from .color import Color
+
+Line = namedtuple('Line', ['begin', 'hline', 'sep', 'end'])
+DataRow = namedtuple('DataRow', ['begin', 'sep', 'end'])
+TableFormat = namedtuple('TableFormat', ['lineabove', 'linebelowheader', 'linebelow', 'headerrow',
+                                         'datarow', 'padding'])
+
+
+class Table(object):
+    '''
+        Renderer of the 'ccat' table format.
+
+        Table.render writes the same bytes tabulate(rows, headers, tablefmt='ccat')
+        did: it reproduces the tabulate rules that apply to this format (column
+        type inference, decimal alignment of numeric columns, colored numbers
+        reformatting, wide characters width and minimum header padding), without
+        its multiple passes over every cell. Table.stream writes rows as they are
+        produced, using fixed column widths.
+    '''
+
+    MIN_PADDING = 2
+
+    # tabulate ANSI codes (CSI sequences and OSC 8 hyperlinks, replaced by their text)
+    _invisible = re.compile(
+        r'\x1b\[[\x30-\x3f]*[\x20-\x2f]*[\x40-\x7e]'
+        r'|\x1b\]8;(\w+=\w+:?)*;([^\x1b]+)\x1b\\([^\x1b]+)\x1b\]8;;\x1b\\')
+    _thousands = re.compile(r'^(([+-]?[0-9]{1,3})(?:,([0-9]{3}))*)?(?(1)\.[0-9]*|\.[0-9]+)?$')
+    _colored_int = re.compile(r'(\\[xX]+[0-9a-fA-F]+\[\d+[mM]+)([0-9.]+)(\\.*)$')
+
+    # column types, from the least to the most generic
+    BOOL, INT, FLOAT, STR = range(4)
+
+    _format = None
+    _wcswidth = None
+
+    @staticmethod
+    def format() -> TableFormat:
+        if Table._format is None:
+            Table._format = TableFormat(
+                lineabove=Line('', Color.s('{GR}─{W}'), Color.s('{GR}┬{W}'), ''),
+                linebelowheader=Line('', Color.s('{GR}─{W}'), Color.s('{GR}┼{W}'), ''),
+                linebelow=Line('', Color.s('{GR}─{W}'), Color.s('{GR}┴{W}'), ''),
+                headerrow=DataRow('', Color.s('{GR}│{W}'), ''),
+                datarow=DataRow('', Color.s('{GR}│{W}'), ''),
+                padding=1,
+            )
+        return Table._format
+
+    @staticmethod
+    def strip(text: str) -> str:
+        if '\x1b' not in text:
+            return text
+        return Table._invisible.sub(r'\3', text)
+
+    @staticmethod
+    def wcswidth(text: str) -> int:
+        ''' Terminal width of text, as wcwidth computes it (len when wcwidth is not installed) '''
+        if text.isascii() and text.isprintable():
+            return len(text)
+        if Table._wcswidth is None:
+            try:
+                from wcwidth import wcswidth
+            except ImportError:
+                wcswidth = len
+            Table._wcswidth = wcswidth
+        return Table._wcswidth(text)
+
+    @staticmethod
+    def _is_float(text: str) -> bool:
+        try:
+            value = float(text)
+        except (ValueError, TypeError):
+            return False
+        return not (math.isinf(value) or math.isnan(value)) or text.lower() in ('inf', '-inf', 'nan')
+
+    @staticmethod
+    def _is_int(text: str) -> bool:
+        try:
+            int(text)
+        except (ValueError, TypeError):
+            return False
+        return True
+
+    @staticmethod
+    def cell_type(text: str) -> int:
+        ''' Type of the cell, None for empty cells, which do not change the column type '''
+        text = Table.strip(text)
+        if text == '':
+            return None
+        if text in ('True', 'False'):
+            return Table.BOOL
+        if Table._is_int(text) or (Table._thousands.match(text) and '.' not in text):
+            return Table.INT
+        if Table._is_float(text) or Table._thousands.match(text):
+            return Table.FLOAT
+        return Table.STR
+
+    @staticmethod
+    def column_type(cells: Iterable[str]) -> int:
+        ctype = Table.BOOL
+        for c in cells:
+            t = Table.cell_type(c)
+            if t is not None and t > ctype:
+                ctype = t
+                if ctype == Table.STR:
+                    break
+        return ctype
+
+    @staticmethod
+    def _afterpoint(text: str) -> int:
+        ''' Number of symbols after the decimal point, -1 when there is none '''
+        if Table._is_float(text) or Table._thousands.match(text):
+            if Table._is_int(text):
+                return -1
+            pos = text.rfind('.')
+            pos = text.lower().rfind('e') if pos < 0 else pos
+            return len(text) - pos - 1 if pos >= 0 else -1
+        return -1
+
+    @staticmethod
+    def format_number(text: str, ctype: int, has_invisible: bool) -> str:
+        ''' Numeric cells are written as tabulate formats them (intfmt '', floatfmt 'g') '''
+        if text == '':
+            return text
+        if ctype == Table.INT:
+            escaped = text.encode('unicode_escape').decode('UTF-8')
+            m = Table._colored_int.search(escaped)
+            if m is not None and m.group(2).isdigit():
+                text = (m.group(1) + format(int(m.group(2)), '') + m.group(3)).encode('UTF-8').decode('unicode_escape')
+            return text
+        if has_invisible:
+            raw = Table.strip(text)
+            try:
+                return text.replace(raw, format(float(raw), 'g'))
+            except (ValueError, TypeError):
+                return text
+        try:
+            return format(float(text.replace(',', '')), 'g')
+        except (ValueError, TypeError):
+            return text
+
+    @staticmethod
+    def _line(fmt: TableFormat, line: Line, widths: List[int]) -> str:
+        return (line.begin + line.sep.join([line.hline * (w + 2 * fmt.padding) for w in widths]) + line.end).rstrip()
+
+    @staticmethod
+    def _row(fmt: TableFormat, row: DataRow, cells: Iterable[str]) -> str:
+        pad = ' ' * fmt.padding
+        return (row.begin + row.sep.join([pad + c + pad for c in cells]) + row.end).rstrip()
+
+    @staticmethod
+    def render(rows: Iterable[tuple], headers: List[str]) -> Iterator[str]:
+        ''' Yields the lines of the table, byte for byte as tabulate builds them '''
+        fmt = Table.format()
+        rows = [list(r) for r in rows]
+        headers = [str(h) for h in headers]
+        ncols = len(headers)
+        cols = [[r[i] for r in rows] for i in range(ncols)] if len(rows) > 0 else []
+
+        has_invisible = any('\x1b' in c and Table._invisible.search(c) is not None
+                            for c in headers + [c for col in cols for c in col])
+        if has_invisible:
+            def width(text):
+                return Table.wcswidth(Table.strip(text))
+        else:
+            width = Table.wcswidth
+
+        types = [Table.column_type(col) for col in cols]
+        numeric = [t in (Table.INT, Table.FLOAT) for t in types]
+        for i, col in enumerate(cols):
+            if numeric[i]:
+                cols[i] = [Table.format_number(c, types[i], has_invisible) for c in col]
+
+        minwidths = [width(h) + Table.MIN_PADDING for h in headers]
+        for i, col in enumerate(cols):
+            if numeric[i]:
+                # decimal alignment: the cells are not stripped and are flushed right
+                decimals = [Table._afterpoint(Table.strip(c) if has_invisible else c) for c in col]
+                maxdecimals = max(decimals)
+                col = [c + (maxdecimals - d) * ' ' for c, d in zip(col, decimals)]
+            else:
+                col = [c.strip() for c in col]
+            widths = [width(c) for c in col]
+            maxwidth = max(max(widths), minwidths[i])
+            if numeric[i]:
+                cols[i] = [c.rjust(maxwidth - (w - len(c))) for c, w in zip(col, widths)]
+            else:
+                cols[i] = [c.ljust(maxwidth - (w - len(c))) for c, w in zip(col, widths)]
+
+        if len(cols) > 0:
+            widths = [max(minw, max(width(c) for c in col)) for minw, col in zip(minwidths, cols)]
+        else:
+            widths = minwidths
+            numeric = [False] * ncols
+
+        cells = []
+        for h, w, n in zip(headers, widths, numeric):
+            w += len(h) - width(h)
+            cells.append(h.rjust(w) if n else h.ljust(w))
+
+        yield Table._line(fmt, fmt.lineabove, widths)
+        yield Table._row(fmt, fmt.headerrow, cells)
+        yield Table._line(fmt, fmt.linebelowheader, widths)
+        for row in zip(*cols):
+            yield Table._row(fmt, fmt.datarow, row)
+        yield Table._line(fmt, fmt.linebelow, widths)
+
+    @staticmethod
+    def header(headers: List[str], widths: List[int]) -> List[str]:
+        ''' Top lines of a table with fixed column widths '''
+        fmt = Table.format()
+        return [
+            Table._line(fmt, fmt.lineabove, widths),
+            Table._fixed_row(fmt, fmt.headerrow, headers, widths),
+            Table._line(fmt, fmt.linebelowheader, widths),
+        ]
+
+    @staticmethod
+    def row(cells: Iterable[str], widths: List[int]) -> str:
+        ''' Data row with fixed column widths: cells are stripped and flushed left (wider cells are written as they are) '''
+        fmt = Table.format()
+        return Table._fixed_row(fmt, fmt.datarow, cells, widths)
+
+    @staticmethod
+    def separator(widths: List[int]) -> str:
+        ''' Line between the rows, where the column widths change '''
+        fmt = Table.format()
+        return Table._line(fmt, fmt.linebelowheader, widths)
+
+    @staticmethod
+    def bottom(widths: List[int]) -> str:
+        fmt = Table.format()
+        return Table._line(fmt, fmt.linebelow, widths)
+
+    @staticmethod
+    def _fixed_row(fmt: TableFormat, row: DataRow, cells: Iterable[str], widths: List[int]) -> str:
+        ''' Cells padded to the widths by their terminal width, as render measures them '''
+        pad = ' ' * fmt.padding
+        return (row.begin + row.sep.join([
+            pad + c + ' ' * (w - Table.wcswidth(Table.strip(c)) + fmt.padding)
+            for c, w in zip([c.strip() for c in cells], widths)
+        ]) + row.end).rstrip()
+
+    @staticmethod
+    def stream(rows: Iterable[tuple], headers: List[str], widths: List[int]) -> Iterator[str]:
+        ''' Yields the lines of the table as the rows are produced, using the given column widths '''
+        fmt = Table.format()
+
+        yield from Table.header(headers, widths)
+        for row in rows:
+            yield Table._fixed_row(fmt, fmt.datarow, row, widths)
+        yield Table.bottom(widths)
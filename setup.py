@@ -20,6 +20,7 @@ import shutil
 import sys
 
 from setuptools import setup, find_packages
+from setuptools.command.build_py import build_py
 
 meta = {}
 here = os.path.abspath(os.path.dirname(__file__))
@@ -37,6 +38,27 @@ with open(f"{here}/ccat/requirements.txt", "r", encoding="utf-8") as f:
               "That indicates this copy of the source code is incomplete.")
         sys.exit(2)
 
+
+class BuildPy(build_py):
+    '''
+    Writes the extension -> lexer lookup table of the installed Pygments (see ccat/util/lexers.py)
+    into the built package. The tracked table is kept when Pygments is not installed yet.
+    '''
+
+    def run(self):
+        super().run()
+        if self.dry_run:
+            return
+        try:
+            sys.path.insert(0, here)
+            from ccat.util.lexers import LexerIndex
+            LexerIndex.save(os.path.join(self.build_lib, "ccat", "util", "lexers.json"))
+        except ImportError:
+            pass
+        finally:
+            sys.path.remove(here)
+
+
 with open(f"{here}/README.md", "r", encoding="utf-8") as f:
     readme = f.read()
 
@@ -72,6 +94,7 @@ setup(
     license=meta["__license__"],
     readme="README.md",
     zip_safe=False,
+    cmdclass={"build_py": BuildPy},
     classifiers=[
         "Development Status :: 5 - Production/Stable",
         "Environment :: Console",
@@ -96,7 +119,7 @@ setup(
         "Topic :: Utilities"
     ],
     entry_points={'console_scripts': [
-        'ccat=ccat.ccat:run',
+        'ccat=ccat.client:run',
         ]
     },
     project_urls={
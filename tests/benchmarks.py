@@ -0,0 +1,110 @@
+#!/usr/bin/python3
+# -*- coding: UTF-8 -*-
+'''
+Micro benchmarks of the string helpers called for every rendered row, and
+of the wrapping of a 5MB single line (minified files).
+
+    python tests/benchmarks.py [rows]
+
+Prints the total time and the time per row of each helper for the given
+number of rows (default 1M), then the time of each long line step. Color.t
+should beat Color.s, each long line step should stay under WRAP_BUDGET.
+'''
+
+import os
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ccat.ccat import ColorCat
+from ccat.util.color import Color
+
+# a typical highlighted row (formatter output)
+ROW = ('\x1b[38;5;203mdef\x1b[39m\x1b[38;5;253m \x1b[39m\x1b[38;5;108mrender\x1b[39m\x1b[38;5;253m(\x1b[39m'
+       '\x1b[38;5;208mself\x1b[39m\x1b[38;5;253m, chunks: Iterable[bytes], title: str = \x1b[39m'
+       '\x1b[38;5;142m\'\'\x1b[39m\x1b[38;5;253m)\x1b[39m\x1b[38;5;253m:\x1b[39m')
+
+
+def bench_color_s(rows: int) -> float:
+    return timeit.timeit(lambda: Color.s(' {W}{O}{D}%s{W} ' % '1234'), number=rows)
+
+
+def bench_color_t(rows: int) -> float:
+    return timeit.timeit(lambda: Color.t(' {W}{O}{D}%s{W} ') % '1234', number=rows)
+
+
+def bench_escape_ansi(rows: int) -> float:
+    return timeit.timeit(lambda: ColorCat.escape_ansi(ROW), number=rows)
+
+
+def bench_format_line_number(rows: int) -> float:
+    return timeit.timeit(lambda: ColorCat.format_line_number(123456, 7), number=rows)
+
+
+def bench_number_cell(rows: int) -> float:
+    ''' Line number cell of the table mode, as built by ColorCat.table_rows '''
+    number = Color.t(' {W}{O}{D}%s{W} ')
+    return timeit.timeit(lambda: number % ColorCat.format_line_number(123456, 7), number=rows)
+
+
+BENCHMARKS = [
+    ('Color.s', bench_color_s),
+    ('Color.t', bench_color_t),
+    ('escape_ansi', bench_escape_ansi),
+    ('format_line_number', bench_format_line_number),
+    ('number cell', bench_number_cell),
+]
+
+
+# seconds allowed to wrap a 5MB single line
+WRAP_BUDGET = 5
+
+
+def run(rows: int = 1000000) -> dict:
+    ''' Returns {benchmark name: total seconds} '''
+    return {name: bench(rows) for name, bench in BENCHMARKS}
+
+
+def run_long_line(size: int = 5 * 1024 * 1024) -> dict:
+    ''' Returns {step name: seconds} of a single line of size bytes '''
+    from pygments.lexers import get_lexer_by_name
+    from ccat.config import Configuration
+    from ccat.util.ansi import Ansi
+
+    token = '\x1b[38;5;108m"key"\x1b[39m\x1b[38;5;253m: \x1b[39m\x1b[38;5;174m12345\x1b[39m\x1b[38;5;253m, \x1b[39m'
+    line = token * (size // len(token))
+    data = b'var a=[1,"x",{"k":null}],' * (size // 26)
+    results = {}
+
+    start = time.perf_counter()
+    Ansi.wrap(line, 120)
+    results['Ansi.wrap'] = time.perf_counter() - start
+
+    # bold, italic and background tokens end with compound resets ('\x1b[39;49;00m')
+    compound = '\x1b[38;5;245;03m# note\x1b[39;00m \x1b[38;5;142;48;5;236mx\x1b[39;49;00m '
+    start = time.perf_counter()
+    Ansi.wrap(compound * (size // len(compound)), 120)
+    results['Ansi.wrap (compound resets)'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    ColorCat.format_line(line, 8, 130)
+    results['format_line'] = time.perf_counter() - start
+
+    Configuration.initialize(parse_arguments=False)
+    Configuration.no_tab, Configuration.simple = True, False
+    o = ColorCat()
+    o.lexer = get_lexer_by_name('text')
+    start = time.perf_counter()
+    list(o.render([data], 'bench'))
+    results['no tab pipeline'] = time.perf_counter() - start
+    return results
+
+
+if __name__ == '__main__':
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    for name, seconds in run(rows).items():
+        print('%-20s %8.3fs %10.1fns/row' % (name, seconds, seconds * 1e9 / rows))
+    for name, seconds in run_long_line().items():
+        print('%-28s %8.3fs %s' % (name, seconds, 'over budget' if seconds >= WRAP_BUDGET else ''))
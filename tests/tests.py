@@ -2,11 +2,32 @@
 import codecs
 
 import sys
+from contextlib import contextmanager
+
+import pytest
 
 from ccat.ccat import ColorCat
+from ccat.client import Client
+from ccat.config import Configuration
 from ccat.util.color import Color
 
 
+@contextmanager
+def config(**kwargs):
+    ''' Temporarily changes Configuration values '''
+    Configuration.initialize(parse_arguments=False)
+    old = {k: getattr(Configuration, k) for k in kwargs}
+    try:
+        for k, v in kwargs.items():
+            setattr(Configuration, k, v)
+        Configuration.compile_ranges()
+        yield
+    finally:
+        for k, v in old.items():
+            setattr(Configuration, k, v)
+        Configuration.compile_ranges()
+
+
 def test_read_file():
     sys.argv = ['ccat', 'ccat.py']
     if sys.stdout.encoding is None:
@@ -35,3 +56,967 @@ def test_read_file():
         Color.pl('\n{!} {R}Exiting{W}\n')
 
         assert False
+
+
+def test_stream_windows():
+    from ccat.stream import Stream
+
+    with open('ccat/ccat.py', 'rb') as f:
+        data = f.read()
+
+    with config(simple=True, window=5000):
+        full = list(ColorCat().render([data]))
+
+    # small read chunks and windows must not change the visible text
+    with config(simple=True, window=7):
+        chunks = [data[i:i + 13] for i in range(0, len(data), 13)]
+        streamed = list(ColorCat().render(chunks))
+
+    assert [ColorCat.escape_ansi(l) for l in full] == [ColorCat.escape_ansi(l) for l in streamed]
+    assert list(Stream.strip_edges(Stream.split_lines(Stream.decode([b'\n\na\n\n\nb\n\n'])))) == ['a', '', '', 'b']
+    assert ''.join(Stream.decode([b'\xef\xbb\xbf\xc3', b'\xa1'])) == '\xe1'
+
+    # buffers are read by memoryview slices
+    assert [bytes(c) for c in Stream.slices(b'abcde', 2)] == [b'ab', b'cd', b'e']
+
+    report = []
+    assert ''.join(Stream.decode(Stream.slices(b'\xef\xbb\xbfab\xff', 2), report.append)) == 'ab\xff'
+    assert report == ['UTF-8 with BOM', 'latin-1 (invalid UTF-8 at byte 5)']
+
+
+def test_line_ranges():
+    import random
+    from ccat.util.ranges import LineRanges
+
+    rnd = random.Random(42)
+    for _ in range(200):
+        filters = []
+        for _ in range(rnd.randint(0, 8)):
+            start = rnd.randint(0, 60)
+            filters.append((start, rnd.choice([0, start + rnd.randint(0, 10), rnd.randint(0, 60)])))
+
+        ranges = LineRanges(filters)
+        for line in list(range(1, 80)) + [rnd.randint(1, 80) for _ in range(40)]:
+            valid = any(line >= x[0] and (x[1] == 0 or line <= x[1]) for x in filters)
+            dot = not valid and any(x[0] != 0 and line == x[0] - 1 for x in filters)
+            assert ranges.contains(line) == valid
+            assert ranges.is_before(line) == dot
+
+
+def test_range_lexing():
+    import json
+    import random
+    from pygments.lexers import get_lexer_by_name
+    from ccat.formatter import SGRFormatter
+
+    with open('ccat/ccat.py', 'r') as f:
+        python = f.read().replace('\t', '  ').split('\n')
+
+    docs = {
+        'json': json.dumps([
+            {'id': i, 'tags': ['a', 'b'], 'nested': {'x': [1, {'y': None}], 'ok': True}} for i in range(200)
+        ], indent=2).split('\n'),
+        'python': python,
+        'yaml': ''.join(
+            'item%d:\n  name: "n%d"\n  list:\n    - a\n    - {b: 1}\n  text: |\n    multi line\n    # not comment\n' % (i, i)
+            for i in range(200)).split('\n'),
+        'text': ['2024-01-01 12:00:%02d host app[%d]: INFO message "%d" done' % (i % 60, i, i) for i in range(2000)],
+    }
+
+    def _cells(line):
+        # (style, char) pairs, so a token split in two with the same color still matches
+        import re
+        style, cells = '', []
+        for code, text in re.findall(r'(\x1b\[[0-9;]*m)?([^\x1b]*)', line):
+            style = '' if code in ('\x1b[39m', '\x1b[0m', '\x1b[39;49;00m') else style + code
+            cells += [(style, c) for c in text]
+        return cells
+
+    def _highlight(lexer, lines):
+        o = ColorCat()
+        o.lexer = get_lexer_by_name(lexer)
+        fmt = SGRFormatter(style=Configuration.style)
+        return {n: l for n, l in o.highlight(enumerate(lines, 1), fmt) if l is not None}
+
+    # windows lexed with the default context must match the full document highlight
+    rnd = random.Random(7)
+    for lexer, lines in docs.items():
+        with config(lines=[], window=100000):
+            full = _highlight(lexer, lines)
+
+        for _ in range(20):
+            start = rnd.randint(1, len(lines))
+            with config(lines=[(start, start + rnd.randint(0, 30))], window=50, context=100):
+                part = _highlight(lexer, lines)
+            assert len(part) > 0
+            assert all(_cells(full[n]) == _cells(l) for n, l in part.items()), lexer
+
+
+def test_resync():
+    from pygments.lexers import get_lexer_by_name
+    from ccat.formatter import SGRFormatter
+
+    # the least indented context lines ("b'''") are inside strings
+    lines = ''.join(
+        'def f%d(x):\n    """Docstring of f%d.\n\n    returns x plus %d\n    """\n'
+        "    s = '''a\nb'''\n    return x + %d  # add\n\n" % (i, i, i, i) for i in range(300)).split('\n')
+
+    def _highlight():
+        o = ColorCat()
+        o.lexer = get_lexer_by_name('python')
+        fmt = SGRFormatter(style=Configuration.style)
+        return [(n, SGRFormatter.runs(l)) for n, l in o.highlight(enumerate(lines, 1), fmt)]
+
+    with config(lines=[], window=100000):
+        full = _highlight()
+    for window in (7, 50, 333):
+        with config(lines=[], window=window, context=20):
+            assert _highlight() == full, window
+
+
+def test_range_resync():
+    from pygments.lexers import get_lexer_by_name
+    from ccat.formatter import SGRFormatter
+
+    # the least indented context lines ("b'''") are inside strings, the docstrings have escapes
+    lines = ''.join(
+        'def f%d(x):\n    """Docstring of f%d.\n\n    joined by \'\\\\n\'\n    """\n'
+        "    s = '''a\nb'''\n    return x + %d  # add\n\n" % (i, i, i) for i in range(300)).split('\n')
+
+    def _highlight(lines):
+        o = ColorCat()
+        o.lexer = get_lexer_by_name('python')
+        fmt = SGRFormatter(style=Configuration.style)
+        out = {n: SGRFormatter.runs(l) for n, l in o.highlight(enumerate(lines, 1), fmt) if l is not None}
+        return out, o.resync
+
+    with config(lines=[], window=100000):
+        full, _ = _highlight(lines)
+
+    for ranges in ([(1003, 1006)], [(1001, 1004), (2000, 2050)], [(5, 13)]):
+        for option in ('lines', 'highlight_lines'):
+            with config(window=50, context=20, **{option: ranges}):
+                part, resync = _highlight(lines)
+                assert resync is False
+                assert all(full[n] == l for n, l in part.items() if ColorCat().is_highlight(n)), (option, ranges)
+
+    # lexed from the context (shorter than it): the line after the range closes the docstring
+    for option in ('lines', 'highlight_lines'):
+        with config(window=50, context=20, **{option: [(11, 13)]}):
+            part, resync = _highlight(lines[:27])
+            assert resync is True
+            assert all(full[n] == l for n, l in part.items() if ColorCat().is_highlight(n)), option
+
+
+def test_seek_lines(tmp_path):
+    from pygments.lexers import get_lexer_by_name
+
+    data = b'\r\n\n' + b''.join(b'line %d\r\n' % i for i in range(500)) + b'\n\n'
+    filename = tmp_path / 'sample.txt'
+    filename.write_bytes(data)
+
+    with config(lines=[(10, 20), (30, 29), (400, 0)], window=50, no_tab=True, simple=False):
+        o = ColorCat()
+        o.lexer = get_lexer_by_name('text')
+        streamed = list(o.render([data], 'title', lambda: data.count(b'\n') + 1))
+
+        with open(filename, 'rb') as f:
+            lines, total = o.seek_lines(f)
+            seek = list(o.render_lines(lines, 'title', total))
+
+    assert total == 500
+    assert seek == streamed
+
+
+def test_line_index(tmp_path):
+    from ccat.util.lineindex import LineIndex
+
+    def _offsets(data):
+        return [0] + [i + 1 for i, c in enumerate(data) if c == 0x0a]
+
+    filename = str(tmp_path / 'app.log')
+    cache_dir = str(tmp_path / 'cache')
+    data = b''.join(b'line %d\n' % i for i in range(1000))
+    with open(filename, 'wb') as f:
+        f.write(data)
+
+    index = LineIndex.open(filename, cache_dir, chunk_size=100)
+    assert list(index.offsets) == _offsets(data)
+    assert len(index) == data.count(b'\n') + 1
+    assert index.get(len(index) + 1) is None
+
+    # unchanged file: loaded from the sidecar
+    index = LineIndex.open(filename, cache_dir)
+    assert isinstance(index.offsets, memoryview)
+    assert list(index.offsets) == _offsets(data)
+
+    # appended file: the sidecar is extended
+    with open(filename, 'ab') as f:
+        f.write(b'partial')
+        data += b'partial'
+    with open(filename, 'ab') as f:
+        f.write(b' end\nlast')
+        data += b' end\nlast'
+    index = LineIndex.open(filename, cache_dir)
+    assert list(index.offsets) == _offsets(data)
+    assert list(LineIndex.open(filename, cache_dir).offsets) == _offsets(data)
+
+    # rewritten file: the sidecar is rebuilt
+    data = b'a\nb\n'
+    with open(filename, 'wb') as f:
+        f.write(data)
+    assert list(LineIndex.open(filename, cache_dir).offsets) == _offsets(data)
+
+
+def test_render_cache(tmp_path):
+    import os
+    from ccat.util.cache import RenderCache
+
+    cache = RenderCache(str(tmp_path), max_size=100)
+    key = RenderCache.key(b'data', style='gruvbox-dark', width=80)
+    assert key != RenderCache.key(b'data', style='gruvbox-dark', width=81)
+
+    assert cache.get(key) is None
+    assert list(cache.store(key, ['a', 'b'])) == ['a', 'b']
+    assert ''.join(RenderCache.read(cache.get(key))) == 'a\nb\n'
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert (RenderCache(str(tmp_path)).hits, RenderCache(str(tmp_path)).misses) == (1, 1)
+
+    # the entries are readable only by the user
+    if os.name == 'posix':
+        assert os.stat(cache.entry(key)).st_mode & 0o777 == 0o600
+        assert os.stat(os.path.dirname(cache.entry(key))).st_mode & 0o777 == 0o700
+
+    # an interrupted render is not stored
+    def _fail():
+        yield 'x'
+        raise ValueError()
+
+    key2 = RenderCache.key(b'other')
+    try:
+        list(cache.store(key2, _fail()))
+    except ValueError:
+        pass
+    assert not os.path.exists(cache.entry(key2))
+
+    # least recently used entries are evicted over max_size
+    os.utime(cache.entry(key), (1, 1))
+    list(cache.store(key2, ['y' * 60]))
+    list(cache.store(RenderCache.key(b'third'), ['z' * 38]))
+    assert not os.path.exists(cache.entry(key))
+    assert os.path.exists(cache.entry(key2))
+
+
+@pytest.mark.skipif(sys.platform == 'win32', reason='needs the resource module')
+def test_render_cache_memory(tmp_path):
+    import os
+    import subprocess
+
+    # peak RSS of a cache miss: files are read by chunks, so it does not grow with the file
+    # (it did by several times its size when the file was read at once)
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    script = ('import resource, sys; sys.argv[0] = "ccat"; from ccat.ccat import run\n'
+              'try:\n    run()\nexcept SystemExit:\n    pass\n'
+              'sys.stderr.write("%d\\n" % resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)')
+
+    def _peak(size):
+        filename = tmp_path / ('%d.txt' % size)
+        filename.write_text(('x' * 255 + '\n') * (size // 256))
+        p = subprocess.run([sys.executable, '-c', script, str(filename), '--cache', '--cache-dir', str(tmp_path)],
+                           env=dict(os.environ, PYTHONPATH=root), stdin=subprocess.DEVNULL,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        # KB on Linux, bytes on macOS
+        return int(p.stderr.split()[-1]) * (1 if sys.platform == 'darwin' else 1024)
+
+    small, large = 1024 * 1024, 16 * 1024 * 1024
+    assert _peak(large) - _peak(small) < (large - small) // 2
+
+
+def test_batch(tmp_path):
+    import os
+    from ccat.batch import Batch
+
+    (tmp_path / 'conf').mkdir()
+    (tmp_path / 'conf' / '.hidden').write_text('x')
+    (tmp_path / 'conf' / 'b.yaml').write_text('b: 1\n')
+    (tmp_path / 'conf' / 'a.yaml').write_text('a: 1\n')
+    (tmp_path / 'c.json').write_text('{"c": 1}')
+
+    names = Configuration.expand_filenames([str(tmp_path / 'c.*'), str(tmp_path / 'conf'), str(tmp_path / 'missing')])
+    assert names == [
+        str(tmp_path / 'c.json'),
+        os.path.join(str(tmp_path / 'conf'), 'a.yaml'),
+        os.path.join(str(tmp_path / 'conf'), 'b.yaml'),
+        str(tmp_path / 'missing'),
+    ]
+
+    spool = tmp_path / 'spool'
+    spool.mkdir()
+    with config(jobs=2, simple=False, no_tab=True, cache=False):
+        assert 'does not exists' in (spool / Batch.render(names[-1], Configuration.snapshot(), str(spool))).read_text()
+        text = (spool / Batch.render(names[0], Configuration.snapshot(), str(spool))).read_text()
+    assert 'File: %s' % names[0] in ColorCat.escape_ansi(text)
+    assert Batch.workers(0, 1) == 1
+    assert Batch.workers(3, 10) == 3
+
+
+# cumulative import time budget of the ccat package (microseconds) for --version / --help
+STARTUP_BUDGET = 250000
+
+
+def test_startup_imports():
+    import os
+    import subprocess
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    for arg in ['--version', '--help']:
+        p = subprocess.run([sys.executable, '-X', 'importtime', '-m', 'ccat', arg],
+                           cwd=root, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        assert p.returncode == 0
+
+        # import time: self [us] | cumulative | imported package
+        times = {}
+        for line in p.stderr.decode('UTF-8').splitlines():
+            if line.startswith('import time:') and '|' in line:
+                _, cumulative, name = line.split('|')
+                if cumulative.strip().isdigit():
+                    # nested imports are indented
+                    times[name.rstrip()[1:]] = int(cumulative)
+
+        loaded = set(n.strip().split('.')[0] for n in times)
+        assert loaded.isdisjoint(['pygments', 'PIL', 'ansi2image', 'tabulate']), arg
+        assert sum(t for n, t in times.items() if n.startswith('ccat')) < STARTUP_BUDGET, arg
+
+
+def test_lexer_index(tmp_path, monkeypatch):
+    import os
+    from pygments.lexers import get_lexer_for_filename
+    from ccat.util.lexers import LexerIndex
+
+    names = ['ccat.py', 'a/b/config.yaml', 'CMakeLists.txt', 'Makefile.am', 'page.php5', 'x.h', 'app.log', 'README',
+             '.ini', 'conf/.cfg', '.properties', '.bashrc', '.gitignore', '.htaccess', 'a.htaccess']
+
+    def _check(cache_dir=None):
+        for name in names:
+            try:
+                expected = type(get_lexer_for_filename(name))
+            except Exception:
+                expected = None
+            assert LexerIndex.lookup(name, cache_dir) is expected, name
+
+    _check()
+
+    # table of another Pygments version: without cache directory the registry resolves the
+    # names, still memoized per extension
+    monkeypatch.setattr(LexerIndex, 'FILENAME', str(tmp_path / 'missing.json'))
+    monkeypatch.setattr(LexerIndex, '_table', None)
+    monkeypatch.setattr(LexerIndex, '_memo', {})
+    _check()
+    assert LexerIndex.table() is None
+    assert (None, '.py') in LexerIndex._memo and ('ccat.py', None) not in LexerIndex._memo
+    assert ('CMakeLists.txt', None) in LexerIndex._memo
+
+    # built once for the installed version in the cache directory
+    monkeypatch.setattr(LexerIndex, '_memo', {})
+    _check(str(tmp_path / 'cache'))
+    assert LexerIndex.table() is not None
+    assert len(os.listdir(str(tmp_path / 'cache'))) == 1
+
+
+def test_guess_lexer():
+    from ccat.util.lexers import LexerIndex
+
+    assert LexerIndex.hint('#!/usr/bin/env -S python3 -u\nprint(1)') == 'python3'
+    assert LexerIndex.hint('# -*- mode: ruby; coding: utf-8 -*-\nputs 1') == 'ruby'
+    assert LexerIndex.hint('a: 1\n', tail='b: 2\n# vim: set ft=yaml:\n') == 'yaml'
+    assert LexerIndex.guess('#!/bin/sh\necho 1').name == 'Bash'
+
+    # the decision is cached by content signature, the oldest ones are dropped
+    lexer = LexerIndex.guess('just some text\n' * 10)
+    assert LexerIndex.guess('just some text\n' * 10).name == lexer.name
+    for i in range(LexerIndex.GUESSES + 10):
+        LexerIndex.guess('text %d\n' % i)
+    assert len(LexerIndex._guesses) == LexerIndex.GUESSES
+
+    with config(guess_size=12):
+        assert ColorCat.guess_lexer(['#!/bin/bash', 'x' * 1000]).name == 'Bash'
+
+
+def test_sgr_formatter():
+    from pygments import highlight
+    from pygments.lexers import get_lexer_by_name
+    from pygments.formatters.terminal256 import Terminal256Formatter
+    from ccat.formatter import SGRFormatter
+
+    Configuration.initialize(parse_arguments=False)
+    with open('ccat/ccat.py', 'r') as f:
+        code = f.read()
+
+    lexer = get_lexer_by_name('python', stripnl=False)
+    expected = highlight(code, lexer, Terminal256Formatter(style=Configuration.style)).split('\n')
+    fmt = SGRFormatter(style=Configuration.style, dim=('<', '>'))
+    assert list(fmt.lines(lexer.get_tokens(code))) == expected
+
+    # dimmed lines are the plain text between the dim sequences
+    lines = list(fmt.lines(lexer.get_tokens(code), plain=lambda i: i % 2 == 1))
+    plain = code.split('\n')
+    assert lines[0] == expected[0]
+    assert lines[1] == '<%s>' % plain[1]
+    assert lines[5] == '<%s>' % plain[5]
+
+
+def test_dimmed_lines_not_lexed():
+    import re
+    from pygments.lexers import get_lexer_by_name
+    from ccat.formatter import SGRFormatter
+
+    lines = ['value_%d = %d' % (i, i) for i in range(1, 5001)]
+    lexed = []
+
+    o = ColorCat()
+    o.lexer = get_lexer_by_name('python')
+    get_tokens = o.lexer.get_tokens
+    o.lexer.get_tokens = lambda code: lexed.append(code) or get_tokens(code)
+
+    with config(highlight_lines=[(3000, 3002)], context=10):
+        out = dict(o.highlight(enumerate(lines, 1), SGRFormatter(style=Configuration.style, dim=('<', '>'))))
+
+    # past the first lines (lexed once to check the resync) only the window and its context
+    assert o.resync is True
+    assert [n for code in lexed for n in re.findall(r'^value_(\d+)', code, re.M) if int(n) > 500] == \
+        [str(n) for n in range(2990, 3004)]
+    assert out[1] == '<value_1 = 1>'
+    assert out[3001] != '<value_3001 = 3001>' and ColorCat.escape_ansi(out[3001]) == 'value_3001 = 3001'
+
+
+def test_wrap_long_line():
+    from pygments.lexers import get_lexer_by_name
+    from ccat.util.ansi import Ansi
+
+    # long lines (minified files) are split once into texts and sequences, whatever their
+    # length (timings: tests/benchmarks.py)
+    split = Ansi._split
+    passes = []
+
+    class _Split(object):
+        def split(self, text):
+            passes.append(len(text))
+            return split.split(text)
+
+    token = '\x1b[38;5;108m"key"\x1b[39m\x1b[38;5;253m: \x1b[39m\x1b[38;5;174m12345\x1b[39m\x1b[38;5;253m, \x1b[39m'
+    line = token * (1024 * 1024 // len(token))
+    Ansi._split = _Split()
+    try:
+        chunks = Ansi.wrap(line, 120)
+        assert len(passes) == 1
+        assert all(len(Ansi.strip(c)) <= 120 for c in chunks)
+        assert ''.join(Ansi.strip(c) for c in chunks) == Ansi.strip(line)
+        # the colors carried to the continuation chunks do not pile up
+        assert max(len(c) for c in chunks) < 120 * 8
+
+        # nor with the compound resets of the bold, italic and background tokens of Pygments
+        compound = '\x1b[38;5;245;03m# note\x1b[39;00m \x1b[38;5;142;48;5;236mx\x1b[39;49;00m '
+        passes.clear()
+        chunks = Ansi.wrap(compound * (1024 * 1024 // len(compound)), 120)
+        assert len(passes) == 1
+        assert max(len(c) for c in chunks) < 120 * 8
+        assert Ansi.wrap('\x1b[38;5;245;03m' + 'x' * 30 + '\x1b[39;00m', 20)[1].startswith(
+            Ansi.RESET + '\x1b[38;5;245;03m')
+        assert Ansi.wrap('\x1b[38;5;245;03mx\x1b[39;00m' + 'y' * 30, 20)[1] == Ansi.RESET + 'y' * 11
+
+        passes.clear()
+        text = ColorCat.format_line(line, 8, 130)
+        assert len(passes) == 1
+        assert all(len(Ansi.strip(l)) <= 130 for l in text.split('\n'))
+
+        # whole no tab pipeline of a synthetic 1MB single line file
+        o = ColorCat()
+        o.lexer = get_lexer_by_name('text')
+        data = b'var a=[1,"x",{"k":null}],' * (1024 * 1024 // 26)
+        passes.clear()
+        with config(no_tab=True, simple=False):
+            out = list(o.render([data], 'bench'))
+        assert len(passes) == 1
+        assert out[1].count('\n') > 1024 * 1024 // 200
+    finally:
+        Ansi._split = split
+
+
+def test_color_templates():
+    import benchmarks
+
+    assert Color.t(' {W}{O}{D}%s{W} ') % '{R}12' == Color.s(' {W}{O}{D}') + '{R}12' + Color.s('{W} ')
+    assert Color.s('{!} {GR}x{W}') == ' \033[33m[\033[31m!\033[33m]\033[0m \033[38;5;247mx\033[0m'
+    assert Color.sc('{+} {G}ok{W}') == ' [+] ok'
+    assert ColorCat.escape_ansi(benchmarks.ROW).startswith("def render(self, chunks")
+
+    # templates are compiled once (timings: tests/benchmarks.py)
+    template = ' {W}{GR}%s{W} '
+    compiled = Color.t(template)
+    assert Color.t(template) is compiled and Color._templates[template] is compiled
+
+
+def test_table_render():
+    from ccat.util.table import Table
+
+    # golden output of tabulate(rows, ['', title], tablefmt='ccat')
+    def _line(sep, w1, w2):
+        h = '\x1b[38;5;247m─\x1b[0m'
+        return h * w1 + '\x1b[38;5;247m%s\x1b[0m' % sep + h * w2
+
+    bar = ' \x1b[38;5;247m│\x1b[0m '
+    assert list(Table.render([(' 1 ', 'def f():'), ('   ', '    return 1'), ('  ...  ', '')],
+                             ['', 'File: a.py'])) == [
+        _line('┬', 5, 14),
+        '    ' + bar + 'File: a.py',
+        _line('┼', 5, 14),
+        ' 1  ' + bar + 'def f():',
+        '    ' + bar + 'return 1',
+        ' ...' + bar.rstrip(),
+        _line('┴', 5, 14),
+    ]
+
+    # numeric columns are flushed right, colored floats reformatted
+    assert list(Table.render([(' 1 ', '\x1b[31m1.50\x1b[0m'), (' 2 ', '22')], ['', 'n'])) == [
+        _line('┬', 5, 6),
+        '    ' + bar + '   n',
+        _line('┼', 5, 6),
+        '  1 ' + bar + ' \x1b[31m1.5\x1b[0m',
+        '  2 ' + bar + '22',
+        _line('┴', 5, 6),
+    ]
+
+    # wide characters take two columns
+    assert list(Table.render([(' 1 ', '日本日本')], ['', 'w']))[-1] == _line('┴', 5, 10)
+
+    # streamed rows use the given widths
+    assert list(Table.stream([(' 1 ', 'x')], ['', 'File: a'], [3, 9]))[3] == ' 1  ' + bar + 'x'
+
+    # and are aligned as render does with wide characters
+    rows = [('日本', 'a'), ('\x1b[31m🙂\x1b[0m', 'b'), ('xy', 'c')]
+    rendered = list(Table.render(rows, ['', 'w']))
+    streamed = list(Table.stream(rows, ['', 'w'], [4, 3]))
+    assert [Table.wcswidth(Table.strip(l).split('│')[0]) for l in streamed[3:6]] == \
+        [Table.wcswidth(Table.strip(l).split('│')[0]) for l in rendered[3:6]] == [6, 6, 6]
+
+
+def test_json_reindent():
+    import json
+    from pygments.lexers.data import JsonLexer
+    from ccat.formatter import SGRFormatter
+    from ccat.jsonlexer import IndentedJsonLexer
+    from ccat.jsonstream import JsonStream
+
+    doc = '{"a": [1, -0, 2.50, 1e400, "\\u00e9\\/", "日本", {}, []],\n "b": {"c": null, "d": [true, {"e": false}]}}'
+    head, rest = JsonStream.reindent(doc.split('\n'), 5000)
+    assert head == json.dumps(json.loads(doc), indent=2).split('\n')
+    assert list(rest) == []
+
+    # only the first window is buffered
+    head, rest = JsonStream.reindent(['[' + ','.join(['1'] * 100) + ']'], 10)
+    assert len(head) == 11 and len(list(rest)) == 91
+
+    # not JSON: every line read is given back
+    raw = ['{"a": 1,', '  "b": 2,,', '  "c": 3}', 'more']
+    head, rest = JsonStream.reindent(iter(raw), 5000)
+    assert head is None and list(rest) == raw
+
+    # invalid after the first window: the rest is written as it is
+    head, rest = JsonStream.reindent(['[1, 2, 3, 4, 5, x, 6]', '7'], 2)
+    assert head == ['[', '  1,', '  2,'] and list(rest) == ['  3,', '  4,', '  5,', 'x, 6]', '7']
+
+    assert JsonStream.sniff(['', '  {', '"a": 1}'])
+    assert JsonStream.sniff(['[1, 2]'])
+    assert not JsonStream.sniff(['[section]'])
+    assert not JsonStream.sniff(['{ a: 1 }'])
+
+    # formatted lines are the JsonLexer ones
+    lines = json.dumps(json.loads(doc.replace('1e400', '-1.5e-7')), indent=2).split('\n')
+    formatter = SGRFormatter(style=Configuration.get_style('gruvbox-dark'), dim=('<', '>'))
+    lexer = JsonLexer()
+    lexer.stripnl = False
+    for plain in (None, lambda i: i % 2 == 0):
+        expected = list(formatter.lines(lexer.get_tokens('\n'.join(lines) + '\n'), plain=plain))[:len(lines)]
+        assert list(IndentedJsonLexer().format_lines(lines, formatter, plain)) == expected
+    assert IndentedJsonLexer().format_lines(['{ // comment'], formatter) is None
+
+
+def test_jsonl(tmp_path):
+    import json
+    from ccat.jsonlines import JsonLines
+
+    records = [{'id': i, 'tags': ['a', i], 'sub': {}} for i in range(7)]
+    data = '\n'.join(json.dumps(r) for r in records[:3]) + '\n\n{"bad": }\n' + '\n'.join(
+        json.dumps(r) for r in records[3:])
+    filename = tmp_path / 'events.log'
+    filename.write_text(data)
+
+    assert JsonLines.sniff(data.split('\n'))
+    assert JsonLines.sniff(['1'], 'events.ndjson')
+    assert not JsonLines.sniff(['{', '  "a": 1', '}'])
+    assert not JsonLines.sniff(['{"a": 1}'])
+
+    # each record is re-indented on its own, blank and invalid lines are kept
+    with config(simple=True, no_tab=False, lines=[]):
+        text = ColorCat.escape_ansi('\n'.join(ColorCat().render([data.encode()])))
+    expected = [json.dumps(r, indent=2) for r in records]
+    assert text == '\n'.join(expected[:3] + ['', '{"bad": }'] + expected[3:])
+
+    # the line numbers are the ones of the file, the batches give the same output in parallel
+    batch = JsonLines.BATCH
+    try:
+        JsonLines.BATCH = 2
+        outputs = []
+        for jobs in (1, 2):
+            with config(simple=False, no_tab=True, jobs=jobs, lines=[(6, 7)], window=4):
+                o = ColorCat()
+                outputs.append(list(o.render([data.encode()], 'title', lambda chars=(b'\n',): 10)))
+                with open(filename, 'rb') as f:
+                    lines, total = o.seek_lines(f)
+                    outputs.append(list(o.render_lines(lines, 'title', total)))
+    finally:
+        JsonLines.BATCH = batch
+
+    assert all(out == outputs[0] for out in outputs)
+    rows = ColorCat.escape_ansi('\n'.join(outputs[0][1:])).split('\n')
+    assert [l.split(':')[0].strip() for l in rows if not l.startswith('      ')] == ['...', '6', '7', '...']
+    assert len(rows) == 2 + 2 * len(expected[0].split('\n'))
+
+
+def test_follow(tmp_path):
+    import os
+    from ccat.follow import Follow
+    from ccat.util.lineindex import LineIndex
+
+    filename = tmp_path / 'app.log'
+    filename.write_bytes(b''.join(b'line %d\n' % i for i in range(1, 101)) + b'part')
+    source = Follow(str(filename), chunk_size=64)
+    try:
+        assert source.tail(3) == [(98, 'line 98'), (99, 'line 99'), (100, 'line 100')]
+        assert source.read() == []
+
+        # found reading backwards, the line breaks before them counted from the line index
+        index = LineIndex.open(str(filename), str(tmp_path / 'cache'))
+        for i in (index, None):
+            tail = Follow(str(filename), chunk_size=64)
+            assert tail.tail(2, i) == [(99, 'line 99'), (100, 'line 100')]
+            assert tail.tail(0, i) == [] and tail.number == 100
+            assert tail.pending == b'part' and tail.read() == []
+            tail.close()
+
+        # only complete lines are returned
+        with open(filename, 'ab') as f:
+            f.write(b'ial\n\tline 102\r\n')
+        assert source.read() == [(101, 'partial'), (102, '  line 102')]
+        assert source.check() is None
+
+        filename.write_bytes(b'x\n')
+        assert source.check() == 'truncated'
+        assert source.read() == [(1, 'x')]
+
+        os.rename(str(filename), str(filename) + '.1')
+        filename.write_bytes(b'new\n')
+        assert source.check() == 'replaced'
+        assert source.read() == [(1, 'new')]
+    finally:
+        source.close()
+
+
+def test_live_resync(capsys):
+    from pygments.lexers import get_lexer_by_name
+    from ccat.formatter import SGRFormatter
+
+    lines = ''.join(
+        'def f%d(x):\n    """Docstring of f%d."""\n'
+        "    s = '''a\nb'''\n    return x + %d\n\n" % (i, i, i) for i in range(200)).split('\n')
+    pairs = list(enumerate(lines, 1))
+
+    with config(simple=True, context=20):
+        o = ColorCat()
+        o.lexer = get_lexer_by_name('python')
+        o.print_live([(None, pairs[i:i + 7]) for i in range(0, len(pairs), 7)], 'title')
+        live = capsys.readouterr().out.split('\n')[:len(lines)]
+        full = list(SGRFormatter(style=Configuration.style).lines(o.lexer.get_tokens('\n'.join(lines) + '\n')))
+
+    # batches are lexed after lines ending inside strings ("b'''")
+    assert [SGRFormatter.runs(l) for l in live] == [SGRFormatter.runs(l) for l in full[:len(lines)]]
+
+
+def test_pipe(tmp_path, capsys, monkeypatch):
+    import io
+    import os
+    import select
+    from ccat.pipe import Pipe
+
+    def _batches():
+        r, w = os.pipe()
+        os.write(w, b'a\nb\npart')
+        pipe = Pipe(os.fdopen(r, 'rb'), chunk_size=4)
+        batches = pipe.batches(100)
+        # the available lines are returned without waiting for the end of the input
+        assert next(batches) == [(1, 'a'), (2, 'b')]
+        os.write(w, b'ial\n\n')
+        os.close(w)
+        assert list(batches) == [[(3, 'partial'), (4, '')]]
+        return pipe
+
+    assert _batches().queue is None
+
+    # pipes are not selectable on Windows: read by a thread
+    def _select(*args):
+        raise OSError('not a socket')
+
+    with monkeypatch.context() as m:
+        m.setattr(select, 'select', _select)
+        assert _batches().queue is not None
+
+    data = b''.join(b'x = %d\n' % i for i in range(8))
+    filename = tmp_path / 'input.py'
+    filename.write_bytes(data)
+
+    stdin = sys.stdin
+    try:
+        with config(simple=False, no_tab=True, window=5000, cache=False, filename=Configuration.STDIN):
+            # the whole input in the first window: rendered as a file
+            sys.stdin = io.TextIOWrapper(open(filename, 'rb'))
+            ColorCat().read_stdin('title')
+            piped = capsys.readouterr().out
+            ColorCat().print_stream([data], 'title')
+            assert piped == capsys.readouterr().out
+
+            # bigger than the window: written as the lines arrive
+            Configuration.window = 3
+            sys.stdin = io.TextIOWrapper(open(filename, 'rb'))
+            ColorCat().read_stdin('title')
+            rows = ColorCat.escape_ansi(capsys.readouterr().out).split('\n')[2:]
+            assert [r.split(':')[0].strip() for r in rows[:8]] == [str(i) for i in range(1, 9)]
+    finally:
+        sys.stdin.close()
+        sys.stdin = stdin
+
+
+def test_compression(tmp_path):
+    import bz2
+    import gzip
+    import lzma
+    from ccat.compression import Compression
+    from ccat.jsonlines import JsonLines
+
+    data = b''.join(b'line %d\n' % i for i in range(1000))
+    files = {
+        'gzip': gzip.compress(data[:3000]) + gzip.compress(data[3000:]),
+        'bzip2': bz2.compress(data),
+        'xz': lzma.compress(data),
+    }
+    for compression, compressed in files.items():
+        filename = tmp_path / ('app.log.' + compression)
+        filename.write_bytes(compressed)
+        with open(filename, 'rb') as f:
+            assert Compression.detect(f) == compression
+            assert f.tell() == 0
+            # concatenated streams, chunks of at most chunk_size bytes
+            chunks = list(Compression.read(f, compression, chunk_size=100))
+        assert b''.join(chunks) == data
+        assert max(len(c) for c in chunks) <= 100
+        assert Configuration.count_file_lines(str(filename)) == 1001
+
+    assert Compression.detect_file(__file__) is None
+    assert Compression.inner_name('app.log.gz') == 'app.log'
+    assert Compression.inner_name('app.log') == 'app.log'
+    assert JsonLines.sniff([], 'records.jsonl.xz')
+
+    # truncated file: the decompressed lines, then EOFError unless not strict
+    filename = tmp_path / 'truncated.gz'
+    filename.write_bytes(files['gzip'][:len(files['gzip']) // 4])
+    with open(filename, 'rb') as f:
+        assert b''.join(Compression.read(f, 'gzip', strict=False)).startswith(b'line 0\nline 1\n')
+        f.seek(0)
+        try:
+            list(Compression.read(f, 'gzip'))
+            assert False
+        except EOFError:
+            pass
+
+
+def test_head_tail(tmp_path):
+    import io
+    from pygments.lexers import get_lexer_by_name
+    from ccat.stream import Stream
+
+    data = b'\r\n\n' + b''.join(b'x = %d\r\n' % i for i in range(500)) + b'\n\n'
+    for chunk_size in (1, 7, 4096):
+        assert Stream.last_lines(io.BytesIO(data), 3, chunk_size) == (data.index(b'x = 497'), len(data) - 4)
+        assert Stream.last_lines(io.BytesIO(data), 1000, chunk_size) == (0, len(data) - 4)
+    assert Stream.count_lines(io.BytesIO(data), end=data.index(b'x = 1\r')) == 4
+
+    filename = tmp_path / 'sample.py'
+    filename.write_bytes(data)
+
+    def _render(**kwargs):
+        with config(window=50, context=20, no_tab=True, simple=False, cache=False, **kwargs):
+            o = ColorCat()
+            o.lexer = get_lexer_by_name('python')
+            with open(filename, 'rb') as f:
+                source = o.seek_lines(f)
+                if source is not None:
+                    return list(o.render_lines(source[0], 'title', source[1]))
+            return list(o.render([data], 'title', lambda: data.count(b'\n') + 1))
+
+    # the last lines, read from the end of the file, as the ones selected by --lines
+    tail = _render(tail=3)
+    assert ColorCat.escape_ansi(tail[-1]).split(':')[0].strip() == '500'
+    assert tail == [l for l in _render(lines=[(498, 0)]) if '...' not in ColorCat.escape_ansi(l)]
+
+    head = [ColorCat.escape_ansi(l) for l in _render(head=2)]
+    assert [l.split(':')[0].strip() for l in head[1:]] == ['1', '2']
+
+
+@pytest.mark.skipif(not Client.supported(), reason='the daemon needs Unix sockets and fork')
+def test_daemon(tmp_path):
+    import os
+    import socket as sockets
+    import subprocess
+    import time
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, XDG_RUNTIME_DIR=str(tmp_path), COLUMNS='100')
+    client = [sys.executable, '-c', 'from ccat.client import run; run()']
+    # exit code 99 when there is no daemon
+    forward = [sys.executable, '-c', 'import sys; from ccat.client import Client; '
+               'code = Client.forward(sys.argv[1:]); sys.exit(99 if code is None else code)']
+    filename = tmp_path / 'sample.py'
+    filename.write_text(''.join('x = %d\n' % i for i in range(50)))
+
+    def _run(cmd, *args):
+        return subprocess.run(cmd + list(args), cwd=str(tmp_path), env=dict(env, PYTHONPATH=root),
+                              stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+
+    # no daemon: rendered by the client itself
+    expected = _run([sys.executable, '-m', 'ccat'], 'sample.py', '-l', '5:9')
+    assert _run(client, 'sample.py', '-l', '5:9').stdout == expected.stdout
+    assert _run(forward, 'sample.py').returncode == 99
+
+    daemon = subprocess.Popen([sys.executable, '-m', 'ccat', '--daemon'], cwd=root, env=env,
+                              stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        socket = tmp_path / ('ccat-%d.sock' % os.getuid())
+        for _ in range(200):
+            if socket.exists():
+                break
+            time.sleep(0.1)
+        assert socket.exists()
+
+        # rendered by the daemon in the directory of the client, to its output
+        p = _run(forward, 'sample.py', '-l', '5:9')
+        assert p.returncode == 0
+        assert p.stdout == expected.stdout
+        assert _run(forward, 'missing.py').returncode == 1
+
+        # the daemon socket is owned by the user running the client
+        with sockets.socket(sockets.AF_UNIX, sockets.SOCK_STREAM) as sock:
+            sock.connect(str(socket))
+            assert Client.owner(sock, str(socket)) == os.getuid()
+    finally:
+        daemon.terminate()
+        daemon.wait(10)
+    assert not socket.exists()
+
+
+def test_render_api():
+    from concurrent.futures import ThreadPoolExecutor
+    from pygments.lexers import get_lexer_by_name
+    from ccat.ccat import render
+    from ccat.config import Options
+
+    data = ''.join('def f%d(x):\n    return """%d\n    """\n' % (i, i) for i in range(300))
+
+    def _expected(**kwargs):
+        with config(cache=False, **kwargs):
+            o = ColorCat()
+            o.lexer = get_lexer_by_name('python')
+            return ''.join('%s\n' % l for l in o.render([data.encode()], 'title', lambda chars=None: 900))
+
+    cases = [dict(simple=True), dict(no_tab=True, lines=[(10, 20), (500, 0)]),
+             dict(lines=[(1, 30)], highlight_lines=[(5, 9)]), dict(window=50, context=10, tail=7)]
+    options = [Options(lexer='python', columns=100, **c) for c in cases]
+    expected = [_expected(columns=100, **c) for c in cases]
+
+    # the same output from concurrent calls, Configuration untouched
+    before = Configuration.snapshot()
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(executor.map(lambda i: render(data, options=options[i % 4], title='title'), range(16)))
+    assert results == expected * 4
+    assert Configuration.snapshot() == before
+
+    assert list(render(data, options=options[0], stream=True)) == expected[0].split('\n')[:-1]
+    assert render('\n  \n') == ''
+    assert render('{"a": [1, 2]}', options=Options(simple=True, filename='x.json')).count('\n') == 6
+    try:
+        options[0].simple = False
+        assert False
+    except AttributeError:
+        pass
+    assert options[1].replace(no_tab=False).line_ranges.contains(15)
+
+
+def test_async_render():
+    import asyncio
+    import threading
+    import time
+    from ccat.aio import AsyncRender, render_async, render_stream
+    from ccat.ccat import render
+    from ccat.config import Options
+
+    data = ''.join('x%d = [%d, "%d"]\n' % (i, i, i) for i in range(1000))
+    options = Options(lexer='python', columns=100)
+    expected = render(data, options=options)
+
+    running = []
+    peak = []
+    lock = threading.Lock()
+
+    def _job():
+        with lock:
+            running.append(1)
+            peak.append(len(running))
+        time.sleep(0.02)
+        with lock:
+            running.pop()
+
+    async def _main():
+        assert await render_async(data, options=options) == expected
+
+        chunks = [c async for c in render_stream(data, options=options)]
+        assert len(chunks) > 1 and ''.join(chunks) == expected
+
+        # a consumer leaving early (or cancelled) stops the rendering
+        renderer = AsyncRender(limit=1, lines=10)
+        async for chunk in renderer.stream(data, options=options):
+            assert chunk == ''.join(expected.splitlines(True)[:10])
+            break
+
+        await asyncio.gather(*[renderer.run(_job) for _ in range(4)])
+        assert max(peak) == 1
+
+    asyncio.run(_main())
+
+
+def test_image_pages(tmp_path, capsys):
+    import pytest
+    from ccat.ccat import ImageTooLarge
+    from ccat.images import Canvas, ImageOutput
+
+    out = str(tmp_path / 'out.png')
+    lines = ['\x1b[32mline %d\x1b[0m' % i for i in range(1, 26)]
+    with config(out_file=out, format='png', lines_per_image=10, quiet=True, jobs=1):
+        ColorCat.write(iter(lines))
+    assert capsys.readouterr().out == ''
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['out-0001.png', 'out-0002.png', 'out-0003.png']
+    assert (tmp_path / 'out-0003.png').read_bytes()[:4] == b'\x89PNG'
+    assert ImageOutput.page_name('/a/b.c/out.jpg', 12) == '/a/b.c/out-0012.jpg'
+
+    # height guard
+    assert Canvas.fit(Configuration.max_image_height) > 1000
+    assert Canvas.fit(200) < 5
+    with pytest.raises(ImageTooLarge):
+        ColorCat.image('\n'.join(lines), max_height=200)